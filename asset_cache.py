@@ -0,0 +1,153 @@
+# asset_cache.py - Shared texture cache, sign atlas and pre-decoded image store
+
+"""
+Every image is decoded at most once per run and, across runs, at most once
+per file version:
+
+  1. memory     Textures (and decoded images) are kept by file name, so the
+                twenty buildings of a city share one 'building.jpg'.
+  2. disk       Decoded RGBA pixels are written to .asset_cache/ as .npy
+                files keyed by the source's path, size and mtime. Warm
+                starts memory-map those instead of decoding the JPEG again.
+  3. decode     Only on a cold start or after the source file changes.
+
+The small sign images are packed into a single atlas texture; apply_sign()
+points an Entity at its region with texture_offset / texture_scale.
+
+stats counts memory hits, disk hits and decodes so the effect can be checked.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+SIGN_TEXTURES = ('stop_sign.jpg', 'speed_limit.jpg', 'work_in_progress.jpg')
+
+
+class AssetCache:
+    def __init__(self, asset_dir=ASSET_DIR, cache_dir=None, atlas_width=1024, padding=2):
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir or os.path.join(asset_dir, '.asset_cache')
+        self.atlas_width = atlas_width
+        self.padding = padding
+        self._images = {}
+        self._textures = {}
+        self._atlas = None
+        self._regions = {}
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'decodes': 0}
+
+    # -- decoded images ------------------------------------------------
+
+    def _source(self, name):
+        return name if os.path.isabs(name) else os.path.join(self.asset_dir, name)
+
+    def _cache_file(self, path):
+        st = os.stat(path)
+        key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{Path(path).stem}-{digest}.npy")
+
+    def image(self, name):
+        """Decoded RGBA PIL image for an asset file name."""
+        if name in self._images:
+            self.stats['memory_hits'] += 1
+            return self._images[name]
+
+        path = self._source(name)
+        cache_file = self._cache_file(path)
+        if os.path.exists(cache_file):
+            try:
+                pixels = np.load(cache_file, mmap_mode='r')
+                img = Image.fromarray(np.ascontiguousarray(pixels), 'RGBA')
+                self.stats['disk_hits'] += 1
+                self._images[name] = img
+                return img
+            except Exception as e:
+                print(f"Error reading cached image {cache_file}, decoding again: {e}")
+
+        img = Image.open(path).convert('RGBA')
+        self.stats['decodes'] += 1
+        self._images[name] = img
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = cache_file + '.tmp.npy'
+            np.save(tmp, np.asarray(img))
+            os.replace(tmp, cache_file)
+        except Exception as e:
+            print(f"Error writing image cache {cache_file}: {e}")
+        return img
+
+    # -- textures ------------------------------------------------------
+
+    def texture(self, name):
+        """Shared Ursina Texture for an asset; decoded once per run."""
+        if name in self._textures:
+            self.stats['memory_hits'] += 1
+            return self._textures[name]
+        texture = _make_texture(self.image(name), name)
+        self._textures[name] = texture
+        return texture
+
+    def preload(self, names=SIGN_TEXTURES + ('building.jpg',)):
+        """Decode (or fetch from disk) the given assets and build the sign atlas."""
+        for name in names:
+            if name not in SIGN_TEXTURES:
+                self.texture(name)
+        self.atlas()
+
+    # -- sign atlas ----------------------------------------------------
+
+    def atlas(self, names=SIGN_TEXTURES):
+        """Pack the sign images into one texture; returns it (built once)."""
+        if self._atlas is not None:
+            return self._atlas
+        images = {n: self.image(n) for n in names}
+        pad = self.padding
+
+        # Shelf packing, tallest first.
+        placements, x, y, shelf_h, width = {}, pad, pad, 0, pad
+        for n in sorted(images, key=lambda n: -images[n].height):
+            w, h = images[n].size
+            if x + w + pad > self.atlas_width and x > pad:
+                x, y, shelf_h = pad, y + shelf_h + pad, 0
+            placements[n] = (x, y, w, h)
+            x += w + pad
+            shelf_h = max(shelf_h, h)
+            width = max(width, x)
+        height = y + shelf_h + pad
+
+        sheet = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        for n, (px, py, w, h) in placements.items():
+            sheet.paste(images[n], (px, py))
+            # UVs have their origin at the bottom-left corner.
+            self._regions[n] = ((px / width, 1 - (py + h) / height), (w / width, h / height))
+
+        self._atlas = _make_texture(sheet, 'sign_atlas.png')
+        return self._atlas
+
+    def region(self, name):
+        """(offset, scale) of a sign inside the atlas, in UV units."""
+        self.atlas()
+        return self._regions[name]
+
+    def apply_sign(self, entity, name):
+        """Texture an Entity with one sign image from the shared atlas."""
+        offset, scale = self.region(name)
+        entity.texture = self.atlas()
+        entity.texture_scale = scale
+        entity.texture_offset = offset
+        return entity
+
+
+def _make_texture(image, name):
+    from ursina import Texture
+    texture = Texture(image)
+    texture.path = Path(name)   # so texture.name stays the asset name
+    return texture
+
+
+assets = AssetCache()
@@ -0,0 +1,273 @@
+# batch_runner.py - Run many headless driving scenarios across all cores
+
+"""
+Evaluates scripted driving scenarios with the headless DrivingSimulation,
+one scenario per task on a multiprocessing pool, and writes aggregate
+results: score trajectories, violations per rule (simulation.RULES) and
+seconds spent inside each kind of rule zone.
+
+    python batch_runner.py scenarios.json --out results.json [--workers N]
+                           [--compare old_results.json]
+
+A scenario file is {"defaults": {...}, "scenarios": [{...}, ...]}; each
+scenario is merged over the defaults. Keys:
+
+  name          label used in the results
+  grid_size     fixed CityLayout size (default 4), or
+  city_seed     seed of a chunk-streamed city (CityGenerator) instead
+  npc_count, npc_seed, initial_score
+                passed to DrivingSimulation (NPCs need a fixed city)
+  signals       {"plan": "two_phase" | "standard", "green": s, "amber": s,
+                 "all_red": s, "offsets": [s, ...]} or {"phases": [[s, [colours]], ...]}
+  duration      simulated seconds (default 60); hz is the tick rate (default 60)
+  inputs        scripted controls: [[seconds, ["w", "a", "s", "d", "space"]], ...];
+                after the last segment the car coasts
+  policy        instead of inputs: one of POLICIES, with policy_seed for "random"
+  sample_every  seconds between score trajectory samples (default 1)
+
+--compare lists the scenarios whose final score or violations differ from
+an earlier results file (or that error in only one of the two), e.g. to
+regression-test a rule change. The exit status is 1 if any scenario
+errored or, with --compare, changed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from simulation import CityLayout, DrivingSimulation, Controls, RULES, SPEED_LIMIT_KMH
+from traffic_signals import PhasePlan, RED, AMBER
+from city_streaming import CityGenerator, StreamedCity
+
+DEFAULTS = {'grid_size': 4, 'duration': 60.0, 'hz': 60, 'sample_every': 1.0, 'policy': 'cruise'}
+
+# ---------------------------------------------------------------------
+# POLICIES
+# ---------------------------------------------------------------------
+# A policy maps (sim, memo) to this tick's Controls; memo is a dict the
+# policy may keep state in, holding a seeded random.Random under 'rng'.
+
+def idle_policy(sim, memo):
+    return Controls()
+
+
+def cruise_policy(sim, memo, target_kmh=SPEED_LIMIT_KMH - 5):
+    """Drive straight ahead, braking above target_kmh."""
+    fast = sim.car.speed_kmh > target_kmh
+    return Controls(forward=not fast, brake=fast)
+
+
+def lawful_policy(sim, memo):
+    """Cruise below the speed limit and stop for red or amber lights in view."""
+    zone = sim.zone_tracker.first('light')
+    if zone is not None and sim.signals.color(zone.target) in (RED, AMBER):
+        return Controls(brake=True)
+    return cruise_policy(sim, memo)
+
+
+def random_policy(sim, memo, hold=1.0):
+    """Random key combinations from memo['rng'], each held for `hold` seconds."""
+    if sim.time >= memo.get('next_change', 0.0):
+        memo['controls'] = Controls.from_bits(memo['rng'].randrange(32))
+        memo['next_change'] = sim.time + hold
+    return memo['controls']
+
+
+POLICIES = {'idle': idle_policy, 'cruise': cruise_policy,
+            'lawful': lawful_policy, 'random': random_policy}
+
+# ---------------------------------------------------------------------
+# SCENARIOS
+# ---------------------------------------------------------------------
+
+def build_signal_plan(spec):
+    """(PhasePlan or None, offsets or None) for a scenario's "signals" entry."""
+    if not spec:
+        return None, None
+    if 'phases' in spec:
+        plan = PhasePlan(spec['phases'])
+    elif spec.get('plan', 'two_phase') == 'standard':
+        plan = PhasePlan.standard(spec.get('green', 20), spec.get('amber', 3), spec.get('all_red', 1))
+    else:
+        plan = PhasePlan.two_phase(spec.get('green', 20))
+    return plan, spec.get('offsets')
+
+
+def scripted_controls(inputs):
+    """Per-segment (end_time, Controls) pairs for a scenario's "inputs"."""
+    segments, end = [], 0.0
+    for seconds, keys in inputs:
+        end += seconds
+        held = set(keys)
+        segments.append((end, Controls.from_keys({k: k in held for k in ('w', 'a', 's', 'd', 'space')})))
+    return segments
+
+
+def run_scenario(spec):
+    """Run one scenario (already merged with the defaults); returns its result dict."""
+    started = time.perf_counter()
+    plan, offsets = build_signal_plan(spec.get('signals'))
+    streamed = spec.get('city_seed') is not None
+    if streamed:
+        layout = StreamedCity(CityGenerator(spec['city_seed']))
+    else:
+        layout = CityLayout(spec['grid_size'])
+    sim = DrivingSimulation(layout, initial_score=spec.get('initial_score', 100),
+                            signal_plan=plan, signal_offsets=offsets,
+                            npc_count=0 if streamed else spec.get('npc_count', 0),
+                            npc_seed=spec.get('npc_seed', 0))
+    if streamed:
+        layout.attach(sim)
+        layout.update(sim.car.x, sim.car.z, wait=True)
+
+    segments = scripted_controls(spec['inputs']) if spec.get('inputs') else None
+    policy = POLICIES[spec['policy']]
+    memo = {'rng': random.Random(spec.get('policy_seed', 0))}     # per-run policy state
+
+    dt = 1.0 / spec['hz']
+    ticks = int(round(spec['duration'] * spec['hz']))
+    sample_ticks = max(int(round(spec['sample_every'] * spec['hz'])), 1)
+    zone_time = {}
+    trajectory = [(0.0, sim.score)]
+    segment, coast = 0, Controls()
+    for tick in range(ticks):
+        if segments is not None:
+            while segment < len(segments) and sim.time >= segments[segment][0]:
+                segment += 1
+            controls = segments[segment][1] if segment < len(segments) else coast
+        else:
+            controls = policy(sim, memo)
+        sim.step(controls, dt)
+        if streamed:
+            layout.update(sim.car.x, sim.car.z, wait=True)
+        for kind in {zone.kind for zone in sim.zone_tracker.active}:
+            zone_time[kind] = zone_time.get(kind, 0.0) + dt
+        if (tick + 1) % sample_ticks == 0:
+            trajectory.append((round(sim.time, 6), sim.score))
+
+    return {
+        'name': spec.get('name', ''),
+        'final_score': sim.score,
+        'violations': sim.violations,
+        'zone_time': {kind: round(t, 6) for kind, t in sorted(zone_time.items())},
+        'trajectory': trajectory,
+        'ticks': ticks,
+        'wall_seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def _run_indexed(item):
+    index, spec = item
+    try:
+        return index, run_scenario(spec)
+    except Exception as e:      # one broken scenario should not sink the batch
+        return index, {'name': spec.get('name', ''), 'error': f"{type(e).__name__}: {e}"}
+
+
+def load_scenarios(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {'scenarios': data}
+    defaults = dict(DEFAULTS, **data.get('defaults', {}))
+    scenarios = []
+    for i, scenario in enumerate(data['scenarios']):
+        spec = dict(defaults, **scenario)
+        spec.setdefault('name', f"scenario-{i}")
+        if spec['policy'] not in POLICIES:
+            raise ValueError(f"{spec['name']}: unknown policy {spec['policy']!r}")
+        scenarios.append(spec)
+    return scenarios
+
+
+def run_batch(scenarios, workers=None):
+    """Results in scenario order, computed on a pool of `workers` processes."""
+    results = [None] * len(scenarios)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for index, spec in enumerate(scenarios):
+            results[index] = _run_indexed((index, spec))[1]
+        return results
+    with multiprocessing.Pool(workers) as pool:
+        for index, result in pool.imap_unordered(_run_indexed, enumerate(scenarios)):
+            results[index] = result
+    return results
+
+
+def summarize(results):
+    ok = [r for r in results if 'error' not in r]
+    scores = [r['final_score'] for r in ok]
+    zone_time = {}
+    for r in ok:
+        for kind, t in r['zone_time'].items():
+            zone_time[kind] = zone_time.get(kind, 0.0) + t
+    return {
+        'scenarios': len(results),
+        'failed': len(results) - len(ok),
+        'mean_score': sum(scores) / len(scores) if scores else None,
+        'min_score': min(scores, default=None),
+        'max_score': max(scores, default=None),
+        'violations': {rule: sum(r['violations'][rule] for r in ok) for rule in RULES},
+        'zone_time': {kind: round(t, 6) for kind, t in sorted(zone_time.items())},
+    }
+
+
+def compare(results, baseline):
+    """
+    (name, old, new) of scenarios whose final score or violations differ
+    from a baseline run; a scenario that errors in one run and not the
+    other counts as changed, with 'ERROR' for its score there.
+    """
+    before = {r['name']: r for r in baseline['results']}
+    changed = []
+    for r in results:
+        old = before.get(r['name'])
+        if old is None or ('error' in r and 'error' in old):
+            continue
+        if 'error' in r or 'error' in old:
+            changed.append((r['name'], 'ERROR' if 'error' in old else old['final_score'],
+                            'ERROR' if 'error' in r else r['final_score']))
+        elif old['final_score'] != r['final_score'] or old['violations'] != r['violations']:
+            changed.append((r['name'], old['final_score'], r['final_score']))
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless driving scenarios in parallel.")
+    parser.add_argument('scenarios', help="scenario JSON file")
+    parser.add_argument('--out', help="write full results (with trajectories) here")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument('--compare', help="earlier results file to diff final scores against")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    started = time.perf_counter()
+    results = run_batch(scenarios, args.workers)
+    summary = summarize(results)
+    summary['wall_seconds'] = round(time.perf_counter() - started, 3)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'summary': summary, 'results': results}, f, indent=1)
+    for r in results:
+        if 'error' in r:
+            print(f"{r['name']}: ERROR {r['error']}")
+    print(json.dumps(summary, indent=1))
+
+    changed = []
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            changed = compare(results, json.load(f))
+        for name, old, new in changed:
+            print(f"changed: {name} {old} -> {new}")
+        print(f"{len(changed)} of {len(results)} scenarios changed")
+    if changed or summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
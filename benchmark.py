@@ -0,0 +1,336 @@
+# benchmark.py - Headless benchmarks for the game hot paths
+
+"""
+Times the per-frame and start-up paths of both games without a window:
+pygame runs on SDL's dummy video / audio drivers and Ursina, if it is
+installed, in its offscreen window mode. Cases whose dependency is missing
+(or fails to start) are reported as skipped rather than failing the run.
+
+    python benchmark.py --out bench.json                  # record
+    python benchmark.py --baseline bench.json [--threshold 0.15]
+
+Each case is run in repeats of enough calls to last about --min-time
+seconds; the per-call median, minimum and spread are stored as JSON.
+With --baseline, cases whose median got slower by more than threshold
+(a fraction) are listed and the exit status is 1.
+
+Cases:
+
+  road.is_on_road[roads=N]        linear scan over N roads, per point
+  road.index_contains[roads=N]    DrivableAreaIndex.contains, per point
+  road.contains_point[ursina]     RoadSegment.contains_point, per call
+  sim.rule_tick[npcs=N]           one DrivingSimulation.step (physics + rules)
+  city.build[grid=G]              CityLayout + DrivingSimulation construction
+  city.create_entities[grid=G]    main.create_city (Ursina Entities), grid <= 8
+  pedestrian.frame[cars=N]        one PedestrianGame update + draw (full-screen SceneRenderer), no NPCs
+  pedestrian.crowd[npcs=N]        one Crowd update with 20 cars on the road, plus drawing the NPCs
+  pedestrian.games[envs=N]        one update of each of N separate PedestrianGame objects
+  pedestrian.vec_env[envs=N]      one CrossingVecEnv.step of N batched environments
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from simulation import CityLayout, DrivingSimulation, Controls, is_on_road
+
+GRID_SIZES = (2, 4, 8, 16)
+NPC_COUNTS = (0, 300)
+PEDESTRIAN_CARS = (5, 50, 500)
+CROWD_SIZES = (100, 500)
+BATCH_ENVS = 1024
+DEFAULT_THRESHOLD = 0.15
+
+
+class Skip(Exception):
+    """Raised by a case setup when it cannot run here."""
+
+
+def measure(fn, min_time=0.2, repeats=5):
+    """Per-call seconds of fn() over `repeats` batches, each about min_time / repeats long."""
+    loops, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeats or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / repeats / elapsed) + 1))
+    samples = [elapsed / loops]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return {
+        'median_us': statistics.median(samples) * 1e6,
+        'min_us': min(samples) * 1e6,
+        'stdev_us': statistics.stdev(samples) * 1e6 if len(samples) > 1 else 0.0,
+        'loops': loops,
+        'repeats': repeats,
+    }
+
+# ---------------------------------------------------------------------
+# CASES
+# ---------------------------------------------------------------------
+# Each case factory does its setup and returns the zero-argument callable
+# to time, or raises Skip.
+
+def _points(layout, n=1000, seed=0):
+    rng = random.Random(seed)
+    lo = layout.offset - layout.road_width
+    hi = layout.offset + layout.grid_size * layout.cell_spacing + layout.road_width
+    return [(rng.uniform(lo, hi), rng.uniform(lo, hi)) for _ in range(n)]
+
+
+def case_is_on_road(grid):
+    layout = CityLayout(grid)
+    points, roads = _points(layout), layout.roads
+    it = iter(range(1 << 62))
+
+    def run():
+        x, z = points[next(it) % len(points)]
+        is_on_road(x, z, roads)
+    return run
+
+
+def case_index_contains(grid):
+    layout = CityLayout(grid)
+    points, index = _points(layout), layout.road_index
+    it = iter(range(1 << 62))
+
+    def run():
+        x, z = points[next(it) % len(points)]
+        index.contains(x, z)
+    return run
+
+
+_ursina = None
+
+def _ursina_app():
+    """Start (once) an offscreen Ursina app; Skip if Ursina is unavailable."""
+    global _ursina
+    if _ursina is None:
+        try:
+            import ursina
+            ursina.Ursina(window_type='offscreen', development_mode=False)
+            _ursina = ursina
+        except Exception as e:
+            _ursina = e
+    if isinstance(_ursina, Exception):
+        raise Skip(f"Ursina unavailable: {_ursina}")
+    return _ursina
+
+
+def case_contains_point():
+    ursina = _ursina_app()
+    from roads import RoadSegment
+    road = RoadSegment(center=(0, 0), size=(10, 100))
+    pos = ursina.Vec3(3, 0, 20)
+    return lambda: road.contains_point(pos)
+
+
+def case_rule_tick(npcs):
+    sim = DrivingSimulation(CityLayout(8), npc_count=npcs)
+    controls = Controls(forward=True)
+
+    def run():
+        sim.step(controls, 1 / 60)
+        if sim.car.speed == 0:          # stopped at a kerb: start over
+            sim.car.x, sim.car.y, sim.car.z, sim.car.rotation_y = sim.layout.car_start
+    return run
+
+
+def case_city_build(grid):
+    return lambda: DrivingSimulation(CityLayout(grid))
+
+
+def case_create_entities(grid):
+    ursina = _ursina_app()
+    import main
+
+    def run():
+        layout = CityLayout(grid)
+        main.create_city(layout, DrivingSimulation(layout))
+        for entity in list(ursina.scene.entities):
+            if entity.parent is ursina.scene and not entity.eternal:
+                ursina.destroy(entity)
+    try:
+        run()
+    except Exception as e:
+        raise Skip(f"create_city failed: {type(e).__name__}: {e}")
+    return run
+
+
+def case_pedestrian_frame(cars):
+    try:
+        import pedestrain
+    except Exception as e:
+        raise Skip(f"pygame unavailable: {e}")
+    random.seed(0)
+    game = pedestrain.PedestrianGame(crowd_size=0)
+    pool, width = game.cars, pedestrain.CAR_WIDTH
+    for i in range(cars):
+        pool.spawn(x=int(-width + (pedestrain.WIDTH + width) * i / max(cars, 1)))
+    game.spawn_timer = float('inf')          # keep the car count fixed
+    keys = pedestrain.pygame.key.ScancodeWrapper([0] * 512)
+    surface = pedestrain.screen
+    renderer = pedestrain.SceneRenderer(surface)
+
+    def run():
+        pool.x[pool.x + pool.speed >= pedestrain.WIDTH] = -width    # wrap round instead of driving off
+        game.update(keys)
+        renderer.begin()
+        game.draw(surface)
+    return run
+
+
+def case_pedestrian_crowd(npcs):
+    try:
+        import pedestrain
+    except Exception as e:
+        raise Skip(f"pygame unavailable: {e}")
+    random.seed(0)
+    game = pedestrain.PedestrianGame(crowd_size=npcs)
+    for i in range(20):
+        game.cars.spawn(lane=i % 2, x=i * 50)
+    crowd, cars, surface = game.crowd, game.cars.boxes(), pedestrain.screen
+    for tick in range(300):         # let queues form before timing
+        crowd.update(tick % 240 < 120, cars)
+
+    def run():
+        crowd.update(game.signal.green, cars)
+        game.draw_crowd(surface)
+    return run
+
+
+def case_pedestrian_games(envs):
+    try:
+        import pedestrain
+    except Exception as e:
+        raise Skip(f"pygame unavailable: {e}")
+    random.seed(0)
+    games = [pedestrain.PedestrianGame(crowd_size=0) for _ in range(envs)]
+    keys = pedestrain.WALK_KEYS
+
+    def run():
+        for game in games:
+            game.update(keys)
+    return run
+
+
+def case_vec_env(envs):
+    from crossing_env import CrossingVecEnv
+    env = CrossingVecEnv(envs, seed=0)
+    actions = [env.rng.integers(0, 5, envs) for _ in range(64)]
+    it = iter(range(1 << 62))
+    return lambda: env.step(actions[next(it) % len(actions)])
+
+
+def cases():
+    """(name, factory) pairs in run order."""
+    out = []
+    for grid in GRID_SIZES:
+        roads = 2 * (grid + 1)
+        out.append((f'road.is_on_road[roads={roads}]', lambda g=grid: case_is_on_road(g)))
+        out.append((f'road.index_contains[roads={roads}]', lambda g=grid: case_index_contains(g)))
+    out.append(('road.contains_point[ursina]', case_contains_point))
+    for npcs in NPC_COUNTS:
+        out.append((f'sim.rule_tick[npcs={npcs}]', lambda n=npcs: case_rule_tick(n)))
+    for grid in GRID_SIZES:
+        out.append((f'city.build[grid={grid}]', lambda g=grid: case_city_build(g)))
+    for grid in GRID_SIZES[:3]:
+        out.append((f'city.create_entities[grid={grid}]', lambda g=grid: case_create_entities(g)))
+    for n in PEDESTRIAN_CARS:
+        out.append((f'pedestrian.frame[cars={n}]', lambda n=n: case_pedestrian_frame(n)))
+    for n in CROWD_SIZES:
+        out.append((f'pedestrian.crowd[npcs={n}]', lambda n=n: case_pedestrian_crowd(n)))
+    out.append((f'pedestrian.games[envs={BATCH_ENVS}]', lambda: case_pedestrian_games(BATCH_ENVS)))
+    out.append((f'pedestrian.vec_env[envs={BATCH_ENVS}]', lambda: case_vec_env(BATCH_ENVS)))
+    return out
+
+# ---------------------------------------------------------------------
+# RUN / COMPARE
+# ---------------------------------------------------------------------
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_all(pattern=None, min_time=0.2, repeats=5, log=print):
+    results = {}
+    for name, factory in cases():
+        if pattern and pattern not in name:
+            continue
+        try:
+            fn = factory()
+        except Skip as e:
+            results[name] = {'skipped': str(e)}
+            log(f"{name:40s} skipped ({e})")
+            continue
+        results[name] = measure(fn, min_time, repeats)
+        log(f"{name:40s} {results[name]['median_us']:12.2f} us")
+    return {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'machine': platform.machine(), 'commit': _commit(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """[(name, old_us, new_us, ratio)] for cases slower than baseline by more than threshold."""
+    slower = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old or 'median_us' not in old or 'median_us' not in new:
+            continue
+        ratio = new['median_us'] / old['median_us']
+        if ratio > 1 + threshold:
+            slower.append((name, old['median_us'], new['median_us'], ratio))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the game hot paths.")
+    parser.add_argument('--out', help="write results JSON here")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown as a fraction (default %(default)s)")
+    parser.add_argument('-k', '--filter', help="only run cases whose name contains this")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per case (default %(default)s)")
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    current = run_all(args.filter, args.min_time, args.repeats)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        slower = compare(current, baseline, args.threshold)
+        for name, old, new, ratio in slower:
+            print(f"REGRESSION {name}: {old:.2f} us -> {new:.2f} us (x{ratio:.2f})")
+        print(f"{len(slower)} regression(s) beyond {args.threshold:.0%}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 # buildings.py - Building components for the city simulation
 
-from ursina import Entity, load_texture
+from ursina import Entity
+from asset_cache import assets
 
 class Building(Entity):
     """
@@ -16,9 +17,9 @@ class Building(Entity):
         base_height = 20
         roof_height = 8
 
-        # Load textures (ensure these files are in your assets folder or adjust the file names)
-        wall_texture = load_texture('building.jpg')
-        roof_texture = load_texture('building.jpg')
+        # Shared textures: decoded once, however many buildings there are
+        wall_texture = assets.texture('building.jpg')
+        roof_texture = assets.texture('building.jpg')
 
         # Building walls using the indie wall texture.
         self.walls = Entity(
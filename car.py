@@ -1,7 +1,9 @@
 # car.py - Vehicle components for the driving simulation
 
 from ursina import Entity, Vec3, color, time, held_keys, lerp, clamp, Text
-from constants import OFFSET, CELL_SPACING, ROAD_WIDTH
+from math import sin, cos, radians
+from constants import OFFSET, CELL_SPACING, ROAD_WIDTH, PHYSICS_HZ, MAX_SUBSTEPS
+from fixed_step import FixedTimestep, lerp_pose
 
 class Car(Entity):
     """
@@ -27,6 +29,11 @@ class Car(Entity):
         self.max_speed = 5
         self.turn_speed = 100  # gentler turning
 
+        # Physics state; the Entity's transform is only the interpolated view of it.
+        self.clock = FixedTimestep(PHYSICS_HZ, MAX_SUBSTEPS)
+        self.pose = (self.x, self.y, self.z, self.rotation_y)
+        self.previous_pose = self.pose
+
         self.create_wheels()
         
         # Create speedometer UI
@@ -65,7 +72,19 @@ class Car(Entity):
             )
 
     def update(self):
-        dt = time.dt
+        # Physics runs at a fixed rate; the Entity shows a blend of the last two states.
+        alpha = self.clock.advance(time.dt, self.physics_step)
+        x, y, z, rotation_y = lerp_pose(self.previous_pose, self.pose, alpha)
+        self.position = Vec3(x, y, z)
+        self.rotation_y = rotation_y
+
+        # Update speedometer (convert game speed to km/h for display)
+        speed_kmh = abs(round(self.speed * 12))  # Adjusted conversion factor: max speed (5) * 12 = 60 km/h
+        self.speedometer.text = f"Speed: {speed_kmh} km/h"
+
+    def physics_step(self, dt):
+        """Advance speed, steering and position by one fixed step of dt seconds."""
+        self.previous_pose = self.pose
 
         # Forward/back
         if held_keys['w']:
@@ -82,10 +101,6 @@ class Car(Entity):
 
         # Clamp speed
         self.speed = clamp(self.speed, -self.max_speed/2, self.max_speed)
-        
-        # Update speedometer (convert game speed to km/h for display)
-        speed_kmh = abs(round(self.speed * 12))  # Adjusted conversion factor: max speed (5) * 12 = 60 km/h
-        self.speedometer.text = f"Speed: {speed_kmh} km/h"
 
         # Steering
         direction = 0
@@ -94,15 +109,18 @@ class Car(Entity):
         elif held_keys['d']:
             direction = 1
         turn_amount = direction * self.turn_speed * dt * (abs(self.speed)/self.max_speed)
-        self.rotation_y += turn_amount
+        x, y, z, rotation_y = self.pose
+        rotation_y += turn_amount
 
-        # Move
-        displacement = self.forward * self.speed * dt
-        new_pos = self.position + displacement
+        # Move (Entity.forward includes the car's length, hence scale_z)
+        r = radians(rotation_y)
+        stride = self.speed * dt * self.scale_z
+        new_pos = Vec3(x + sin(r) * stride, y, z + cos(r) * stride)
 
         # Only move if on road
         from utilities import is_on_road
         if is_on_road(new_pos, self.roads):
-            self.position = new_pos
+            x, z = new_pos.x, new_pos.z
         else:
-            self.speed = 0 
\ No newline at end of file
+            self.speed = 0
+        self.pose = (x, y, z, rotation_y)
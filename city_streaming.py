@@ -0,0 +1,323 @@
+# city_streaming.py - Chunked procedural city, streamed around the player
+
+"""
+An effectively unbounded city built from square chunks of N x N blocks.
+
+Roads follow one global grid (a centre line every cell_spacing units in
+both directions), so chunks always join up. Everything else in a chunk
+(building sizes, empty lots, stop and speed-limit signs) is drawn from a
+random.Random seeded by (seed, chunk x, chunk z): the same seed always
+produces the same city, whichever order chunks are visited in.
+
+StreamedCity keeps the chunks around the car loaded. Chunk data, including
+its DrivableAreaIndex, is generated on a background thread; poll() applies
+finished chunks on the main thread, registers their sign zones and
+building / sign colliders with the simulation, and hands them to a ChunkRenderer, which draws them with
+Entities taken from pre-warmed pools so the frame loop allocates nothing.
+Chunks beyond keep_radius are unloaded and their Entities returned.
+
+StreamedCity also stands in for a CityLayout, so a DrivingSimulation can
+drive on it directly. If the car outruns the worker, on-road tests in a
+chunk that has not arrived yet use the global road grid, which every
+chunk's roads follow, rather than building the chunk (and its distance
+field) inside the simulation tick.
+
+Nothing here imports Ursina; the renderer is given Entity factories.
+"""
+
+import queue
+import random
+import threading
+from math import floor
+
+from constants import BLOCK_SIZE, ROAD_WIDTH
+from road_index import DrivableAreaIndex
+from simulation import RoadRect, Placement, CAR_HEIGHT, RULE_RADIUS, add_static_colliders
+from trigger_zones import TriggerZone
+
+# ---------------------------------------------------------------------
+# GENERATION
+# ---------------------------------------------------------------------
+
+class ChunkData:
+    """Plain data for one chunk; safe to build off the main thread."""
+    __slots__ = ('key', 'roads', 'road_tiles', 'buildings', 'signs', 'road_index')
+
+    def __init__(self, key, roads, road_tiles, buildings, signs):
+        self.key = key
+        self.roads = roads              # RoadRects covering the chunk (for queries)
+        self.road_tiles = road_tiles    # RoadRects this chunk draws
+        self.buildings = buildings      # (x, z, width, height)
+        self.signs = signs              # Placements
+        self.road_index = DrivableAreaIndex(roads)
+
+
+class CityGenerator:
+    def __init__(self, seed=0, chunk_blocks=4, block_size=BLOCK_SIZE, road_width=ROAD_WIDTH,
+                 empty_lot_chance=0.15, stop_sign_chance=0.1, speed_sign_chance=0.05):
+        self.seed = seed
+        self.chunk_blocks = chunk_blocks
+        self.road_width = road_width
+        self.cell_spacing = block_size + road_width
+        self.chunk_size = chunk_blocks * self.cell_spacing
+        self.empty_lot_chance = empty_lot_chance
+        self.stop_sign_chance = stop_sign_chance
+        self.speed_sign_chance = speed_sign_chance
+
+    def chunk_key(self, x, z):
+        return (int(floor(x / self.chunk_size)), int(floor(z / self.chunk_size)))
+
+    def _rng(self, key):
+        cx, cz = key
+        mixed = (self.seed * 0x9E3779B1) ^ (cx * 73856093) ^ (cz * 19349663)
+        return random.Random(mixed & 0xFFFFFFFFFFFF)
+
+    def generate(self, key):
+        rng = self._rng(key)
+        n, spacing, width, size = self.chunk_blocks, self.cell_spacing, self.road_width, self.chunk_size
+        ox, oz = key[0] * size, key[1] * size
+
+        # Roads on the chunk's own grid lines, plus the far edge for queries.
+        roads, tiles = [], []
+        for i in range(n + 1):
+            vertical = RoadRect(center=(ox + i * spacing, oz + size / 2), size=(width, size))
+            horizontal = RoadRect(center=(ox + size / 2, oz + i * spacing), size=(size, width))
+            roads += [vertical, horizontal]
+            if i < n:
+                tiles += [vertical, horizontal]
+
+        buildings, signs = [], []
+        for i in range(n):
+            for j in range(n):
+                if rng.random() >= self.empty_lot_chance:
+                    buildings.append((ox + (i + 0.5) * spacing, oz + (j + 0.5) * spacing,
+                                      rng.uniform(12, 16), rng.uniform(14, 32)))
+                ix, iz = ox + i * spacing, oz + j * spacing
+                corner = (ix + width * 0.5 + 1, 0, iz + width * 0.5 + 1)
+                roll = rng.random()
+                if roll < self.stop_sign_chance:
+                    signs.append(Placement('stop', corner, rotation_y=rng.choice((0, 90, 180, 270))))
+                elif roll < self.stop_sign_chance + self.speed_sign_chance:
+                    signs.append(Placement('speed_limit', corner))
+        return ChunkData(key, roads, tiles, buildings, signs)
+
+# ---------------------------------------------------------------------
+# STREAMING
+# ---------------------------------------------------------------------
+
+class StreamedCity:
+    """
+    radius: chunks within this Chebyshev distance of the car are loaded
+    keep_radius: loaded chunks are only dropped beyond this distance
+    renderer: optional ChunkRenderer
+    """
+    def __init__(self, generator, radius=1, keep_radius=2, renderer=None):
+        self.generator = generator
+        self.radius = radius
+        self.keep_radius = max(keep_radius, radius)
+        self.renderer = renderer
+        self._chunks = {}       # key -> ChunkData, loaded (main thread only)
+        self._zones = {}        # key -> [TriggerZone]
+        self._colliders = {}    # key -> [static collider id]
+        self._pending = set()
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._worker = None
+        self.zone_index = None
+        self.collisions = None
+
+        # CityLayout interface used by DrivingSimulation.
+        self.cell_spacing = generator.cell_spacing
+        self.road_width = generator.road_width
+        self.road_index = self
+        self.speed_limit_signs, self.stop_signs = [], []
+        self.traffic_lights, self.intersections = [], []
+
+    @property
+    def car_start(self):
+        return (self.cell_spacing, CAR_HEIGHT, self.road_width * 0.35, 90)
+
+    def attach(self, sim):
+        """Register sign zones and colliders of loaded (and future) chunks with a simulation."""
+        self.zone_index = sim.zones
+        self.collisions = sim.collisions
+        for chunk in self._chunks.values():
+            self._register_zones(chunk)
+
+    # -- background generation -----------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='chunk-generator', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            key = self._requests.get()
+            if key is None:
+                return
+            self._results.put(self.generator.generate(key))
+
+    def close(self):
+        if self._worker is not None:
+            self._requests.put(None)
+            self._worker.join()
+            self._worker = None
+
+    # -- per-frame -----------------------------------------------------
+
+    def update(self, x, z, wait=False):
+        """
+        Request the chunks around (x, z) and unload far ones. With wait=True
+        the missing chunks are generated inline (deterministic offline runs).
+        """
+        cx, cz = self.generator.chunk_key(x, z)
+        r = self.radius
+        for i in range(cx - r, cx + r + 1):
+            for j in range(cz - r, cz + r + 1):
+                key = (i, j)
+                if key in self._chunks or key in self._pending:
+                    continue
+                if wait:
+                    self._load(self.generator.generate(key))
+                else:
+                    self._pending.add(key)
+                    self._ensure_worker()
+                    self._requests.put(key)
+
+        k = self.keep_radius
+        for key in [key for key in self._chunks
+                    if abs(key[0] - cx) > k or abs(key[1] - cz) > k]:
+            self._unload(key)
+
+    def poll(self, max_chunks=1):
+        """Apply up to max_chunks finished chunks; returns how many were applied."""
+        applied = 0
+        while applied < max_chunks:
+            try:
+                chunk = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(chunk.key)
+            if chunk.key not in self._chunks:
+                self._load(chunk)
+                applied += 1
+        return applied
+
+    def _load(self, chunk):
+        self._chunks[chunk.key] = chunk
+        self._register_zones(chunk)
+        if self.renderer:
+            self.renderer.show(chunk)
+
+    def _unload(self, key):
+        self._chunks.pop(key)
+        if self.zone_index is not None:
+            for zone in self._zones.pop(key, ()):
+                self.zone_index.remove(zone)
+        if self.collisions is not None:
+            for sid in self._colliders.pop(key, ()):
+                self.collisions.remove_static(sid)
+        if self.renderer:
+            self.renderer.hide(key)
+
+    def _register_zones(self, chunk):
+        if self.collisions is not None and chunk.key not in self._colliders:
+            self._colliders[chunk.key] = add_static_colliders(self.collisions, chunk.buildings, chunk.signs)
+        if self.zone_index is None or chunk.key in self._zones:
+            return
+        self._zones[chunk.key] = [
+            self.zone_index.add(TriggerZone(sign.kind, sign.position, RULE_RADIUS))
+            for sign in chunk.signs]
+
+    # -- queries -------------------------------------------------------
+
+    def chunk(self, key):
+        """Loaded chunk data, or None while it is still being generated."""
+        return self._chunks.get(key)
+
+    def on_grid(self, x, z):
+        """On-road test against the global road grid alone; needs no chunk."""
+        spacing, half = self.cell_spacing, self.road_width * 0.5
+        return (abs(x - round(x / spacing) * spacing) <= half or
+                abs(z - round(z / spacing) * spacing) <= half)
+
+    def contains(self, x, z):
+        """On-road test anywhere in the unbounded city."""
+        chunk = self._chunks.get(self.generator.chunk_key(x, z))
+        if chunk is None:
+            return self.on_grid(x, z)
+        return chunk.road_index.contains(x, z)
+
+    @property
+    def loaded(self):
+        return sorted(self._chunks)
+
+# ---------------------------------------------------------------------
+# RENDERING
+# ---------------------------------------------------------------------
+
+class EntityPool:
+    """Recycles disabled Entities made by factory() instead of creating new ones."""
+    def __init__(self, factory, prewarm=0):
+        self.factory = factory
+        self._free = []
+        self.created = 0
+        for _ in range(prewarm):
+            self._free.append(self._make())
+
+    def _make(self):
+        entity = self.factory()
+        entity.enabled = False
+        self.created += 1
+        return entity
+
+    def acquire(self):
+        entity = self._free.pop() if self._free else self._make()
+        entity.enabled = True
+        return entity
+
+    def release(self, entity):
+        entity.enabled = False
+        self._free.append(entity)
+
+    @property
+    def free(self):
+        return len(self._free)
+
+
+class ChunkRenderer:
+    """
+    Draws chunks with pooled Entities.
+    pools: {'road': EntityPool, 'building': EntityPool, 'stop': ..., 'speed_limit': ...}
+    Building Entities must expose .walls and .roof children (see main.Building).
+    """
+    def __init__(self, pools):
+        self.pools = pools
+        self._shown = {}    # chunk key -> [(kind, entity)]
+
+    def show(self, chunk):
+        used = []
+        for road in chunk.road_tiles:
+            e = self.pools['road'].acquire()
+            e.position = (road.center[0], 0.02, road.center[1])
+            e.scale = (road.size[0], road.size[1])
+            used.append(('road', e))
+        for x, z, width, height in chunk.buildings:
+            e = self.pools['building'].acquire()
+            e.position = (x, 0, z)
+            e.walls.scale = (width, height, width)
+            e.walls.y = height * 0.5
+            e.roof.scale = (width * 1.2, 8, width * 1.2)
+            e.roof.y = height
+            used.append(('building', e))
+        for sign in chunk.signs:
+            e = self.pools[sign.kind].acquire()
+            e.position = sign.position
+            e.rotation_y = sign.rotation_y
+            used.append((sign.kind, e))
+        self._shown[chunk.key] = used
+
+    def hide(self, key):
+        for kind, e in self._shown.pop(key, ()):
+            self.pools[kind].release(e)
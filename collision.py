@@ -0,0 +1,479 @@
+# collision.py - Broad-phase and narrow-phase collision for the car game
+
+"""
+CollisionWorld finds contacts between moving vehicles and the city's
+static bodies without testing every pair.
+
+  dynamic bodies  oriented boxes (the player car, NPC vehicles) stored as
+                  rows of NumPy arrays; move() updates any subset of them
+                  in place, so a whole fleet is synced with one call
+  static bodies   axis-aligned boxes (buildings, signs, lights) kept in a
+                  uniform grid, one entry per cell the box overlaps
+
+Broad phase. Each dynamic body is binned by its centre into a uniform grid
+whose cells are at least as wide as two bounding radii, so two bodies can
+only touch if their cells are the same or adjacent. Bodies are sorted by
+cell key; every cell is paired with itself and four forward neighbours
+through searchsorted ranges, which gives each candidate pair once. The sort
+order is kept between steps and only redone when some body changed cell
+(from the previous order, which is nearly sorted). Static boxes are looked
+up from a CSR copy of their grid, rebuilt only when statics are added or
+removed, using the up to 2 x 2 cells a dynamic body's bounds cover.
+
+Narrow phase. Candidates that pass a bounding-circle test get an exact
+separating-axis test (four axes for box / box, which covers AABBs as
+boxes with rotation 0).
+
+step() returns the contacts that began this step and calls the handlers
+registered with on(kind_a, kind_b, fn) for them; contacts that persist
+do not fire again until the bodies separate. Static contacts are only
+looked for on dynamic kinds that have a handler for some static kind (the
+NPCs, which never leave the road, skip that work). With fewer than two
+dynamic bodies (the player alone) there are no pairs to find, and step()
+skips the array broad phase for a scalar cell lookup and SAT. Kinds are
+free-form strings ('car', 'npc', 'building', ...) shared by dynamic and
+static bodies.
+"""
+
+from math import cos, floor, hypot, radians, sin
+
+import numpy as np
+
+_KEY_SPAN = 1 << 21     # Cell coordinates are offset into [0, _KEY_SPAN) to build int64 keys.
+_FORWARD = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))   # Self plus half of the 8-neighbourhood.
+_PAIR_SHIFT = 32        # Contact pairs are stored as (a << _PAIR_SHIFT) | b.
+SMALL_QUERY = 8         # static_pairs uses plain dict lookups below this many bodies.
+
+
+def _cell_key(i, j):
+    half = _KEY_SPAN // 2
+    return (np.asarray(i, dtype=np.int64) + half) * _KEY_SPAN + (np.asarray(j, dtype=np.int64) + half)
+
+
+def _ranges(starts, ends):
+    """Concatenated aranges [starts[i], ends[i]) and the index i each element came from."""
+    counts = np.maximum(ends - starts, 0)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    if not len(owner):
+        return owner, owner
+    first = np.cumsum(counts) - counts
+    return starts[owner] + np.arange(len(owner)) - first[owner], owner
+
+
+def grid_keys(x, z, cell_size):
+    """Uniform-grid cell keys of points (arrays), for sorted_cell_pairs."""
+    return _cell_key(np.floor(x / cell_size), np.floor(z / cell_size))
+
+
+def sorted_cell_pairs(keys):
+    """
+    Candidate neighbour pairs among points whose grid_keys are sorted: (p, q)
+    positions into keys, each unordered pair once, for every two points in
+    the same or adjacent cells.
+    """
+    if len(keys) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # Occupied cells as CSR runs over the sorted points.
+    first = np.nonzero(np.r_[True, keys[1:] != keys[:-1]])[0]
+    cells = keys[first]
+    bounds = np.r_[first, len(keys)]
+    cell_of = np.repeat(np.arange(len(cells)), np.diff(bounds))
+    pa, pb = [], []
+    for di, dj in _FORWARD:
+        if di == 0 and dj == 0:
+            lo, hi = np.arange(len(keys)) + 1, bounds[cell_of + 1]   # same cell: later points only
+        else:
+            slot = np.minimum(np.searchsorted(cells, cells + di * _KEY_SPAN + dj), len(cells) - 1)
+            found = cells[slot] == cells + di * _KEY_SPAN + dj
+            lo = np.where(found, bounds[slot], 0)[cell_of]
+            hi = np.where(found, bounds[slot + 1], 0)[cell_of]
+        other, owner = _ranges(lo, hi)
+        pa.append(owner)
+        pb.append(other)
+    return np.concatenate(pa), np.concatenate(pb)
+
+
+def boxes_overlap(ax, az, ahx, ahz, arot, bx, bz, bhx, bhz, brot):
+    """
+    Separating-axis test for oriented boxes in the xz-plane (arrays or scalars).
+    hx / hz are half extents along the box's local x / z; rot is rotation_y in
+    radians, so the local z axis is (sin rot, cos rot) like Entity.forward.
+    """
+    asin, acos = np.sin(arot), np.cos(arot)
+    bsin, bcos = np.sin(brot), np.cos(brot)
+    dx, dz = bx - ax, bz - az
+    apart = np.zeros(np.broadcast(ax, bx).shape, dtype=bool)
+    for nx, nz in ((acos, -asin), (asin, acos), (bcos, -bsin), (bsin, bcos)):
+        ra = ahx * np.abs(acos * nx - asin * nz) + ahz * np.abs(asin * nx + acos * nz)
+        rb = bhx * np.abs(bcos * nx - bsin * nz) + bhz * np.abs(bsin * nx + bcos * nz)
+        apart |= np.abs(dx * nx + dz * nz) > ra + rb
+    return ~apart
+
+
+def _box_overlap_scalar(ax, az, ahx, ahz, arot, bx, bz, bhx, bhz, brot):
+    """boxes_overlap for one pair of Python floats, without NumPy's per-call overhead."""
+    asin, acos, bsin, bcos = sin(arot), cos(arot), sin(brot), cos(brot)
+    dx, dz = bx - ax, bz - az
+    for nx, nz in ((acos, -asin), (asin, acos), (bcos, -bsin), (bsin, bcos)):
+        ra = ahx * abs(acos * nx - asin * nz) + ahz * abs(asin * nx + acos * nz)
+        rb = bhx * abs(bcos * nx - bsin * nz) + bhz * abs(bsin * nx + bcos * nz)
+        if abs(dx * nx + dz * nz) > ra + rb:
+            return False
+    return True
+
+
+class CollisionWorld:
+    """
+    cell_size: broad-phase cell size; raised automatically to the diameter
+               of the largest dynamic body
+    static_cell: grid cell size for static boxes
+    """
+    def __init__(self, cell_size=8.0, static_cell=30.0, capacity=64):
+        self.cell_size = cell_size
+        self.static_cell = static_cell
+
+        self.x = np.zeros(capacity)
+        self.z = np.zeros(capacity)
+        self.hx = np.zeros(capacity)
+        self.hz = np.zeros(capacity)
+        self.rot = np.zeros(capacity)         # rotation_y in radians
+        self.kind = np.full(capacity, -1, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.payload = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        self._count = 0
+
+        self.static_boxes = {}                # static id -> (kind, cx, cz, hx, hz, payload)
+        self._static_cells = {}
+        self._static_id = 0
+        self._static_dirty = True
+        self._static_kinds = set()
+
+        self._kinds = {}
+        self._kind_names = []
+        self._handlers = {}
+        self._order = np.zeros(0, dtype=np.int64)
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._membership_changed = True
+        self._contacts = np.zeros(0, dtype=np.int64)
+        self._static_contacts = np.zeros(0, dtype=np.int64)
+
+    def kind_code(self, kind):
+        code = self._kinds.get(kind)
+        if code is None:
+            code = self._kinds[kind] = len(self._kind_names)
+            self._kind_names.append(kind)
+        return code
+
+    def kind_name(self, code):
+        return self._kind_names[code]
+
+    def on(self, kind_a, kind_b, handler):
+        """
+        Call handler(a, b) when a dynamic body of kind_a starts touching a body
+        of kind_b. b is a dynamic id, or a static id if kind_b is static.
+        """
+        self._handlers[(self.kind_code(kind_a), self.kind_code(kind_b))] = handler
+
+    # -- dynamic bodies --------------------------------------------------
+
+    def _grow(self, needed):
+        size = len(self.x)
+        if needed <= size:
+            return
+        new = max(needed, size * 2)
+        for name in ('x', 'z', 'hx', 'hz', 'rot'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(new - size)]))
+        self.kind = np.concatenate([self.kind, np.full(new - size, -1, dtype=np.int64)])
+        self.alive = np.concatenate([self.alive, np.zeros(new - size, dtype=bool)])
+        self.payload += [None] * (new - size)
+        self._free = list(range(new - 1, size - 1, -1)) + self._free
+
+    def add_dynamic(self, kind, x, z, half_x, half_z, rotation_y=0.0, payload=None):
+        """
+        Add oriented boxes; x, z, rotation_y (degrees) may be arrays to add many
+        at once. Returns the body id (or an id array).
+        """
+        xs = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        n = len(xs)
+        self._grow(self._count + n)
+        ids = np.array([self._free.pop() for _ in range(n)], dtype=np.int64)
+        self.x[ids] = xs
+        self.z[ids] = z
+        self.hx[ids] = half_x
+        self.hz[ids] = half_z
+        self.rot[ids] = np.radians(rotation_y)
+        self.kind[ids] = self.kind_code(kind)
+        self.alive[ids] = True
+        for i in ids.tolist():
+            self.payload[i] = payload
+        self._count += n
+        self.cell_size = max(self.cell_size, 2.0 * float(np.hypot(half_x, half_z).max()))
+        self._membership_changed = True
+        return int(ids[0]) if np.ndim(x) == 0 else ids
+
+    def move(self, ids, x, z, rotation_y=None):
+        """Update the pose of one body or an array of bodies."""
+        self.x[ids] = x
+        self.z[ids] = z
+        if rotation_y is not None:
+            self.rot[ids] = np.radians(rotation_y)
+
+    def remove(self, ids):
+        for i in np.atleast_1d(ids).tolist():
+            if self.alive[i]:
+                self.alive[i] = False
+                self.kind[i] = -1
+                self.payload[i] = None
+                self._free.append(i)
+                self._count -= 1
+        self._membership_changed = True
+
+    # -- static bodies ---------------------------------------------------
+
+    def _static_cells_for(self, cx, cz, hx, hz):
+        cs = self.static_cell
+        for i in range(int(floor((cx - hx) / cs)), int(floor((cx + hx) / cs)) + 1):
+            for j in range(int(floor((cz - hz) / cs)), int(floor((cz + hz) / cs)) + 1):
+                yield (i, j)
+
+    def add_static(self, kind, center, half_x, half_z, payload=None):
+        """Add an axis-aligned box centred on (x, z); returns its static id."""
+        sid = self._static_id
+        self._static_id += 1
+        self.static_boxes[sid] = (self.kind_code(kind), center[0], center[1], half_x, half_z, payload)
+        for key in self._static_cells_for(center[0], center[1], half_x, half_z):
+            self._static_cells.setdefault(key, []).append(sid)
+        self._static_kinds.add(self.kind_code(kind))
+        self._static_dirty = True
+        return sid
+
+    def remove_static(self, sid):
+        box = self.static_boxes.pop(sid, None)
+        if box is None:
+            return
+        for key in self._static_cells_for(*box[1:5]):
+            rest = [s for s in self._static_cells.get(key, ()) if s != sid]
+            if rest:
+                self._static_cells[key] = rest
+            else:
+                self._static_cells.pop(key, None)
+        self._static_dirty = True
+
+    def _static_mask(self):
+        """Per kind code (plus a trailing False for -1): has a handler for some static kind."""
+        mask = np.zeros(len(self._kind_names) + 1, dtype=bool)
+        for kind_a, kind_b in self._handlers:
+            if kind_b in self._static_kinds:
+                mask[kind_a] = True
+        return mask
+
+    def _rebuild_statics(self):
+        """Flatten the static grid into sorted cell keys, CSR offsets and box arrays."""
+        keys = sorted(self._static_cells)
+        self._s_keys = _cell_key([k[0] for k in keys], [k[1] for k in keys])
+        members = [self._static_cells[k] for k in keys]
+        self._s_start = np.cumsum([0] + [len(m) for m in members]).astype(np.int64)
+        self._s_ids = np.array([s for m in members for s in m], dtype=np.int64)
+        size = self._static_id
+        self._s_box = np.zeros((size, 4))
+        self._s_kind = np.full(size, -1, dtype=np.int64)
+        for sid, (kind, cx, cz, hx, hz, _) in self.static_boxes.items():
+            self._s_box[sid] = (cx, cz, hx, hz)
+            self._s_kind[sid] = kind
+        self._static_dirty = False
+
+    # -- queries ---------------------------------------------------------
+
+    def _sorted_bodies(self):
+        """Alive body ids sorted by broad-phase cell key, reusing last step's order."""
+        cs = self.cell_size
+        ids = self._order
+        if self._membership_changed:
+            ids = np.nonzero(self.alive)[0]
+            self._membership_changed = False
+        keys = grid_keys(self.x[ids], self.z[ids], cs)
+        if len(keys) != len(self._keys) or not np.array_equal(keys, self._keys):
+            resort = np.argsort(keys, kind='stable')
+            ids, keys = ids[resort], keys[resort]
+        self._order, self._keys = ids, keys
+        return ids, keys
+
+    def dynamic_pairs(self):
+        """Overlapping dynamic bodies as (a, b) id arrays, a < b."""
+        if self._count < 2:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        ids, keys = self._sorted_bodies()
+        p, q = sorted_cell_pairs(keys)
+        a, b = ids[p], ids[q]
+
+        reach = np.hypot(self.hx[a], self.hz[a]) + np.hypot(self.hx[b], self.hz[b])
+        near = (self.x[a] - self.x[b]) ** 2 + (self.z[a] - self.z[b]) ** 2 <= reach * reach
+        a, b = a[near], b[near]
+        hit = boxes_overlap(self.x[a], self.z[a], self.hx[a], self.hz[a], self.rot[a],
+                            self.x[b], self.z[b], self.hx[b], self.hz[b], self.rot[b])
+        a, b = a[hit], b[hit]
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def static_pairs(self, ids=None):
+        """
+        (dynamic id, static id) arrays of dynamic bodies touching static boxes.
+        ids defaults to the bodies whose kind has a handler for a static kind.
+        """
+        if self._static_dirty:
+            self._rebuild_statics()
+        empty = np.zeros(0, dtype=np.int64)
+        if ids is None:
+            ids = np.nonzero(self.alive & self._static_mask()[self.kind])[0]
+        if not len(ids) or not len(self._s_ids):
+            return empty, empty
+        if len(ids) <= SMALL_QUERY:
+            return self._static_pairs_small(ids)
+        cs = self.static_cell
+        r = np.hypot(self.hx[ids], self.hz[ids])
+        r_max = r.max()
+        i0, i1 = np.floor((self.x[ids] - r) / cs), np.floor((self.x[ids] + r) / cs)
+        j0, j1 = np.floor((self.z[ids] - r) / cs), np.floor((self.z[ids] + r) / cs)
+        pa, pb = [], []
+        for ci, cj, use in ((i0, j0, None), (i1, j0, i1 != i0),
+                            (i0, j1, j1 != j0), (i1, j1, (i1 != i0) & (j1 != j0))):
+            key = _cell_key(ci, cj)
+            slot = np.searchsorted(self._s_keys, key)
+            slot = np.minimum(slot, len(self._s_keys) - 1)
+            found = self._s_keys[slot] == key
+            if use is not None:
+                found &= use
+            owner = np.nonzero(found)[0]
+            members, which = _ranges(self._s_start[slot[owner]], self._s_start[slot[owner] + 1])
+            pa.append(ids[owner[which]])
+            pb.append(self._s_ids[members])
+        a, s = np.concatenate(pa), np.concatenate(pb)
+        if not len(a):
+            return empty, empty
+        # A box spanning several cells shows up once per shared cell.
+        pair = np.sort((a << _PAIR_SHIFT) | s)
+        pair = pair[np.r_[True, pair[1:] != pair[:-1]]]
+        a, s = pair >> _PAIR_SHIFT, pair & ((1 << _PAIR_SHIFT) - 1)
+        box = self._s_box[s]
+        near = ((np.abs(self.x[a] - box[:, 0]) <= box[:, 2] + r_max) &
+                (np.abs(self.z[a] - box[:, 1]) <= box[:, 3] + r_max))
+        a, s, box = a[near], s[near], box[near]
+        hit = boxes_overlap(self.x[a], self.z[a], self.hx[a], self.hz[a], self.rot[a],
+                            box[:, 0], box[:, 1], box[:, 2], box[:, 3], 0.0)
+        return a[hit], s[hit]
+
+    def _static_hits(self, i):
+        """Static ids touching dynamic body i: dict lookups and scalar SAT, for a handful of bodies."""
+        cs, cells, boxes = self.static_cell, self._static_cells, self.static_boxes
+        x, z, hx, hz, rot = (float(self.x[i]), float(self.z[i]), float(self.hx[i]),
+                             float(self.hz[i]), float(self.rot[i]))
+        r = hypot(hx, hz)
+        found = set()
+        for ci in range(int(floor((x - r) / cs)), int(floor((x + r) / cs)) + 1):
+            for cj in range(int(floor((z - r) / cs)), int(floor((z + r) / cs)) + 1):
+                found.update(cells.get((ci, cj), ()))
+        hits = []
+        for sid in sorted(found):
+            _, cx, cz, bhx, bhz, _ = boxes[sid]
+            if (abs(x - cx) <= bhx + r and abs(z - cz) <= bhz + r
+                    and _box_overlap_scalar(x, z, hx, hz, rot, cx, cz, bhx, bhz, 0.0)):
+                hits.append(sid)
+        return hits
+
+    def _static_pairs_small(self, ids):
+        """static_pairs for a handful of bodies (e.g. just the player)."""
+        pa, pb = [], []
+        for i in ids.tolist():
+            hits = self._static_hits(i)
+            pa += [i] * len(hits)
+            pb += hits
+        return np.array(pa, dtype=np.int64), np.array(pb, dtype=np.int64)
+
+    def query_box(self, x, z, half_x, half_z, rotation_y=0.0):
+        """Ids of dynamic bodies overlapping an oriented box (e.g. a pedestrian)."""
+        cs = self.cell_size
+        reach = float(np.hypot(half_x, half_z)) + cs * 0.5
+        ids, keys = self._sorted_bodies()
+        found = []
+        for i in range(int(floor((x - reach) / cs)), int(floor((x + reach) / cs)) + 1):
+            for j in range(int(floor((z - reach) / cs)), int(floor((z + reach) / cs)) + 1):
+                key = _cell_key(i, j)
+                found.append(ids[np.searchsorted(keys, key, 'left'):np.searchsorted(keys, key, 'right')])
+        cand = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+        hit = boxes_overlap(self.x[cand], self.z[cand], self.hx[cand], self.hz[cand], self.rot[cand],
+                            x, z, half_x, half_z, radians(rotation_y))
+        return cand[hit]
+
+    # -- events ----------------------------------------------------------
+
+    def snapshot(self):
+        """Ongoing contacts; poses are rewritten by their owners before each step."""
+        return {'contacts': self._contacts.copy(), 'static_contacts': self._static_contacts.copy()}
+
+    def restore(self, state):
+        self._contacts = state['contacts'].copy()
+        self._static_contacts = state['static_contacts'].copy()
+
+    def step(self):
+        """
+        Find contacts and fire handlers for the ones that began since the
+        last step. Returns (dynamic_pairs, static_pairs) of new contacts,
+        each a list of (a, b) with b a dynamic or static id respectively.
+        """
+        if self._count < 2:
+            return self._step_single()
+        a, b = self.dynamic_pairs()
+        current = np.unique((a << _PAIR_SHIFT) | b)
+        began = np.setdiff1d(current, self._contacts, assume_unique=True)
+        self._contacts = current
+
+        sa, ss = self.static_pairs()
+        s_current = (sa << _PAIR_SHIFT) | ss
+        s_began = np.setdiff1d(s_current, self._static_contacts, assume_unique=True)
+        self._static_contacts = s_current
+
+        mask = (1 << _PAIR_SHIFT) - 1
+        new_dynamic = [(p >> _PAIR_SHIFT, p & mask) for p in began.tolist()]
+        new_static = [(p >> _PAIR_SHIFT, p & mask) for p in s_began.tolist()]
+        if self._handlers:
+            for x, y in new_dynamic:
+                handler = self._handlers.get((self.kind[x], self.kind[y]))
+                if handler is not None:
+                    handler(x, y)
+                handler = self._handlers.get((self.kind[y], self.kind[x]))
+                if handler is not None and self.kind[x] != self.kind[y]:
+                    handler(y, x)
+            for x, s in new_static:
+                handler = self._handlers.get((self.kind[x], self._s_kind[s]))
+                if handler is not None:
+                    handler(x, s)
+        return new_dynamic, new_static
+
+    def _step_single(self):
+        """step() with at most one dynamic body (the player alone): no pairs, scalar statics."""
+        if self._membership_changed:
+            self._order = np.nonzero(self.alive)[0]
+            self._keys = np.zeros(0, dtype=np.int64)
+            self._membership_changed = False
+        if len(self._contacts):
+            self._contacts = np.zeros(0, dtype=np.int64)
+        previous = self._static_contacts
+        if not len(self._order):
+            self._static_contacts = np.zeros(0, dtype=np.int64)
+            return [], []
+        i = int(self._order[0])
+        kind = int(self.kind[i])
+        handled = [(k, b) for k, b in self._handlers if k == kind and b in self._static_kinds]
+        hits = self._static_hits(i) if handled else []
+        if not hits and not len(previous):
+            return [], []
+        had = set(previous.tolist())
+        pairs = [(i << _PAIR_SHIFT) | s for s in hits]
+        self._static_contacts = np.array(pairs, dtype=np.int64)
+        new_static = [(i, s) for s, pair in zip(hits, pairs) if pair not in had]
+        for _, s in new_static:
+            handler = self._handlers.get((kind, self.static_boxes[s][0]))
+            if handler is not None:
+                handler(i, s)
+        return [], new_static
@@ -9,4 +9,8 @@ OFFSET = -(GRID_SIZE // 2) * CELL_SPACING  # So city is centered around (0,0)
 
 # Road arc parameters
 ARC_RADIUS = 4        # Radius for smooth "right-turn" arcs at intersections
-ARC_SEGMENTS = 10     # Number of quads per arc for smoother curves 
\ No newline at end of file
+ARC_SEGMENTS = 10     # Number of quads per arc for smoother curves 
+
+# Physics timing
+PHYSICS_HZ = 60       # Fixed physics / rule-check rate; lower it on weak hardware
+MAX_SUBSTEPS = 5      # Most physics steps run in one frame before time is dropped
@@ -0,0 +1,174 @@
+# crossing_env.py - Batched pedestrian-crossing environments for policy training
+
+"""
+CrossingVecEnv simulates N independent copies of the pedestrian crossing
+game at once. Every piece of state is a NumPy array with one row per
+environment (player position, score, signal phase, timers) or one row
+per car slot, lane and environment (the car pools), and step() applies the
+rules of PedestrianGame.update (crossing_rules.py) to all N in a handful
+of array operations. No pygame is involved.
+
+    env = CrossingVecEnv(1024, seed=0)
+    obs = env.reset()
+    obs, reward, done, info = env.step(actions)     # actions: int array (N,)
+
+Actions are indices into ACTIONS (stay, or one of the W / S / A / D
+moves). The reward is the change in score over the tick. An episode ends
+after episode_ticks; finished environments are reset inside step() and
+their last observation is returned in info['final_observation'], as
+vectorized gym environments do.
+
+Observation (float32, OBS_SIZE per environment, all roughly in [0, 1]):
+
+  0-1   player x / WIDTH, y / HEIGHT
+  2     1 if the signal shows "Safe"
+  3     elapsed fraction of the current signal phase
+  4-5   per lane, distance from the nearest car that has not yet passed
+        the player to the player's left edge, / WIDTH (1 if there is none)
+
+The NPC crowd is left out: it is scenery and does not affect the score.
+"""
+
+import numpy as np
+
+from crossing_rules import (WIDTH, HEIGHT, ROAD_TOP, ROAD_BOTTOM, CROSSING,
+                            PLAYER_SIZE, PLAYER_SPEED, PLAYER_START, GOAL_Y,
+                            CAR_WIDTH, CAR_HEIGHT, CAR_SPEED, CAR_LANES, SPAWN_INTERVAL,
+                            LOGIC_HZ, SIGNAL_DURATION, HIT_PENALTY, ARRIVAL_BONUS,
+                            SAFE_CROSSING_POINTS, JAYWALK_PENALTY, SCORE_INTERVAL)
+
+# (dx, dy) per action: stay, W, S, A, D.
+ACTIONS = np.array([(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)], dtype=np.int32) * PLAYER_SPEED
+OBS_SIZE = 4 + len(CAR_LANES)
+TICK_MS = 1000.0 / LOGIC_HZ
+
+
+class CrossingVecEnv:
+    """
+    num_envs: N, the batch size
+    lane_cars: car slots per lane and environment; a spawn with none free is
+               dropped (at the game's spawn rate a lane holds at most 3 cars)
+    episode_ticks: logic ticks per episode (default one minute of game time)
+    """
+    def __init__(self, num_envs, lane_cars=4, episode_ticks=LOGIC_HZ * 60,
+                 spawn_interval=SPAWN_INTERVAL, seed=0):
+        self.num_envs = num_envs
+        self.lane_cars = lane_cars
+        self.episode_ticks = episode_ticks
+        self.spawn_interval = spawn_interval
+        self.rng = np.random.default_rng(seed)
+        n, lanes, k = num_envs, len(CAR_LANES), lane_cars
+
+        self.tick = np.zeros(n, dtype=np.int64)          # ticks into the episode
+        self.now = np.zeros(n)                           # game time, ms
+        self.px = np.zeros(n, dtype=np.int32)
+        self.py = np.zeros(n, dtype=np.int32)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.green = np.zeros(n, dtype=bool)
+        self.last_switch = np.zeros(n)
+        self.spawn_timer = np.zeros(n)
+        self.last_score_update = np.zeros(n)
+
+        # Cars by (slot, lane, environment): the lane gives the y, and with the
+        # environment last, per-environment reductions run over whole rows.
+        self.car_x = np.zeros((k, lanes, n), dtype=np.int32)
+        self.car_active = np.zeros((k, lanes, n), dtype=bool)
+
+        self._lane_top = np.array(CAR_LANES, dtype=np.int32)[:, None]
+        self._rows = np.arange(n)
+        self._obs = np.zeros((n, OBS_SIZE), dtype=np.float32)
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start new episodes (all, or where mask is True); returns the observations."""
+        rows = self._rows if mask is None else np.flatnonzero(mask)
+        self.tick[rows] = 0
+        self.now[rows] = 0.0
+        self.px[rows], self.py[rows] = PLAYER_START
+        self.score[rows] = 0
+        self.green[rows] = False
+        self.last_switch[rows] = 0.0
+        self.spawn_timer[rows] = 0.0
+        self.last_score_update[rows] = 0.0
+        self.car_active[:, :, rows] = False
+        return self._observe()
+
+    def step(self, actions):
+        """Advance every environment one logic tick; returns (obs, reward, done, info)."""
+        self.tick += 1
+        self.now += TICK_MS
+        now = self.now
+
+        # Player movement, kept on screen.
+        move = ACTIONS[np.asarray(actions)]
+        np.clip(self.px + move[:, 0], 0, WIDTH - PLAYER_SIZE, out=self.px)
+        np.clip(self.py + move[:, 1], 0, HEIGHT - PLAYER_SIZE, out=self.py)
+
+        # Signal phases.
+        switch = now - self.last_switch > SIGNAL_DURATION
+        self.green ^= switch
+        np.copyto(self.last_switch, now, where=switch)
+
+        # Spawn one car per due environment into a free slot of a random lane.
+        due = np.flatnonzero(now - self.spawn_timer > self.spawn_interval)
+        if len(due):
+            lane = self.rng.integers(0, len(CAR_LANES), len(due))
+            slot = np.argmin(self.car_active[:, lane, due], axis=0)
+            free = ~self.car_active[slot, lane, due]
+            rows, lane, slot = due[free], lane[free], slot[free]
+            self.car_x[slot, lane, rows] = -CAR_WIDTH
+            self.car_active[slot, lane, rows] = True
+            self.spawn_timer[due] = now[due]
+
+        # Cars drive on and leave at the right edge.
+        car_x, active = self.car_x, self.car_active
+        car_x += CAR_SPEED * active
+        active &= car_x < WIDTH
+
+        # Hit by a car: penalty and back to the start.
+        px, py = self.px, self.py
+        in_lane = (self._lane_top + CAR_HEIGHT > py) & (self._lane_top < py + PLAYER_SIZE)
+        overlap = active & (car_x + CAR_WIDTH > px) & (car_x < px + PLAYER_SIZE)
+        hit = (overlap.any(axis=0) & in_lane).any(axis=0)
+        reward = -HIT_PENALTY * hit
+        self._restart(hit)
+
+        # Time in the crossing zone scores by the signal, once per SCORE_INTERVAL.
+        zone = ((self.px + PLAYER_SIZE > CROSSING[0]) & (self.px < CROSSING[1])
+                & (self.py + PLAYER_SIZE > ROAD_TOP) & (self.py < ROAD_BOTTOM))
+        scored = zone & (now - self.last_score_update > SCORE_INTERVAL)
+        reward += np.where(self.green, SAFE_CROSSING_POINTS, -JAYWALK_PENALTY) * scored
+        np.copyto(self.last_score_update, now, where=scored)
+
+        # Reached the far side.
+        arrived = self.py < GOAL_Y
+        reward += ARRIVAL_BONUS * arrived
+        self._restart(arrived)
+
+        self.score += reward
+        reward = reward.astype(np.float32)
+        done = self.tick >= self.episode_ticks
+        info = {'hit': hit, 'arrived': arrived}
+        obs = self._observe()
+        if done.any():
+            info['final_observation'] = obs[done].copy()
+            info['final_score'] = self.score[done].copy()
+            obs = self.reset(done)
+        return obs, reward, done, info
+
+    def _restart(self, mask):
+        np.putmask(self.px, mask, PLAYER_START[0])
+        np.putmask(self.py, mask, PLAYER_START[1])
+
+    def _observe(self):
+        obs = self._obs
+        obs[:, 0] = self.px / WIDTH
+        obs[:, 1] = self.py / HEIGHT
+        obs[:, 2] = self.green
+        obs[:, 3] = np.minimum((self.now - self.last_switch) / SIGNAL_DURATION, 1.0)
+        # Cars that have not passed the player yet, per lane.
+        px = self.px
+        coming = self.car_active & (self.car_x < px + PLAYER_SIZE)
+        gap = np.where(coming, px - (self.car_x + CAR_WIDTH), WIDTH).min(axis=0)
+        obs[:, 4:] = (np.clip(gap, 0, WIDTH) / WIDTH).T
+        return obs.copy()
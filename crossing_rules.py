@@ -0,0 +1,39 @@
+# crossing_rules.py - Geometry, timings and scoring of the pedestrian crossing game
+
+"""
+The numbers that define the pedestrian crossing game, kept free of pygame
+so the interactive game (pedestrain.py) and the batched training
+environment (crossing_env.py) play by exactly the same rules.
+
+Lengths are screen pixels (y down), speeds pixels per logic tick and
+times milliseconds of game time.
+"""
+
+# Screen and road
+WIDTH, HEIGHT = 1000, 700
+ROAD_TOP = HEIGHT // 2 - 120
+ROAD_BOTTOM = HEIGHT // 2 + 120
+SIDEWALK_HEIGHT = 60
+CROSSING = (WIDTH // 2 - 100, WIDTH // 2 + 100)    # x range of the crossing zone
+
+# Player
+PLAYER_SIZE = 40
+PLAYER_SPEED = 5
+PLAYER_START = (WIDTH // 2 - PLAYER_SIZE // 2, ROAD_BOTTOM + SIDEWALK_HEIGHT + 10)
+GOAL_Y = ROAD_TOP - SIDEWALK_HEIGHT + 10           # reaching above this scores ARRIVAL_BONUS
+
+# Cars
+CAR_WIDTH, CAR_HEIGHT, CAR_SPEED = 80, 40, 4
+CAR_LANES = (ROAD_TOP + 20, ROAD_BOTTOM - CAR_HEIGHT - 20)   # top y of each lane
+SPAWN_INTERVAL = 1500       # between cars
+
+# Timing
+LOGIC_HZ = 60               # Fixed game-logic rate, independent of the frame rate
+SIGNAL_DURATION = 3000      # each of "Wait" and "Safe"
+
+# Scoring
+HIT_PENALTY = 15            # hit by a car (the player restarts)
+ARRIVAL_BONUS = 20          # reached the far side (the player restarts)
+SAFE_CROSSING_POINTS = 2    # per SCORE_INTERVAL in the crossing zone on "Safe"
+JAYWALK_PENALTY = 3         # per SCORE_INTERVAL in the crossing zone on "Wait"
+SCORE_INTERVAL = 500
@@ -0,0 +1,215 @@
+# crowd.py - Vectorized NPC pedestrian crowd with spatial-hash neighbour queries
+
+"""
+Crowd moves hundreds of walkers across a signalled crossing as NumPy
+arrays (one row per agent, like traffic.TrafficFleet) in the pedestrian
+game's screen coordinates: x to the right, y down, lengths in pixels,
+speeds in pixels per logic tick.
+
+Each agent starts on one side of the road and goes through four states:
+
+  APPROACH  walk to a point on its own kerb inside the crossing
+  WAIT      queue at the kerb until the signal shows green
+  CROSS     walk to the far side; a walker already on the road keeps
+            going when the signal changes, but holds while a car is about
+            to pass through where its next step would take it
+  LEAVE     walk on to a goal on the far pavement, then despawn
+
+Steering is the desired velocity towards the state's target plus a
+separation push from every neighbour closer than personal_space, so a
+queue forms at the kerb instead of agents stacking on one spot. Neighbours
+come from a uniform grid (collision.grid_keys / sorted_cell_pairs) with
+cells personal_space wide, so only agents in the same or adjacent cells are
+ever compared (below ALL_PAIRS_BELOW agents every pair is tested in one
+go, which is cheaper than building the grid); stats holds this tick's
+candidate pairs (neighbor_queries) and the pairs actually in range
+(neighbors).
+"""
+
+import numpy as np
+
+from collision import grid_keys, sorted_cell_pairs
+
+APPROACH, WAIT, CROSS, LEAVE = range(4)
+ALL_PAIRS_BELOW = 64        # Fewer agents than this are paired directly; the grid costs more.
+
+
+class Crowd:
+    """
+    road_top / road_bottom: y of the road's kerbs
+    crossing: (left, right) x range walkers cross in
+    size: the number of walkers kept alive (spawned as others despawn)
+    """
+    def __init__(self, width, height, road_top, road_bottom, crossing, size=40,
+                 capacity=1024, radius=8, speed=1.6, personal_space=20, car_lookahead=200, seed=0):
+        self.width, self.height = width, height
+        self.road_top, self.road_bottom = road_top, road_bottom
+        self.crossing = crossing
+        self.size = size
+        self.capacity = capacity
+        self.radius = radius
+        self.speed = speed
+        self.personal_space = personal_space
+        self.car_lookahead = car_lookahead
+        self.rng = np.random.default_rng(seed)
+
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.down = np.zeros(capacity, dtype=bool)       # crossing towards larger y
+        self.cross_x = np.zeros(capacity)                # where on the kerb to cross
+        self.goal_x = np.zeros(capacity)
+        self.goal_y = np.zeros(capacity)
+        self.max_speed = np.zeros(capacity)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.stats = {'neighbor_queries': 0, 'neighbors': 0, 'despawned': 0}
+        self._all_pairs = {}
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def spawn(self, count):
+        """Add up to count walkers on random sides of the road; returns their slots."""
+        slots = np.flatnonzero(~self.active)[:count]
+        n = len(slots)
+        if not n:
+            return slots
+        rng, r = self.rng, self.radius
+        down = rng.random(n) < 0.5
+        top_band = (r, self.road_top - 3 * r)
+        bottom_band = (self.road_bottom + 3 * r, self.height - r)
+        near = np.where(down, rng.uniform(*top_band, n), rng.uniform(*bottom_band, n))
+        far = np.where(down, rng.uniform(*bottom_band, n), rng.uniform(*top_band, n))
+        left, right = self.crossing
+        self.x[slots] = rng.uniform(r, self.width - r, n)
+        self.y[slots] = near
+        self.vx[slots] = self.vy[slots] = 0.0
+        self.state[slots] = APPROACH
+        self.down[slots] = down
+        self.cross_x[slots] = rng.uniform(left + 2 * r, right - 2 * r, n)
+        self.goal_x[slots] = rng.uniform(r, self.width - r, n)
+        self.goal_y[slots] = far
+        self.max_speed[slots] = self.speed * rng.uniform(0.8, 1.2, n)
+        self.active[slots] = True
+        return slots
+
+    def clear(self):
+        self.active[:] = False
+
+    def _targets(self, ids):
+        """Target point of each agent's current state."""
+        r, state, down = self.radius, self.state[ids], self.down[ids]
+        near_kerb = np.where(down, self.road_top - r, self.road_bottom + r)
+        far_kerb = np.where(down, self.road_bottom + 2 * r, self.road_top - 2 * r)
+        tx = np.where(state == LEAVE, self.goal_x[ids], self.cross_x[ids])
+        ty = np.where(state <= WAIT, near_kerb, np.where(state == CROSS, far_kerb, self.goal_y[ids]))
+        return tx, ty
+
+    def _car_ahead(self, ids, nx, ny, cars):
+        """Agents at (nx, ny) that lie in the sweep of a car over car_lookahead."""
+        if cars is None or not len(ids):
+            return np.zeros(len(ids), dtype=bool)
+        cx, cy, cw, ch = cars
+        if not len(cx):
+            return np.zeros(len(ids), dtype=bool)
+        r = self.radius
+        # Cars drive towards +x; the sweep is the car plus the road it covers soon.
+        hit = ((nx[:, None] + r > cx[None, :]) & (nx[:, None] - r < cx[None, :] + cw[None, :] + self.car_lookahead)
+               & (ny[:, None] + r > cy[None, :]) & (ny[:, None] - r < cy[None, :] + ch[None, :]))
+        return hit.any(axis=1)
+
+    def _candidate_pairs(self, x, y):
+        """Index pairs (into x / y) of agents that may be within personal_space."""
+        n = len(x)
+        if n < ALL_PAIRS_BELOW:
+            pairs = self._all_pairs.get(n)
+            if pairs is None:
+                pairs = self._all_pairs[n] = np.triu_indices(n, 1)
+            return pairs
+        keys = grid_keys(x, y, self.personal_space)
+        order = np.argsort(keys, kind='stable')
+        p, q = sorted_cell_pairs(keys[order])
+        return order[p], order[q]
+
+    def update(self, green, cars=None):
+        """
+        One logic tick. green is the pedestrian signal; cars is (x, y, width,
+        height) arrays of the cars on the road (e.g. from CarPool.boxes()).
+        """
+        missing = self.size - len(self)
+        if missing > 0:
+            self.spawn(missing)
+        ids = np.flatnonzero(self.active)
+        if not len(ids):
+            return
+        x, y, state = self.x[ids], self.y[ids], self.state[ids]
+
+        # State changes: reached the kerb, got a green, reached the far side.
+        tx, ty = self._targets(ids)
+        arrived = np.abs(tx - x) + np.abs(ty - y) < 2 * self.radius
+        done = (state == LEAVE) & arrived
+        state = np.where((state == CROSS) & arrived, LEAVE, state)
+        state = np.where((state == APPROACH) & arrived, WAIT, state)
+        state = np.where((state == WAIT) & green, CROSS, state)
+        self.state[ids] = state
+        tx, ty = self._targets(ids)
+
+        # Desired velocity towards the target (none while queueing at the kerb).
+        dx, dy = tx - x, ty - y
+        dist = np.hypot(dx, dy)
+        pace = np.where(state == WAIT, 0.0, self.max_speed[ids]) / np.maximum(dist, 1e-9)
+        pace = np.minimum(pace, 1.0)        # arrive without overshooting
+        vx, vy = dx * pace, dy * pace
+
+        # Separation from neighbours within personal_space, via the grid.
+        space = self.personal_space
+        a, b = self._candidate_pairs(x, y)
+        self.stats['neighbor_queries'] = len(a)
+        ex, ey = x[a] - x[b], y[a] - y[b]
+        d = np.hypot(ex, ey)
+        near = d < space
+        a, b, ex, ey, d = a[near], b[near], ex[near], ey[near], d[near]
+        self.stats['neighbors'] = len(a)
+        if len(a):
+            # Coincident agents are pushed apart along x.
+            zero = d < 1e-9
+            ex, d = np.where(zero, 1.0, ex), np.where(zero, 1.0, d)
+            push = 0.5 * (space - d) / d
+            px, py = ex * push, ey * push
+            n = len(ids)
+            sx = np.bincount(a, px, n) - np.bincount(b, px, n)
+            sy = np.bincount(a, py, n) - np.bincount(b, py, n)
+            vx, vy = vx + 0.25 * sx, vy + 0.25 * sy
+
+        # Cap speed, then hold walkers whose next step would walk into a car's
+        # path; one already in a path keeps going to get out of it.
+        speed = np.hypot(vx, vy)
+        cap = np.minimum(1.0, self.max_speed[ids] * 1.5 / np.maximum(speed, 1e-9))
+        vx, vy = vx * cap, vy * cap
+        nx, ny = x + vx, y + vy
+        on_road = (ny + self.radius > self.road_top) & (ny - self.radius < self.road_bottom)
+        held = np.zeros(len(ids), dtype=bool)
+        if on_road.any():
+            road = np.flatnonzero(on_road)
+            held[road] = (self._car_ahead(ids[road], nx[road], ny[road], cars)
+                          & ~self._car_ahead(ids[road], x[road], y[road], cars))
+        nx, ny = np.where(held, x, nx), np.where(held, y, ny)
+
+        # Nobody steps off the kerb before their turn to cross.
+        kerb = state <= WAIT
+        r = self.radius
+        ny = np.where(kerb & self.down[ids], np.minimum(ny, self.road_top - r), ny)
+        ny = np.where(kerb & ~self.down[ids], np.maximum(ny, self.road_bottom + r), ny)
+        self.x[ids] = np.clip(nx, r, self.width - r)
+        self.y[ids] = np.clip(ny, r, self.height - r)
+        self.vx[ids], self.vy[ids] = np.where(held, 0.0, vx), np.where(held, 0.0, vy)
+
+        self.active[ids[done]] = False
+        self.stats['despawned'] += int(np.count_nonzero(done))
+
+    def positions(self):
+        """(x, y) arrays of the active agents."""
+        active = self.active
+        return self.x[active], self.y[active]
@@ -0,0 +1,278 @@
+# driving_env.py - Gym-style car-game environments and a shared-memory subprocess vector env
+
+"""
+DrivingEnv exposes the car game's rules (DrivingSimulation: kinematics,
+road containment, speed-limit / stop-sign / traffic-light / collision
+scoring) as a gym-style environment:
+
+    env = DrivingEnv(grid_size=4)
+    obs = env.reset()
+    obs, reward, done, info = env.step(action)
+
+An action is a Controls bit pattern (0-31: forward, back, left, right,
+brake = bits 0-4, see Controls.bits) held for action_repeat ticks of dt.
+The reward is the change in score. An episode ends after episode_seconds
+of simulated time. The city is built once and every reset() restores a
+snapshot taken at construction (see replay.py), so resets cost microseconds,
+not a city build.
+
+Observation (float32, OBS_SIZE):
+
+  0-1    car x, z relative to the city centre, / city half-size
+  2-3    sin, cos of the heading
+  4      speed / max speed
+  5      signed distance to the road edge / the road index's max_distance
+  6-7    1 inside a speed-limit / stop (road works) zone
+  8-10   one-hot red / amber / green of the light zone the car is in (all 0: none)
+  11     1 while the collision warning is up
+
+SubprocVecEnv runs N DrivingEnvs on K worker processes, each stepping a
+contiguous slice of them. Actions, observations, rewards and done flags
+live in one multiprocessing.shared_memory block that all processes map;
+per step the parent writes the actions and sends each worker a one-byte
+command over its pipe, and the workers write their results in place, so
+nothing is pickled after start-up. Finished episodes are reset inside the
+worker; their final score is left in final_score.
+
+    with SubprocVecEnv(64, workers=32, env_kwargs={'grid_size': 4}) as venv:
+        obs = venv.reset()
+        obs, reward, done, info = venv.step(actions)   # actions: int array (N,)
+"""
+
+import multiprocessing
+import os
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from simulation import CityLayout, DrivingSimulation, Controls
+from traffic_signals import RED, AMBER, GREEN
+
+OBS_SIZE = 12
+NUM_ACTIONS = 32
+_CONTROLS = [Controls.from_bits(bits) for bits in range(NUM_ACTIONS)]
+_LIGHT_SLOT = {RED: 8, AMBER: 9, GREEN: 10}
+
+
+class DrivingEnv:
+    """
+    grid_size / npc_count / npc_seed / signal_plan: passed to CityLayout and
+    DrivingSimulation; dt: simulation tick; action_repeat: ticks per step().
+    """
+    def __init__(self, grid_size=4, npc_count=0, npc_seed=0, signal_plan=None, dt=1 / 60,
+                 action_repeat=4, episode_seconds=60.0, initial_score=100):
+        layout = CityLayout(grid_size)
+        self.sim = DrivingSimulation(layout, initial_score=initial_score, signal_plan=signal_plan,
+                                     npc_count=npc_count, npc_seed=npc_seed)
+        self.dt = dt
+        self.action_repeat = action_repeat
+        self.episode_seconds = episode_seconds
+        self._start = self.sim.snapshot()
+        half = layout.grid_size * layout.cell_spacing * 0.5
+        self._centre = layout.offset + half
+        self._half = half + layout.road_width
+        self._max_distance = layout.road_index.max_distance
+
+    def reset(self, out=None):
+        self.sim.restore(self._start)
+        return self.observe(out)
+
+    def step(self, action, out=None):
+        """Run one action; returns (obs, reward, done, info)."""
+        sim = self.sim
+        before = sim.score
+        controls = _CONTROLS[int(action)]
+        for _ in range(self.action_repeat):
+            sim.step(controls, self.dt)
+        done = sim.time >= self.episode_seconds - 1e-9
+        info = {'score': sim.score, 'time': sim.time}
+        return self.observe(out), float(sim.score - before), done, info
+
+    def observe(self, out=None):
+        """The observation, written into out (a float32 array of OBS_SIZE) if given."""
+        obs = np.zeros(OBS_SIZE, dtype=np.float32) if out is None else out
+        sim = self.sim
+        car, tracker = sim.car, sim.zone_tracker
+        heading = np.radians(car.rotation_y)
+        obs[0] = (car.x - self._centre) / self._half
+        obs[1] = (car.z - self._centre) / self._half
+        obs[2] = np.sin(heading)
+        obs[3] = np.cos(heading)
+        obs[4] = car.speed / car.max_speed
+        obs[5] = sim.road_index.distance_to_edge(car.x, car.z) / self._max_distance
+        obs[6] = tracker.first('speed_limit') is not None
+        obs[7] = tracker.first('stop') is not None
+        obs[8:11] = 0.0
+        light = tracker.first('light')
+        if light is not None:
+            obs[_LIGHT_SLOT[sim.signals.color(light.target)]] = 1.0
+        obs[11] = sim.collision_timer > 0
+        return obs
+
+# ---------------------------------------------------------------------
+# SUBPROCESS VECTOR ENV
+# ---------------------------------------------------------------------
+
+_FIELDS = (('actions', np.int32, ()), ('obs', np.float32, (OBS_SIZE,)), ('reward', np.float32, ()),
+           ('done', np.bool_, ()), ('score', np.float64, ()), ('final_score', np.float64, ()))
+
+
+def _layout(num_envs):
+    """[(name, dtype, shape, byte offset)] of the shared block, and its size."""
+    fields, offset = [], 0
+    for name, dtype, shape in _FIELDS:
+        shape = (num_envs,) + shape
+        offset = -(-offset // 16) * 16          # keep every array 16-byte aligned
+        fields.append((name, dtype, shape, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return fields, offset
+
+
+def _views(buf, num_envs):
+    return {name: np.ndarray(shape, dtype, buffer=buf, offset=offset)
+            for name, dtype, shape, offset in _layout(num_envs)[0]}
+
+
+def _attach(name):
+    """Map an existing block without tracking it; the parent owns and unlinks it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)     # Python 3.13+
+    except TypeError:
+        # Older versions register the block again, but with the parent's
+        # resource tracker (inherited by fork and spawn alike), which keeps
+        # one entry per name: the parent's unlink still clears it.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker(conn, shm_name, num_envs, lo, hi, env_kwargs):
+    shm = _attach(shm_name)
+    arrays = _views(shm.buf, num_envs)
+    actions, obs, reward, done = arrays['actions'], arrays['obs'], arrays['reward'], arrays['done']
+    score, final_score = arrays['score'], arrays['final_score']
+    try:
+        envs = [DrivingEnv(**env_kwargs) for _ in range(lo, hi)]
+        conn.send_bytes(b'K')
+        while True:
+            command = conn.recv_bytes()
+            if command == b'S':
+                for i, env in zip(range(lo, hi), envs):
+                    _, reward[i], done[i], info = env.step(actions[i], out=obs[i])
+                    score[i] = info['score']
+                    if done[i]:
+                        final_score[i] = info['score']
+                        env.reset(out=obs[i])
+                        score[i] = env.sim.score
+            elif command == b'R':
+                for i, env in zip(range(lo, hi), envs):
+                    env.reset(out=obs[i])
+                    score[i] = env.sim.score
+                reward[lo:hi] = 0.0
+                done[lo:hi] = False
+            elif command == b'C':
+                break
+            conn.send_bytes(b'K')
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        conn.send_bytes(b'E' + traceback.format_exc().encode('utf-8'))
+    finally:
+        del arrays, actions, obs, reward, done, score, final_score
+        shm.close()
+        conn.close()
+
+
+class SubprocVecEnv:
+    """
+    num_envs: N environments; workers: K processes (default: all cores, at
+    most N); env_kwargs: DrivingEnv arguments, the same for every copy.
+    """
+    def __init__(self, num_envs, workers=None, env_kwargs=None, start_method=None):
+        self.num_envs = num_envs
+        workers = max(1, min(workers or os.cpu_count() or 1, num_envs))
+        _, size = _layout(num_envs)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._arrays = _views(self._shm.buf, num_envs)
+        self.actions = self._arrays['actions']
+        ctx = multiprocessing.get_context(start_method)
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        self._conns, self._procs = [], []
+        try:
+            for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                parent, child = ctx.Pipe()
+                proc = ctx.Process(target=_worker, daemon=True,
+                                   args=(child, self._shm.name, num_envs, lo, hi, env_kwargs or {}))
+                proc.start()
+                child.close()
+                self._conns.append(parent)
+                self._procs.append(proc)
+            self._wait()
+        except Exception:
+            self.close()
+            raise
+
+    def _wait(self):
+        for conn in self._conns:
+            reply = conn.recv_bytes()
+            if reply != b'K':
+                raise RuntimeError(f"DrivingEnv worker failed:\n{reply[1:].decode('utf-8')}")
+
+    def _command(self, command):
+        for conn in self._conns:
+            conn.send_bytes(command)
+        self._wait()
+
+    def _results(self, copy):
+        a = self._arrays
+        if copy:
+            return a['obs'].copy(), a['reward'].copy(), a['done'].copy()
+        return a['obs'], a['reward'], a['done']
+
+    def reset(self, copy=True):
+        self._command(b'R')
+        return self._results(copy)[0]
+
+    def step(self, actions, copy=True):
+        """
+        Step every environment; returns (obs, reward, done, info). With
+        copy=False the arrays are views of shared memory, overwritten by the
+        next call. info has each environment's score and, where done, the
+        score its episode finished on (final_score).
+        """
+        self.actions[:] = actions
+        self._command(b'S')
+        obs, reward, done = self._results(copy)
+        a = self._arrays
+        info = {'score': a['score'].copy(), 'final_score': np.where(done, a['final_score'], np.nan)}
+        return obs, reward, done, info
+
+    def close(self):
+        if self._shm is None:
+            return
+        for conn in self._conns:
+            try:
+                conn.send_bytes(b'C')
+            except (OSError, ValueError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+        self.actions = self._arrays = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,60 @@
+# fixed_step.py - Fixed-timestep accumulator with render interpolation
+
+"""
+Physics and rule checks run at a fixed rate, independent of the frame rate:
+
+    alpha = clock.advance(time.dt, step)
+
+adds the frame time to an accumulator and calls step(clock.step_dt) once
+for every whole physics step it holds (sub-stepping on slow frames, none at
+all on fast ones). The leftover fraction of a step is returned as alpha, so
+the renderer can draw previous + (current - previous) * alpha.
+
+To avoid the spiral of death (a slow frame causing more physics work,
+which makes the next frame slower still), at most max_steps are run per
+frame and any time beyond that is dropped; the game then runs slow-motion
+rather than freezing.
+"""
+
+
+# Frame times are sums of inexact floats; this much slack keeps e.g. 144 frames
+# of 1/144 s worth exactly 60 steps of 1/60 s.
+EPSILON = 1e-9
+
+
+class FixedTimestep:
+    def __init__(self, rate=60, max_steps=5):
+        self.rate = rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.steps = 0          # total physics steps taken
+        self.dropped = 0.0      # total seconds discarded by the spiral cap
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        self._rate = rate
+        self.step_dt = 1.0 / rate
+
+    def advance(self, frame_dt, step):
+        """Run the physics steps owed for frame_dt; returns the interpolation alpha."""
+        self.accumulator += max(frame_dt, 0.0)
+        taken = 0
+        while self.accumulator >= self.step_dt - EPSILON and taken < self.max_steps:
+            step(self.step_dt)
+            self.accumulator -= self.step_dt
+            taken += 1
+        if self.accumulator >= self.step_dt - EPSILON:
+            excess = self.accumulator - self.accumulator % self.step_dt
+            self.dropped += excess
+            self.accumulator -= excess
+        self.steps += taken
+        return max(self.accumulator, 0.0) / self.step_dt
+
+
+def lerp_pose(previous, current, alpha):
+    """Blend two equal-length tuples (e.g. (x, y, z, rotation_y))."""
+    return tuple(p + (c - p) * alpha for p, c in zip(previous, current))
@@ -0,0 +1,192 @@
+# frame_profiler.py - Scoped per-subsystem frame timers, overlay stats and trace export
+
+"""
+FrameProfiler times named phases of each frame ('physics', 'rules',
+'camera', 'render', ...) and keeps the samples in a fixed-size ring buffer
+of NumPy arrays, so a long session never grows memory and old frames are
+simply overwritten.
+
+    profiler.begin_frame()
+    with profiler.scope('physics'):
+        ...
+    profiler.end_frame()
+
+While disabled, scope() returns one shared no-op context manager and the
+frame calls return immediately, so instrumented code costs a method call
+per scope. The time between end_frame() and the next begin_frame() is
+recorded under begin_frame's gap name: 'render' by default (Ursina draws
+after update() returns), 'wait' for a loop that sleeps in clock.tick().
+
+stats() gives per-subsystem percentiles of the per-frame totals over the
+most recent frames (the on-screen overlays use it), and
+write_chrome_trace() dumps the buffer as Chrome trace-event JSON for
+chrome://tracing or Perfetto.
+
+Nothing here imports a game engine; both games and the headless
+simulation share it.
+"""
+
+import json
+import time
+
+import numpy as np
+
+FRAME, RENDER = 'frame', 'render'
+
+
+class _NullScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    """Reusable timer for one subsystem name."""
+    __slots__ = ('profiler', 'name_id', 'start')
+
+    def __init__(self, profiler, name_id):
+        self.profiler = profiler
+        self.name_id = name_id
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._record(self.name_id, self.start, time.perf_counter_ns())
+        return False
+
+
+class FrameProfiler:
+    def __init__(self, capacity=1 << 16, enabled=False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.names = []
+        self._ids = {}
+        self._scopes = {}
+        self._start = np.zeros(capacity, dtype=np.int64)      # ns, perf_counter_ns
+        self._duration = np.zeros(capacity, dtype=np.int64)   # ns
+        self._name = np.zeros(capacity, dtype=np.int16)
+        self._frame = np.zeros(capacity, dtype=np.int64)
+        self._head = 0          # total samples ever written
+        self.frame_index = 0
+        self._frame_start = None
+        self._frame_end = None
+        self._epoch = time.perf_counter_ns()
+
+    def _id(self, name):
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def _record(self, name_id, start, end):
+        i = self._head % self.capacity
+        self._start[i] = start
+        self._duration[i] = end - start
+        self._name[i] = name_id
+        self._frame[i] = self.frame_index
+        self._head += 1
+
+    # -- instrumentation -------------------------------------------------
+
+    def scope(self, name):
+        """Context manager timing one phase; a shared no-op while disabled."""
+        if not self.enabled:
+            return _NULL_SCOPE
+        scope = self._scopes.get(name)
+        if scope is None:
+            scope = self._scopes[name] = _Scope(self, self._id(name))
+        return scope
+
+    def begin_frame(self, gap=RENDER):
+        if not self.enabled:
+            self._frame_end = None
+            return
+        now = time.perf_counter_ns()
+        if self._frame_end is not None:
+            self._record(self._id(gap), self._frame_end, now)
+        if self._frame_start is not None:
+            self._record(self._id(FRAME), self._frame_start, now)
+            self.frame_index += 1
+        self._frame_start = now
+
+    def end_frame(self):
+        if self.enabled:
+            self._frame_end = time.perf_counter_ns()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self._frame_start = self._frame_end = None
+        return self.enabled
+
+    def clear(self):
+        self._head = 0
+
+    # -- reports ---------------------------------------------------------
+
+    def _samples(self):
+        """Buffered samples oldest first: (start, duration, name id, frame)."""
+        n = min(self._head, self.capacity)
+        order = (np.arange(self._head - n, self._head)) % self.capacity
+        return self._start[order], self._duration[order], self._name[order], self._frame[order]
+
+    def stats(self, frames=300, percentiles=(50, 95, 99)):
+        """
+        {name: {'p50': ms, 'p95': ms, 'p99': ms, 'max': ms}} of each subsystem's
+        total time per frame over the last `frames` complete frames.
+        """
+        _, duration, name, frame = self._samples()
+        last = self.frame_index - 1
+        keep = (frame <= last) & (frame > last - frames)
+        if not keep.any():
+            return {}
+        duration, name, frame = duration[keep], name[keep], frame[keep]
+        first = frame.min()
+        rows = int(last - first + 1)
+        totals = np.bincount((frame - first) * len(self.names) + name, weights=duration,
+                             minlength=rows * len(self.names)).reshape(rows, len(self.names))
+        totals /= 1e6
+        seen = np.bincount(name, minlength=len(self.names)) > 0
+        out = {}
+        for i in np.nonzero(seen)[0]:
+            values = np.percentile(totals[:, i], percentiles)
+            entry = {f'p{p}': float(v) for p, v in zip(percentiles, values)}
+            entry['max'] = float(totals[:, i].max())
+            out[self.names[i]] = entry
+        return out
+
+    def overlay_lines(self, frames=300):
+        """Text rows for an on-screen overlay, slowest subsystem (by p95) first."""
+        stats = self.stats(frames)
+        rows = sorted(stats.items(), key=lambda kv: (kv[0] != FRAME, -kv[1]['p95']))
+        lines = [f"{'ms':12s} {'p50':>6s} {'p95':>6s} {'p99':>6s} {'max':>6s}"]
+        for name, s in rows:
+            lines.append(f"{name:12s} {s['p50']:6.2f} {s['p95']:6.2f} {s['p99']:6.2f} {s['max']:6.2f}")
+        return lines
+
+    def chrome_trace(self):
+        """The buffered samples as a Chrome trace-event document (complete 'X' events)."""
+        start, duration, name, frame = self._samples()
+        events = [{'name': self.names[n], 'ph': 'X', 'pid': 1, 'tid': 1,
+                   'ts': (s - self._epoch) / 1000.0, 'dur': d / 1000.0, 'args': {'frame': f}}
+                  for s, d, n, f in zip(start.tolist(), duration.tolist(), name.tolist(), frame.tolist())]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+# A shared disabled profiler for code that is not being profiled.
+NULL_PROFILER = FrameProfiler(capacity=1)
@@ -0,0 +1,158 @@
+# hud.py - Retained-mode HUD: text widgets rebuilt only when their value changes
+
+"""
+Assigning Ursina's Text.text regenerates the text mesh and pygame's
+font.render rasterises a new surface, even when the string is the one
+already on screen. Both games set their HUD every frame, so the HUD keeps
+widgets instead:
+
+    hud.set('speed', f"Speed: {kmh} km/h")     # cheap; marks dirty on change
+    hud.flush()                                # rebuilds dirty widgets only
+
+Hud holds the widgets and their dirty flags and calls build(widget) for
+each changed one. EntityHud builds by assigning to an Ursina Text (or any
+object with .text / .color); SurfaceHud renders through a GlyphCache,
+which keeps one pygame Font per (name, size) and a bounded LRU of rendered
+surfaces, so a value that comes back (a score, "Safe" / "Wait") is
+blitted from cache instead of being rendered again.
+
+stats counts set() calls and rebuilds so the saving can be checked.
+"""
+
+from collections import OrderedDict
+
+
+class Widget:
+    __slots__ = ('name', 'text', 'color', 'visible', 'view', 'rendered', 'dirty')
+
+    def __init__(self, name, view, text, color, visible=True):
+        self.name = name
+        self.view = view            # backend data: an Entity, or SurfaceHud's (font, pos, background)
+        self.text = text
+        self.color = color
+        self.visible = visible
+        self.rendered = None        # what build() returned for the current value
+        self.dirty = True
+
+
+class Hud:
+    def __init__(self, build):
+        self.build = build
+        self.widgets = {}
+        self._dirty = []
+        self.stats = {'sets': 0, 'rebuilds': 0}
+
+    def add(self, name, view=None, text='', color=None, visible=True):
+        widget = self.widgets[name] = Widget(name, view, text, color, visible)
+        self._dirty.append(widget)
+        return widget
+
+    def set(self, name, text, color=None):
+        """Change a widget's text (and colour, if given); a no-op when nothing differs."""
+        self.stats['sets'] += 1
+        widget = self.widgets[name]
+        if color is None:
+            color = widget.color
+        if widget.text == text and widget.color == color:
+            return
+        widget.text, widget.color = text, color
+        if not widget.dirty:
+            widget.dirty = True
+            self._dirty.append(widget)
+
+    def show(self, name, visible=True):
+        widget = self.widgets[name]
+        if widget.visible != visible:
+            widget.visible = visible
+            if not widget.dirty:
+                widget.dirty = True
+                self._dirty.append(widget)
+
+    def flush(self):
+        """Rebuild the widgets changed since the last flush; returns them."""
+        changed, self._dirty = self._dirty, []
+        for widget in changed:
+            widget.rendered = self.build(widget)
+            widget.dirty = False
+        self.stats['rebuilds'] += len(changed)
+        return changed
+
+# ---------------------------------------------------------------------
+# URSINA
+# ---------------------------------------------------------------------
+
+def _build_entity_text(widget):
+    view = widget.view
+    if view.text != widget.text:
+        view.text = widget.text
+    if widget.color is not None:
+        view.color = widget.color
+    view.enabled = widget.visible
+    return view
+
+
+class EntityHud(Hud):
+    """Widgets backed by existing Ursina Text entities (hud.add(name, text_entity))."""
+    def __init__(self):
+        super().__init__(_build_entity_text)
+
+    def add(self, name, view=None, text=None, color=None, visible=True):
+        return super().add(name, view, view.text if text is None else text,
+                           view.color if color is None else color, visible)
+
+# ---------------------------------------------------------------------
+# PYGAME
+# ---------------------------------------------------------------------
+
+class GlyphCache:
+    """pygame Fonts by (name, size) and rendered text surfaces by value, LRU-bounded."""
+    def __init__(self, capacity=256):
+        import pygame
+        self._pygame = pygame
+        self.capacity = capacity
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+        self.stats = {'hits': 0, 'renders': 0}
+
+    def font(self, name, size):
+        key = (name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = self._pygame.font.SysFont(name, size)
+        return font
+
+    def render(self, font, text, color, background=None):
+        """Surface for text in font (a (name, size) pair), rendered at most once while cached."""
+        key = (font, text, color, background)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.stats['hits'] += 1
+            return surface
+        surface = self.font(*font).render(text, True, color, background)
+        self.stats['renders'] += 1
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.capacity:
+            self._surfaces.popitem(last=False)
+        return surface
+
+
+class SurfaceHud(Hud):
+    """Text widgets drawn onto a pygame surface; draw() blits the cached surfaces."""
+    def __init__(self, glyphs=None):
+        super().__init__(self._render)
+        self.glyphs = glyphs or GlyphCache()
+
+    def add(self, name, pos, font=(None, 24), text='', color=(255, 255, 255), background=None,
+            visible=True):
+        return super().add(name, (font, pos, background), text, color, visible)
+
+    def _render(self, widget):
+        font, _, background = widget.view
+        return self.glyphs.render(font, widget.text, widget.color, background)
+
+    def draw(self, surface):
+        """Flush changed widgets and blit every visible one; returns the rectangles drawn."""
+        self.flush()
+        return [surface.blit(widget.rendered, widget.view[1])
+                for widget in self.widgets.values() if widget.visible]
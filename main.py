@@ -1,8 +1,22 @@
 from ursina import *
-from math import sin, cos, radians, degrees, atan2
 import random
-import json
 import os
+import atexit
+import time as wallclock
+
+from constants import PHYSICS_HZ, MAX_SUBSTEPS
+from simulation import CityLayout, DrivingSimulation, Controls
+from traffic_signals import RED, AMBER, GREEN
+from score_store import ScoreStore
+from static_batch import StaticBatcher
+from asset_cache import assets
+from city_streaming import CityGenerator, StreamedCity, ChunkRenderer, EntityPool
+from visibility import VisibilityManager
+from fixed_step import FixedTimestep, lerp_pose
+from traffic import TrafficRenderer
+from replay import ReplayRecorder
+from frame_profiler import FrameProfiler
+from hud import EntityHud
 
 # ---------------------------------------------------------------------
 # GLOBAL CONSTANTS
@@ -14,33 +28,45 @@ CELL_SPACING = BLOCK_SIZE + ROAD_WIDTH  # Distance between parallel roads' cente
 GRID_SIZE = 2         # 2×2 blocks => 3 parallel roads in each direction.
 OFFSET = -(GRID_SIZE // 2) * CELL_SPACING  # So city is centered around (0,0).
 
-# Angle threshold (in degrees) for considering a traffic light as "in front"
-ANGLE_THRESHOLD = 15
+# Streamed procedural city instead of the fixed GRID_SIZE block.
+STREAM_CITY = False
+CITY_SEED = 0
+CHUNK_BLOCKS = 4      # Each streamed chunk is CHUNK_BLOCKS x CHUNK_BLOCKS blocks.
+
+# NPC traffic (fixed city only). Only the MAX_DRAWN_NPCS nearest are drawn.
+NPC_COUNT = 30
+MAX_DRAWN_NPCS = 200
+
+# Session recordings (fixed city only); replay them with `python replay.py FILE`.
+# Off by default; set RECORD_SESSIONS=1 in the environment to record. Only the
+# newest MAX_REPLAYS recordings are kept.
+RECORD_SESSIONS = os.environ.get('RECORD_SESSIONS', '0') == '1'
+REPLAY_DIR = 'replays'
+MAX_REPLAYS = 20
+
+# Frame profiler: F3 toggles timing and its overlay, F4 writes a Chrome trace to TRACE_DIR.
+PROFILE_ON_START = False
+TRACE_DIR = 'traces'
+profiler = FrameProfiler(enabled=PROFILE_ON_START)
+
+# Culling / level of detail (distances from the camera).
+VIEW_DISTANCE = 150   # Buildings and street furniture beyond this are hidden.
+LOD_DISTANCE = 70     # Buildings beyond this are drawn as plain boxes.
 
 # ---------------------------------------------------------------------
 # PERSISTENT SCORE HELPERS
 # ---------------------------------------------------------------------
 
 SCORE_FILE = 'score.json'
+score_store = ScoreStore(SCORE_FILE)
 
 def load_score():
-    """Load the saved score from disk, or return 100 if no file exists or on error."""
-    if os.path.exists(SCORE_FILE):
-        try:
-            with open(SCORE_FILE, 'r') as f:
-                data = json.load(f)
-                return data.get('score', 100)
-        except Exception as e:
-            print(f"Error loading score, defaulting to 100: {e}")
-    return 100
-
-def save_score(score):
-    """Write the current score to disk."""
-    try:
-        with open(SCORE_FILE, 'w') as f:
-            json.dump({'score': score}, f)
-    except Exception as e:
-        print(f"Error saving score: {e}")
+    """Load the saved score (checkpoint plus journal), or return 100 if none exists."""
+    return score_store.load()
+
+def save_score(score, delta=None):
+    """Queue the current score (and the change that led to it) for the background writer."""
+    score_store.record(score, delta)
 
 # ---------------------------------------------------------------------
 # ROAD CLASSES
@@ -81,9 +107,9 @@ class WorkInProgress(Entity):
             model='cube',
             scale=(3, 1, 0.1),
             position=(0, 1.5, 0),
-            color=color.gray,
-            texture=load_texture('work_in_progress.jpg')
+            color=color.gray
         )
+        assets.apply_sign(self.cube, 'work_in_progress.jpg')
         self.pole_left = Entity(
             parent=self.cube,
             model='cube',
@@ -103,16 +129,16 @@ class Building(Entity):
     def __init__(self, position, **kwargs):
         super().__init__(position=(position[0], 0, position[1]), **kwargs)
         base_w, base_d, base_h, roof_h = 15, 15, 20, 8
-        wall_tex = load_texture('building.jpg')
-        roof_tex = load_texture('building.jpg')
-        Entity(
+        wall_tex = assets.texture('building.jpg')
+        roof_tex = assets.texture('building.jpg')
+        self.walls = Entity(
             parent=self,
             model='cube',
             texture=wall_tex,
             scale=(base_w, base_h, base_d),
             position=(0, base_h*0.5, 0)
         )
-        Entity(
+        self.roof = Entity(
             parent=self,
             model='cone',
             texture=roof_tex,
@@ -129,62 +155,59 @@ class StopSign(Entity):
         super().__init__(position=position, rotation_y=rotation_y, **kwargs)
         Entity(parent=self, model='cube', scale=(0.1,4,0.1), color=color.black, position=(0,1,0))
         self.sign = Entity(parent=self, model='cube', scale=(1,1,0.1), color=color.white, position=(0,3.5,0))
-        self.sign.texture = load_texture('stop_sign.jpg')
+        assets.apply_sign(self.sign, 'stop_sign.jpg')
 
 class SpeedLimitSign(Entity):
     def __init__(self, position, rotation_y=0, **kwargs):
         super().__init__(position=position, rotation_y=rotation_y, **kwargs)
         Entity(parent=self, model='cube', scale=(0.1,4,0.1), color=color.black, position=(0,1,0))
         self.sign = Entity(parent=self, model='cube', scale=(1,1,0.1), color=color.red, position=(0,3.5,0))
-        self.sign.texture = load_texture('speed_limit.jpg')
+        assets.apply_sign(self.sign, 'speed_limit.jpg')
 
 class TrafficLight(Entity):
-    def __init__(self, position, rotation_y=0, light_index=0, **kwargs):
-        super().__init__(position=position, rotation_y=rotation_y, light_index=light_index, **kwargs)
+    """
+    View of one SignalController light. The controller owns the timing;
+    show() is only called when the light's colour actually changes.
+    """
+    def __init__(self, signals, light_id, placement, **kwargs):
+        super().__init__(position=placement.position, rotation_y=placement.rotation_y, **kwargs)
+        self.signals = signals
+        self.light_id = light_id
         Entity(parent=self, model='cylinder', scale=(1,8,1), color=color.gray, position=(0,4,0))
         self.box = Entity(parent=self, model='cube', scale=(0.5,1,0.5), color=color.dark_gray, position=(0,7.5,0))
-        self.red_light = Entity(parent=self.box, model='sphere', scale=0.4, color=color.rgb(50,0,0), position=(0,0.2,0.6))
-        self.green_light = Entity(parent=self.box, model='sphere', scale=0.4, color=color.rgb(0,50,0), position=(0,-0.2,0.6))
-        self.time_elapsed = 0
-
-    def update(self):
-        self.time_elapsed += time.dt
-        if self.time_elapsed >= 20:
-            self.time_elapsed = 0
-            if self.light_index == 0:
-                self.light_index = 1
-                # When switching to red:
-                self.red_light.color = color.rgb(255,0,0)
-                self.green_light.color = color.rgb(0,50,0)
-            else:
-                self.light_index = 0
-                # When switching to green:
-                self.red_light.color = color.rgb(50,0,0)
-                self.green_light.color = color.rgb(0,255,0)
+        self.red_light = Entity(parent=self.box, model='sphere', scale=0.3, color=color.rgb(50,0,0), position=(0,0.3,0.6))
+        self.amber_light = Entity(parent=self.box, model='sphere', scale=0.3, color=color.rgb(50,35,0), position=(0,0,0.6))
+        self.green_light = Entity(parent=self.box, model='sphere', scale=0.3, color=color.rgb(0,50,0), position=(0,-0.3,0.6))
+
+    def show(self, state):
+        self.red_light.color = color.rgb(255,0,0) if state == RED else color.rgb(50,0,0)
+        self.amber_light.color = color.rgb(255,180,0) if state == AMBER else color.rgb(50,35,0)
+        self.green_light.color = color.rgb(0,255,0) if state == GREEN else color.rgb(0,50,0)
 
     def is_red(self):
         """Returns True if the traffic light is red."""
-        return self.light_index == 1
+        return self.signals.is_red(self.light_id)
 
 # ---------------------------------------------------------------------
 # CAR
 # ---------------------------------------------------------------------
 
 class Car(Entity):
-    def __init__(self, roads, initial_score=100, **kwargs):
+    """
+    View of the simulated car. The DrivingSimulation owns kinematics, rules
+    and scoring; this Entity only mirrors its state and drives the HUD.
+    """
+    def __init__(self, sim, **kwargs):
+        state = sim.car
         super().__init__(
             model='cube',
             scale=(1.5, 0.5, 3),
             color=color.rgb(220,20,60),
-            position=(OFFSET + 1 * CELL_SPACING, 0.3, OFFSET + ROAD_WIDTH * 0.35),
-            rotation_y=90,
+            position=state.position,
+            rotation_y=state.rotation_y,
             **kwargs
         )
-        self.roads = roads
-        self.speed = 0
-        self.acceleration = 1
-        self.max_speed = 5
-        self.turn_speed = 100
+        self.sim = sim
         self.create_wheels()
 
         self.speedometer = Text(
@@ -197,10 +220,8 @@ class Car(Entity):
             background_color=color.black66
         )
 
-        # initialize persistent score
-        self.player_score_value = initial_score
         self.player_score = Text(
-            text=f"SCORE {self.player_score_value}",
+            text=f"SCORE {sim.score}",
             position=(0.6, 0.4),
             origin=(0, 0),
             scale=1.5,
@@ -208,10 +229,16 @@ class Car(Entity):
             background=True,
             background_color=color.black10
         )
+        sim.on_score_change = self.on_score_change
 
-        self.penalty_timer = 0
-        self.work_penalty_timer = 0
-        self.traffic_penalty_timer = 0  # timer for traffic light rule
+        # Text meshes are rebuilt only when a value changes (see hud.py).
+        self.hud = EntityHud()
+        self.hud.add('speed', self.speedometer)
+        self.hud.add('score', self.player_score)
+        for name, text in (('speed_warning', speed_warning), ('work_warning', work_warning),
+                           ('traffic_warning', traffic_warning),
+                           ('collision_warning', collision_warning)):
+            self.hud.add(name, text)
 
     def create_wheels(self):
         front_z, back_z = 1.5, -1.5
@@ -223,230 +250,206 @@ class Car(Entity):
             Entity(parent=self, model='cylinder', scale=(wheel_w, wheel_r * 2, wheel_r * 2),
                    color=color.black, position=pos, rotation=(0, 0, 90))
 
-    def change_score(self, delta):
-        self.player_score_value += delta
-        self.player_score.text = f"SCORE {self.player_score_value}"
-        save_score(self.player_score_value)
-
-    def update(self):
-        dt = time.dt
-        # Acceleration / braking
-        if held_keys['w']:
-            self.speed += self.acceleration * dt
-        elif held_keys['s']:
-            self.speed -= self.acceleration * dt
-        else:
-            self.speed = lerp(self.speed, 0, 1 * dt)
-        if held_keys['space']:
-            self.speed = lerp(self.speed, 0, 10 * dt)
-        self.speed = clamp(self.speed, -self.max_speed / 2, self.max_speed)
-
-        speed_kmh = abs(round(self.speed * 12))
-        self.speedometer.text = f"Speed: {speed_kmh} km/h"
-
-        # Steering
-        direction = (-1 if held_keys['a'] else 1) if held_keys['d'] or held_keys['a'] else 0
-        turn_amount = direction * self.turn_speed * dt * (abs(self.speed) / self.max_speed)
-        self.rotation_y += turn_amount
-
-        # Movement
-        new_pos = self.position + self.forward * self.speed * dt
-        if is_on_road(new_pos, self.roads):
-            self.position = new_pos
-        else:
-            self.speed = 0
-
-        # Speed limit check
-        if abs(distance(self.position, speed_limit_signs[0].position)) < 15:
-            if speed_kmh > 30:
-                speed_warning.text = "Speed limit 30, do not exceed!"
-                speed_warning.color = color.red
-                self.penalty_timer += dt
-                if self.penalty_timer >= 1:
-                    self.change_score(-1)
-                    self.penalty_timer = 0
-            else:
-                speed_warning.text = "Good job! Following speed limit!"
-                speed_warning.color = color.green
-                self.penalty_timer += dt
-                if self.penalty_timer >= 1:
-                    self.change_score(+1)
-                    self.penalty_timer = 0
-        else:
-            speed_warning.text = ""
-            self.penalty_timer = 0
-
-        # Work in progress / stop sign check
-        for sign in stop_signs:
-            if abs(distance(self.position, sign.position)) < 15:
-                work_warning.text = "STOP: Work In Progress"
-                self.work_penalty_timer += dt
-                if self.work_penalty_timer >= 1:
-                    self.change_score(-1)
-                    self.work_penalty_timer = 0
-                break
-        else:
-            work_warning.text = ""
-            self.work_penalty_timer = 0
-
-        # Traffic light check using a cone-of-vision approach.
-        # Compute the vector to the light.
-        traffic_found = False
-        for light in traffic_lights:
-            to_light = light.position - self.position
-            # Only consider if the light is in front of the car.
-            forward_distance = self.forward.dot(to_light)
-            if forward_distance <= 0 or to_light.length() >= 15:
-                continue
-
-            # Compute the lateral distance in the car's local coordinates.
-            # Compute the right vector as perpendicular to forward in the xz-plane.
-            right_vector = Vec3(self.forward.z, 0, -self.forward.x)
-            lateral_distance = abs(right_vector.dot(to_light))
-            
-            # Alternatively compute the angle between forward and to_light.
-            angle = degrees(atan2(lateral_distance, forward_distance))
-            
-            if angle < ANGLE_THRESHOLD:
-                traffic_found = True
-                if light.is_red():
-                    # At red light, the car should be nearly stopped.
-                    if speed_kmh > 1:
-                        traffic_warning.text = "Red Light! Stop the car!"
-                        traffic_warning.color = color.red
-                        self.traffic_penalty_timer += dt
-                        if self.traffic_penalty_timer >= 1:
-                            self.change_score(-1)
-                            self.traffic_penalty_timer = 0
-                    else:
-                        traffic_warning.text = "Stopped at red light, good job!"
-                        traffic_warning.color = color.green
-                        self.traffic_penalty_timer += dt
-                        if self.traffic_penalty_timer >= 1:
-                            self.change_score(+1)
-                            self.traffic_penalty_timer = 0
-                else:
-                    # At green light, the car should be moving.
-                    if speed_kmh > 1:
-                        traffic_warning.text = "Green Light! Keep going!"
-                        traffic_warning.color = color.green
-                        self.traffic_penalty_timer += dt
-                        if self.traffic_penalty_timer >= 1:
-                            self.change_score(+1)
-                            self.traffic_penalty_timer = 0
-                    else:
-                        traffic_warning.text = "Green Light! You should move!"
-                        traffic_warning.color = color.red
-                        self.traffic_penalty_timer += dt
-                        if self.traffic_penalty_timer >= 1:
-                            self.change_score(-1)
-                            self.traffic_penalty_timer = 0
-                break
-        if not traffic_found:
-            traffic_warning.text = ""
-            self.traffic_penalty_timer = 0
+    def on_score_change(self, score, delta):
+        self.hud.set('score', f"SCORE {score}")
+        save_score(score, delta)
+
+    def sync(self, alpha=1.0):
+        """Mirror the simulation, blending the last two physics states by alpha."""
+        state = self.sim.car
+        x, y, z, rotation_y = lerp_pose(self.sim.previous_pose, state.pose, alpha)
+        self.position = (x, y, z)
+        self.rotation_y = rotation_y
+        hud = self.hud
+        hud.set('speed', f"Speed: {state.speed_kmh} km/h")
+        for name, notice in (('speed_warning', self.sim.speed_warning),
+                             ('work_warning', self.sim.work_warning),
+                             ('traffic_warning', self.sim.traffic_warning),
+                             ('collision_warning', self.sim.collision_warning)):
+            hud.set(name, notice.text, color.red if notice.color == 'red' else color.green)
+        hud.flush()
 
 # ---------------------------------------------------------------------
 # HELPERS & CITY SETUP
 # ---------------------------------------------------------------------
 
-def is_on_road(pos, roads):
-    return any(r.contains_point(pos) for r in roads)
-
 def create_crossing_stripes(x, z, orientation, num_stripes=7, stripe_thickness=1, gap=0.5):
     total_length = num_stripes * stripe_thickness + (num_stripes - 1) * gap
     start = -total_length / 2 + stripe_thickness / 2
     if orientation == 'horizontal':
-        for i in range(num_stripes):
-            Entity(model='quad', scale=(3, stripe_thickness),
-                   position=(x, 0.03, z + start + i * (stripe_thickness + gap)),
-                   rotation_x=90, color=color.white)
-    else:
-        for i in range(num_stripes):
-            Entity(model='quad', scale=(stripe_thickness, 3),
+        return [Entity(model='quad', scale=(3, stripe_thickness),
+                       position=(x, 0.03, z + start + i * (stripe_thickness + gap)),
+                       rotation_x=90, color=color.white)
+                for i in range(num_stripes)]
+    return [Entity(model='quad', scale=(stripe_thickness, 3),
                    position=(x + start + i * (stripe_thickness + gap), 0.03, z),
                    rotation_x=90, color=color.white)
+            for i in range(num_stripes)]
+
+def create_sign(placement):
+    """Build the sign Entity for a layout Placement."""
+    cls = {'stop': StopSign, 'work': WorkInProgress, 'speed_limit': SpeedLimitSign}[placement.kind]
+    return cls(position=placement.position, rotation_y=placement.rotation_y)
+
+def create_city(layout, sim):
+    """
+    Instantiate Entities for every element of the layout; returns the traffic light views.
+    Roads and crosswalk stripes are merged into one mesh per material; buildings
+    are merged per city cell, with a box impostor per cell for distant views.
+    Buildings, signs and lights are registered with the global visibility manager.
+    """
+    global static_geometry, building_geometry, visibility
+    static_geometry = StaticBatcher()
+    building_geometry = StaticBatcher(tile_size=CELL_SPACING)
+    impostor_geometry = StaticBatcher(tile_size=CELL_SPACING)
+    for road in layout.roads:
+        static_geometry.add(RoadSegment(center=road.center, size=road.size), tag='road')
+    for bx, bz in layout.buildings:
+        building = Building(position=(bx, bz))
+        impostor_geometry.add(Entity(model='cube', color=color.rgb(110, 100, 95),
+                                     position=building.walls.world_position,
+                                     scale=building.walls.scale), tag='building')
+        building_geometry.add_tree(building, tag='building')
+    for x, z, orientation in layout.crosswalks:
+        for stripe in create_crossing_stripes(x, z, orientation):
+            static_geometry.add(stripe, tag='crosswalk')
+    static_geometry.build()
+    building_geometry.build()
+    impostor_geometry.build()
 
-def create_center_crosswalks():
-    cx = OFFSET + CELL_SPACING
-    cz = OFFSET + CELL_SPACING
-    off = ROAD_WIDTH - 1.5
-    create_crossing_stripes(cx, cz + off, 'vertical')
-    create_crossing_stripes(cx, cz - off, 'vertical')
-    create_crossing_stripes(cx + off, cz, 'horizontal')
-    create_crossing_stripes(cx - off, cz, 'horizontal')
-
-def create_traffic_lights():
-    lights = []
-    cx, cz = OFFSET + CELL_SPACING, OFFSET + CELL_SPACING
-    lights.append(TrafficLight(position=(cx + ROAD_WIDTH / 2, -3, cz), rotation_y=90, light_index=0))
-    lights.append(TrafficLight(position=(cx, -3, cz + ROAD_WIDTH / 2), rotation_y=0, light_index=1))
-    lights.append(TrafficLight(position=(cx - ROAD_WIDTH / 2, -3, cz), rotation_y=-90, light_index=1))
-    lights.append(TrafficLight(position=(cx, -3, cz - ROAD_WIDTH / 2), rotation_y=180, light_index=0))
-    return lights
-
-def create_speed_limit_signs():
-    return [ SpeedLimitSign(position=(OFFSET - ROAD_WIDTH * 0.4, 0, OFFSET + CELL_SPACING)) ]
-
-def create_stop_signs():
-    lst = []
-    lst.append(StopSign(position=(OFFSET - 2 + 2 * CELL_SPACING, 0, OFFSET + 2 * CELL_SPACING), rotation_y=90))
-    lst.append(StopSign(position=(OFFSET + 2 * CELL_SPACING, 0, OFFSET - 2 + 0 * CELL_SPACING), rotation_y=90))
-    lst.append(WorkInProgress(position=(OFFSET + 2 * CELL_SPACING, 0, OFFSET + CELL_SPACING), rotation_y=90))
-    return lst
-
-def create_city():
-    for j in range(GRID_SIZE + 1):
-        z = OFFSET + j * CELL_SPACING
-        roads.append(RoadSegment(center=(0, z), size=(GRID_SIZE * CELL_SPACING, ROAD_WIDTH)))
-    for i in range(GRID_SIZE + 1):
-        x = OFFSET + i * CELL_SPACING
-        roads.append(RoadSegment(center=(x, 0), size=(ROAD_WIDTH, GRID_SIZE * CELL_SPACING)))
-    for i in range(GRID_SIZE):
-        for j in range(GRID_SIZE):
-            bx = OFFSET + i * CELL_SPACING + CELL_SPACING * 0.5
-            bz = OFFSET + j * CELL_SPACING + CELL_SPACING * 0.5
-            Building(position=(bx, bz))
-    create_center_crosswalks()
     global speed_limit_signs, stop_signs
-    speed_limit_signs = create_speed_limit_signs()
-    stop_signs = create_stop_signs()
-    return create_traffic_lights()
+    speed_limit_signs = [create_sign(p) for p in layout.speed_limit_signs]
+    stop_signs = [create_sign(p) for p in layout.stop_signs]
+    lights = [TrafficLight(sim.signals, i, p) for i, p in enumerate(layout.traffic_lights)]
+
+    visibility = VisibilityManager(cell_size=CELL_SPACING, view_radius=VIEW_DISTANCE,
+                                   lod_radius=LOD_DISTANCE)
+    visibility.add_batches(building_geometry, impostors=impostor_geometry)
+    for sign in speed_limit_signs + stop_signs:
+        visibility.add(sign, radius=2)
+    for light in lights:
+        visibility.add(light, radius=2)
+    return lights
 
 # ---------------------------------------------------------------------
 # MAIN APP
 # ---------------------------------------------------------------------
 
-app = Ursina()
-window.color = color.black
-from ursina.prefabs.sky import Sky
-Sky(color=color.rgb(80, 160, 255))
-AmbientLight(color=color.rgb(180,180,180))
-DirectionalLight(direction=(1,-1,1), color=color.white)
-
-ground = Entity(
-    model='cube', scale=(100,1,100), position=(0,-0.5,0),
-    color=color.rgb(40,40,40), texture='white_cube', texture_scale=(50,50)
-)
-
-roads = []
-traffic_lights = create_city()
-
-# Warning texts for various checks:
-speed_warning = Text(text="", position=(0,0.2), scale=2, color=color.red, origin=(0,0))
-work_warning  = Text(text="", position=(0,0.4), scale=2, color=color.red, origin=(0,0))
-traffic_warning = Text(text="", position=(0,-0.2), scale=2, color=color.red, origin=(0,0))
-
-# Load persistent score (or default to 100)
-starting_score = load_score()
-car = Car(roads=roads, initial_score=starting_score)
+def save_replay(recorder, path):
+    """Write the session recording, then delete all but the newest MAX_REPLAYS."""
+    recorder.save(path)
+    sessions = sorted(name for name in os.listdir(REPLAY_DIR)
+                      if name.startswith('session-') and name.endswith('.replay'))
+    for name in sessions[:-MAX_REPLAYS]:
+        os.remove(os.path.join(REPLAY_DIR, name))
+
+def create_streamed_city():
+    """A chunk-streamed city drawn with pooled Entities; returns the StreamedCity."""
+    chunks = (2 * 2 + 1) ** 2   # keep_radius 2
+    blocks = chunks * CHUNK_BLOCKS ** 2
+    pools = {
+        'road': EntityPool(lambda: RoadSegment(center=(0, 0), size=(1, 1)), prewarm=chunks * CHUNK_BLOCKS * 2),
+        'building': EntityPool(lambda: Building(position=(0, 0)), prewarm=blocks),
+        'stop': EntityPool(lambda: StopSign(position=(0, 0, 0)), prewarm=blocks // 8),
+        'speed_limit': EntityPool(lambda: SpeedLimitSign(position=(0, 0, 0)), prewarm=blocks // 16),
+    }
+    return StreamedCity(CityGenerator(CITY_SEED, CHUNK_BLOCKS, BLOCK_SIZE, ROAD_WIDTH),
+                        radius=1, keep_radius=2, renderer=ChunkRenderer(pools))
+
+def create_traffic_view(sim):
+    """Pooled Entities for the NPC fleet, or None without one."""
+    if sim.traffic is None:
+        return None
+    palette = [color.azure, color.orange, color.lime, color.violet, color.yellow, color.white]
+    pool = EntityPool(lambda: Entity(model='cube', scale=(1.5, 0.8, 3.5), y=0.4,
+                                     color=random.choice(palette)),
+                      prewarm=min(MAX_DRAWN_NPCS, len(sim.traffic)))
+    return TrafficRenderer(sim.traffic, pool, MAX_DRAWN_NPCS)
 
 def update():
-    car.update()
-    for light in traffic_lights:
-        light.update()
-    offset = car.forward * -5 + Vec3(0,3,0)
-    camera.position = car.position + offset
-    camera.look_at(car.position + car.forward * 10)
-
-app.run()
+    profiler.begin_frame()
+    controls = Controls.from_keys(held_keys)
+    step = recorder.step if recorder else sim.step
+    with profiler.scope('simulation'):
+        alpha = physics_clock.advance(time.dt, lambda dt: step(controls, dt))
+    if STREAM_CITY:
+        with profiler.scope('streaming'):
+            layout.update(sim.car.x, sim.car.z)
+            layout.poll()
+            ground.position = (sim.car.x, -0.5, sim.car.z)
+    with profiler.scope('views'):
+        car.sync(alpha)
+        if traffic_view:
+            traffic_view.sync(car.x, car.z, alpha)
+    with profiler.scope('lights'):
+        for i in sim.signals.pop_changes():
+            traffic_lights[i].show(sim.signals.color(i))
+    with profiler.scope('camera'):
+        offset = car.forward * -5 + Vec3(0,3,0)
+        camera.position = car.position + offset
+        camera.look_at(car.position + car.forward * 10)
+    if visibility:
+        with profiler.scope('culling'):
+            p, f = camera.world_position, camera.forward
+            visibility.update(p.x, p.z, f.x, f.z)
+    if profiler.enabled and profiler.frame_index % 30 == 0:
+        profile_overlay.text = '\n'.join(profiler.overlay_lines())
+    profiler.end_frame()
+
+def input(key):
+    if key == 'f3':
+        profile_overlay.enabled = profiler.toggle()
+    elif key == 'f4':
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = profiler.write_chrome_trace(
+            os.path.join(TRACE_DIR, wallclock.strftime('trace-%Y%m%d-%H%M%S.json')))
+        print(f"Wrote frame trace to {path}")
+
+if __name__ == '__main__':
+    app = Ursina()
+    window.color = color.black
+    assets.preload()
+    from ursina.prefabs.sky import Sky
+    Sky(color=color.rgb(80, 160, 255))
+    AmbientLight(color=color.rgb(180,180,180))
+    DirectionalLight(direction=(1,-1,1), color=color.white)
+
+    ground = Entity(
+        model='cube', scale=(100,1,100), position=(0,-0.5,0),
+        color=color.rgb(40,40,40), texture='white_cube', texture_scale=(50,50)
+    )
+
+    # Load persistent score (or default to 100) and build the headless model.
+    if STREAM_CITY:
+        layout = create_streamed_city()
+        sim = DrivingSimulation(layout, initial_score=load_score(), profiler=profiler)
+        layout.attach(sim)
+        layout.update(sim.car.x, sim.car.z, wait=True)
+        traffic_lights = []
+        visibility = None
+    else:
+        layout = CityLayout(GRID_SIZE, BLOCK_SIZE, ROAD_WIDTH)
+        sim = DrivingSimulation(layout, initial_score=load_score(), npc_count=NPC_COUNT,
+                                profiler=profiler)
+        traffic_lights = create_city(layout, sim)
+    traffic_view = create_traffic_view(sim)
+    recorder = None
+    if RECORD_SESSIONS and not STREAM_CITY:
+        recorder = ReplayRecorder(sim)
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        replay_path = os.path.join(REPLAY_DIR, wallclock.strftime('session-%Y%m%d-%H%M%S.replay'))
+        atexit.register(save_replay, recorder, replay_path)
+
+    # Warning texts for various checks:
+    speed_warning = Text(text="", position=(0,0.2), scale=2, color=color.red, origin=(0,0))
+    work_warning  = Text(text="", position=(0,0.4), scale=2, color=color.red, origin=(0,0))
+    traffic_warning = Text(text="", position=(0,-0.2), scale=2, color=color.red, origin=(0,0))
+    collision_warning = Text(text="", position=(0,0.3), scale=2, color=color.red, origin=(0,0))
+    profile_overlay = Text(text="", position=(-0.85, 0.45), scale=0.8, color=color.white,
+                           background=True, enabled=profiler.enabled)
+
+    car = Car(sim)
+    physics_clock = FixedTimestep(PHYSICS_HZ, MAX_SUBSTEPS)
+
+    app.run()
+    score_store.close()
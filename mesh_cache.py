@@ -0,0 +1,224 @@
+# mesh_cache.py - Compile OBJ models to a memory-mappable binary cache
+
+"""
+Parsing TeslaTruck.obj (60k lines of text) on every launch is slow, so OBJ
+files are compiled once into a compact binary file holding NumPy arrays:
+
+    positions  float32 (N, 3)
+    normals    float32 (N, 3)
+    uvs        float32 (N, 2)
+    indices    uint32  (M,)     three per triangle
+
+Vertices are de-duplicated per unique v/vt/vn corner, x is mirrored for
+Ursina's left-handed axes (as Ursina's own OBJ importer does), and
+polygons are fan-triangulated. Compiled files live in .mesh_cache/ and
+carry the SHA-1 of their source, so editing the OBJ invalidates them.
+
+load_mesh() memory-maps the arrays and copies them straight into a Panda3D
+vertex buffer, skipping Ursina's per-vertex Mesh.generate() loop.
+
+Precompile from the command line with:  python mesh_cache.py TeslaTruck.obj
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'TSMESH01'
+ALIGN = 16
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mesh_cache')
+
+
+class MeshArrays:
+    """Read-only (memory-mapped) arrays for one compiled mesh."""
+    __slots__ = ('positions', 'normals', 'uvs', 'indices', 'source_sha1')
+
+    def __init__(self, positions, normals, uvs, indices, source_sha1):
+        self.positions = positions
+        self.normals = normals
+        self.uvs = uvs
+        self.indices = indices
+        self.source_sha1 = source_sha1
+
+    @property
+    def triangle_count(self):
+        return len(self.indices) // 3
+
+# ---------------------------------------------------------------------
+# OBJ PARSING
+# ---------------------------------------------------------------------
+
+def _resolve(index, count):
+    """OBJ indices are 1-based; negative ones count back from the end."""
+    i = int(index)
+    return i - 1 if i > 0 else count + i
+
+
+def parse_obj(path):
+    """Parse an OBJ file into (positions, normals, uvs, indices) arrays."""
+    positions, normals, uvs = [], [], []
+    corners = {}
+    out_v, out_n, out_t, indices = [], [], [], []
+
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('v '):
+                positions.append([float(p) for p in line.split()[1:4]])
+            elif line.startswith('vn '):
+                normals.append([float(p) for p in line.split()[1:4]])
+            elif line.startswith('vt '):
+                uvs.append([float(p) for p in line.split()[1:3]])
+            elif line.startswith('f '):
+                face = []
+                for corner in line.split()[1:]:
+                    idx = corners.get(corner)
+                    if idx is None:
+                        parts = corner.split('/')
+                        vi = _resolve(parts[0], len(positions))
+                        ti = _resolve(parts[1], len(uvs)) if len(parts) > 1 and parts[1] else -1
+                        ni = _resolve(parts[2], len(normals)) if len(parts) > 2 and parts[2] else -1
+                        idx = corners[corner] = len(out_v)
+                        out_v.append(vi)
+                        out_t.append(ti)
+                        out_n.append(ni)
+                    face.append(idx)
+                for k in range(1, len(face) - 1):
+                    indices.extend((face[0], face[k], face[k + 1]))
+
+    pos = np.asarray(positions, dtype=np.float32).reshape(-1, 3)[out_v]
+    pos[:, 0] *= -1
+
+    nrm = np.zeros((len(out_v), 3), dtype=np.float32)
+    if normals:
+        src = np.asarray(normals, dtype=np.float32)
+        n_idx = np.asarray(out_n)
+        has = n_idx >= 0
+        nrm[has] = src[n_idx[has]]
+        nrm[:, 0] *= -1
+
+    tex = np.zeros((len(out_v), 2), dtype=np.float32)
+    if uvs:
+        src = np.asarray(uvs, dtype=np.float32)
+        t_idx = np.asarray(out_t)
+        has = t_idx >= 0
+        tex[has] = src[t_idx[has]]
+
+    return pos, nrm, tex, np.asarray(indices, dtype=np.uint32)
+
+# ---------------------------------------------------------------------
+# BINARY FORMAT
+# ---------------------------------------------------------------------
+
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(obj_path, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(obj_path))[0] + '.tsmesh')
+
+
+def compile_obj(obj_path, out_path=None, source_sha1=None):
+    """Parse obj_path and write the binary cache file; returns its path."""
+    out_path = out_path or cache_path(obj_path)
+    arrays = dict(zip(('positions', 'normals', 'uvs', 'indices'), parse_obj(obj_path)))
+
+    layout, offset = {}, 0
+    for name, arr in arrays.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        layout[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset += arr.nbytes
+    header = json.dumps({'source_sha1': source_sha1 or _sha1(obj_path), 'arrays': layout}).encode()
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGN) * ALIGN
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp = out_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compiled mesh")
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+    data_start = -(-(len(MAGIC) + 4 + length) // ALIGN) * ALIGN
+    return header, data_start
+
+
+def load_mesh_arrays(obj_path, cache_dir=CACHE_DIR):
+    """
+    Memory-map the compiled arrays for obj_path, compiling first if the
+    cache is missing or was built from a different version of the file.
+    """
+    source_sha1 = _sha1(obj_path)
+    path = cache_path(obj_path, cache_dir)
+    header = None
+    if os.path.exists(path):
+        try:
+            header, data_start = _read_header(path)
+        except Exception as e:
+            print(f"Error reading mesh cache {path}, recompiling: {e}")
+    if header is None or header['source_sha1'] != source_sha1:
+        compile_obj(obj_path, path, source_sha1)
+        header, data_start = _read_header(path)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        if not np.prod(shape):
+            arrays[name] = np.zeros(shape, dtype=spec['dtype'])
+            continue
+        arrays[name] = np.memmap(path, dtype=spec['dtype'], mode='r',
+                                 offset=data_start + spec['offset'], shape=shape)
+    return MeshArrays(source_sha1=source_sha1, **arrays)
+
+# ---------------------------------------------------------------------
+# URSINA / PANDA3D
+# ---------------------------------------------------------------------
+
+def load_mesh(obj_path, cache_dir=CACHE_DIR):
+    """A NodePath usable as Entity(model=...), built from the cached arrays."""
+    from panda3d.core import (Geom, GeomNode, GeomTriangles, GeomVertexData,
+                              GeomVertexFormat, GeomEnums, NodePath)
+
+    arrays = load_mesh_arrays(obj_path, cache_dir)
+    n = len(arrays.positions)
+    interleaved = np.empty((n, 8), dtype=np.float32)
+    interleaved[:, 0:3] = arrays.positions
+    interleaved[:, 3:6] = arrays.normals
+    interleaved[:, 6:8] = arrays.uvs
+
+    vdata = GeomVertexData('mesh', GeomVertexFormat.getV3n3t2(), Geom.UHStatic)
+    vdata.uncleanSetNumRows(n)
+    memoryview(vdata.modifyArray(0)).cast('B')[:] = interleaved.tobytes()
+
+    tris = GeomTriangles(Geom.UHStatic)
+    tris.setIndexType(GeomEnums.NT_uint32)
+    handle = tris.modifyVertices()
+    handle.uncleanSetNumRows(len(arrays.indices))
+    memoryview(handle).cast('B')[:] = np.ascontiguousarray(arrays.indices).tobytes()
+
+    geom = Geom(vdata)
+    geom.addPrimitive(tris)
+    node = GeomNode(os.path.basename(obj_path))
+    node.addGeom(geom)
+    return NodePath(node)
+
+
+if __name__ == '__main__':
+    for obj in sys.argv[1:]:
+        print('compiled', obj, '->', compile_obj(obj))
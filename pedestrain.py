@@ -1,15 +1,44 @@
-import pygame, random, sys
+import pygame, random, sys, os, time, argparse
+import numpy as np
+
+from frame_profiler import FrameProfiler
+from hud import SurfaceHud, GlyphCache
+from fixed_step import FixedTimestep
+from crowd import Crowd
+from crossing_rules import (WIDTH, HEIGHT, ROAD_TOP, ROAD_BOTTOM, SIDEWALK_HEIGHT, CROSSING,
+                            PLAYER_SIZE, PLAYER_SPEED, PLAYER_START, GOAL_Y,
+                            CAR_WIDTH, CAR_HEIGHT, CAR_SPEED, CAR_LANES, SPAWN_INTERVAL,
+                            LOGIC_HZ, SIGNAL_DURATION, HIT_PENALTY, ARRIVAL_BONUS,
+                            SAFE_CROSSING_POINTS, JAYWALK_PENALTY, SCORE_INTERVAL)
+
+# With SDL's dummy video driver there is no window to pace: main() runs the
+# game logic uncapped (see run_headless), e.g. for automated level tests.
+HEADLESS = os.environ.get('SDL_VIDEODRIVER') == 'dummy'
+if HEADLESS:
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
 
 # Initialize pygame and mixer for audio
 pygame.init()
 pygame.mixer.init()
 clock = pygame.time.Clock()
 
-# Screen dimensions
-WIDTH, HEIGHT = 1000, 700
+# Screen dimensions (WIDTH, HEIGHT) and the game rules are in crossing_rules.py
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("AAA Pedestrian Crossing Game")
 
+# Software rendering: the static scene is drawn once (SceneRenderer). With
+# DIRTY_RECTS only the regions that changed are pushed to the display, which
+# is what keeps low-end machines without GPU acceleration at frame rate.
+# F2 switches between the two modes while playing.
+DIRTY_RECTS = False
+
+# Frame profiler: F3 toggles timing and its overlay, F4 writes a Chrome trace to TRACE_DIR.
+TRACE_DIR = 'traces'
+profiler = FrameProfiler()
+
+# Fonts and rendered text are cached here and shared by every HUD.
+glyphs = GlyphCache()
+
 # Colors can now be part of an asset manager if needed
 WHITE = (255, 255, 255)
 SKY_BLUE = (135, 206, 235)
@@ -20,11 +49,13 @@ GREEN = (50, 205, 50)
 DARK_GRAY = (30, 30, 30)
 
 # Game constants
-ROAD_TOP = HEIGHT // 2 - 120
-ROAD_BOTTOM = HEIGHT // 2 + 120
-SIDEWALK_HEIGHT = 60
-PLAYER_SIZE = 40
-PLAYER_SPEED = 5
+MAX_LOGIC_STEPS = 5         # Logic ticks per rendered frame before time is dropped
+FPS = 60
+MAX_CARS = 1024             # CarPool capacity; spawns are dropped while it is full
+SPRITE_KEY = (255, 0, 255)  # Transparent colour key of pre-rendered sprites
+CROWD_SIZE = 60             # NPC pedestrians kept on screen (see crowd.py)
+NPC_RADIUS = 8
+NPC_COLOR = (230, 120, 40)
 
 # Asset loading (placeholders)
 # Example: load high-res assets, animations, and sound effects here
@@ -35,7 +66,7 @@ PLAYER_SPEED = 5
 
 class Player:
     def __init__(self):
-        self.rect = pygame.Rect(WIDTH//2 - PLAYER_SIZE//2, ROAD_BOTTOM + SIDEWALK_HEIGHT + 10, PLAYER_SIZE, PLAYER_SIZE)
+        self.rect = pygame.Rect(*PLAYER_START, PLAYER_SIZE, PLAYER_SIZE)
         self.speed = PLAYER_SPEED
         self.score = 0
         # Animation frames, state, etc. can be added here
@@ -55,46 +86,131 @@ class Player:
         self.rect.y = max(0, min(HEIGHT - self.rect.height, self.rect.y))
 
     def draw(self, surface):
-        pygame.draw.rect(surface, (0, 102, 204), self.rect, border_radius=8)
         # In the AAA version, you would render an animated sprite here
+        return pygame.draw.rect(surface, (0, 102, 204), self.rect, border_radius=8)
 
-class Car:
-    def __init__(self):
-        self.width = 80
-        self.height = 40
-        lane_y_options = [ROAD_TOP + 20, ROAD_BOTTOM - self.height - 20]
-        self.rect = pygame.Rect(-self.width, random.choice(lane_y_options), self.width, self.height)
-        self.speed = 4
+class CarPool:
+    """
+    Every car on the road as fixed-capacity NumPy arrays (x, y, width,
+    height, speed, lane) plus an active mask. Spawning fills a free slot,
+    and movement, despawning and the player-overlap test are each one
+    vectorized operation into preallocated buffers, so a frame allocates
+    nothing however many cars there are. draw() blits one pre-rendered
+    sprite per car size in a single Surface.blits call.
+    """
+    def __init__(self, capacity=MAX_CARS):
+        self.capacity = capacity
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.width = np.zeros(capacity, dtype=np.int32)
+        self.height = np.zeros(capacity, dtype=np.int32)
+        self.speed = np.zeros(capacity, dtype=np.int32)
+        self.lane = np.zeros(capacity, dtype=np.int8)
+        self.active = np.zeros(capacity, dtype=bool)
+        self._hit = np.zeros(capacity, dtype=bool)
+        self._test = np.zeros(capacity, dtype=bool)
+        self._edge = np.zeros(capacity, dtype=np.int32)
+        self._sprites = {}          # (width, height) -> pre-rendered car surface
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def spawn(self, lane=None, x=None, width=CAR_WIDTH, height=CAR_HEIGHT, speed=CAR_SPEED):
+        """Add a car entering from the left (or at x); returns its slot, or -1 if full."""
+        slot = int(np.argmin(self.active))
+        if self.active[slot]:
+            return -1
+        if lane is None:
+            lane = random.randrange(len(CAR_LANES))
+        self.x[slot] = -width if x is None else x
+        self.y[slot] = CAR_LANES[lane]
+        self.width[slot], self.height[slot] = width, height
+        self.speed[slot] = speed
+        self.lane[slot] = lane
+        self.active[slot] = True
+        return slot
+
+    def clear(self):
+        self.active[:] = False
+
+    def boxes(self):
+        """(x, y, width, height) arrays of the active cars."""
+        active = self.active
+        return self.x[active], self.y[active], self.width[active], self.height[active]
 
     def update(self):
-        self.rect.x += self.speed
+        """Move every car and despawn the ones that have left the screen."""
+        np.add(self.x, self.speed, out=self.x, where=self.active)
+        np.less(self.x, WIDTH, out=self._test)
+        self.active &= self._test
+
+    def overlapping(self, rect):
+        """Mask of active cars overlapping a pygame Rect (as Rect.colliderect); a shared buffer."""
+        hit, test, edge = self._hit, self._test, self._edge
+        np.add(self.x, self.width, out=edge)
+        np.greater(edge, rect.left, out=hit)
+        np.less(self.x, rect.right, out=test)
+        hit &= test
+        np.add(self.y, self.height, out=edge)
+        np.greater(edge, rect.top, out=test)
+        hit &= test
+        np.less(self.y, rect.bottom, out=test)
+        hit &= test
+        hit &= self.active
+        return hit
+
+    def _sprite(self, size):
+        sprite = self._sprites.get(size)
+        if sprite is None:
+            sprite = pygame.Surface(size).convert()
+            sprite.fill(SPRITE_KEY)
+            pygame.draw.rect(sprite, YELLOW, sprite.get_rect(), border_radius=4)
+            sprite.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+            self._sprites[size] = sprite
+        return sprite
 
     def draw(self, surface):
-        pygame.draw.rect(surface, YELLOW, self.rect, border_radius=4)
+        """Blit every active car from a pre-rendered sprite in one call; returns their rects."""
+        active = self.active
+        sprite = self._sprite
+        return surface.blits([(sprite(size), pos) for pos, size in zip(
+            zip(self.x[active].tolist(), self.y[active].tolist()),
+            zip(self.width[active].tolist(), self.height[active].tolist()))])
+
+class SimClock:
+    """
+    Game time in milliseconds, advanced only by the game logic (one fixed
+    tick per PedestrianGame.update), never read from the wall clock. Pass
+    the same clock to everything that keeps timers.
+    """
+    def __init__(self, now=0.0, tick_ms=1000.0 / LOGIC_HZ):
+        self.now = now
+        self.tick_ms = tick_ms
+        self.ticks = 0
+
+    def tick(self):
+        self.ticks += 1
+        self.now += self.tick_ms
 
 class TrafficSignal:
-    def __init__(self):
-        self.duration = 3000
-        self.last_switch = pygame.time.get_ticks()
+    def __init__(self, clock):
+        self.clock = clock
+        self.duration = SIGNAL_DURATION
+        self.last_switch = clock.now
         self.green = False
 
     def update(self):
-        current = pygame.time.get_ticks()
+        current = self.clock.now
         if current - self.last_switch > self.duration:
             self.green = not self.green
             self.last_switch = current
 
     def draw(self, surface):
-        light_rect = pygame.Rect(20, 20, 50, 130)
-        pygame.draw.rect(surface, DARK_GRAY, light_rect, border_radius=8)
-        pygame.draw.rect(surface, (0, 0, 0), light_rect, 2, border_radius=8)
+        # The housing is part of the pre-rendered background (draw_environment).
         red_color = RED if not self.green else (128, 0, 0)
         green_color = GREEN if self.green else (0, 128, 0)
-        pygame.draw.circle(surface, red_color, (45, 50), 15)
-        pygame.draw.circle(surface, green_color, (45, 100), 15)
-        font = pygame.font.SysFont(None, 24)
-        text = font.render("Safe" if self.green else "Wait", True, WHITE)
-        surface.blit(text, (15, 160))
+        return pygame.draw.circle(surface, red_color, (45, 50), 15).union(
+            pygame.draw.circle(surface, green_color, (45, 100), 15))
 
 def draw_environment(surface):
     # Background and road rendering could use texture images for AAA polish
@@ -108,73 +224,222 @@ def draw_environment(surface):
         pygame.draw.rect(surface, WHITE, (x, mid_y - 5, 30, 10))
     pygame.draw.line(surface, YELLOW, (0, ROAD_TOP), (WIDTH, ROAD_TOP), 4)
     pygame.draw.line(surface, YELLOW, (0, ROAD_BOTTOM), (WIDTH, ROAD_BOTTOM), 4)
+    # Traffic signal housing; TrafficSignal.draw adds the lamps.
+    light_rect = pygame.Rect(20, 20, 50, 130)
+    pygame.draw.rect(surface, DARK_GRAY, light_rect, border_radius=8)
+    pygame.draw.rect(surface, (0, 0, 0), light_rect, 2, border_radius=8)
 
-def main():
-    player = Player()
-    signal = TrafficSignal()
-    cars = []
-    spawn_timer = pygame.time.get_ticks()
-    last_score_update = 0
+class SceneRenderer:
+    """
+    Draws frames over a background composed once by draw_environment, in
+    the display's pixel format so restoring it is a plain copy.
 
-    running = True
-    while running:
-        dt = clock.tick(60)
-        current_time = pygame.time.get_ticks()
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-
-        keys = pygame.key.get_pressed()
+    Full mode copies the whole background each frame and flips. In
+    dirty_rects mode only the rectangles drawn last frame are restored and
+    only those plus this frame's are sent to pygame.display.update.
+    """
+    def __init__(self, surface, dirty_rects=False):
+        self.surface = surface
+        self.dirty_rects = dirty_rects
+        self.background = pygame.Surface(surface.get_size()).convert(surface)
+        draw_environment(self.background)
+        self._last = []
+        self._full = True
+
+    def begin(self):
+        """Erase the previous frame's moving elements (all of them in full mode)."""
+        if self.dirty_rects and not self._full:
+            for rect in self._last:
+                self.surface.blit(self.background, rect, rect)
+        else:
+            self.surface.blit(self.background, (0, 0))
+
+    def present(self, rects):
+        """Show the frame; rects are everything drawn over the background since begin()."""
+        if self.dirty_rects and not self._full:
+            pygame.display.update(self._last + rects)
+        else:
+            pygame.display.flip()
+        self._last = rects
+        self._full = False
+
+    def invalidate(self):
+        """Redraw and present the whole screen next frame."""
+        self._full = True
+
+class PedestrianGame:
+    """
+    Game state and rules for one session, separate from the event loop so
+    a frame can be stepped and drawn on its own (see benchmark.py). Each
+    update() is one fixed logic tick of clock (a SimClock).
+    """
+    def __init__(self, clock=None, car_capacity=MAX_CARS, spawn_interval=SPAWN_INTERVAL,
+                 crowd_size=CROWD_SIZE):
+        self.clock = clock or SimClock()
+        self.player = Player()
+        self.signal = TrafficSignal(self.clock)
+        self.cars = CarPool(car_capacity)
+        self.crowd = Crowd(WIDTH, HEIGHT, ROAD_TOP, ROAD_BOTTOM, CROSSING, size=crowd_size,
+                           radius=NPC_RADIUS, seed=random.randrange(1 << 30))
+        self._npc_sprite = None
+        self.spawn_interval = spawn_interval
+        self.spawn_timer = self.clock.now
+        self.last_score_update = 0
+        self.hud = SurfaceHud(glyphs)
+        self.hud.add('signal', (15, 160), font=(None, 24))
+        self.hud.add('score', (WIDTH - 180, 20), font=("arial", 28))
+
+    def update(self, keys):
+        """Advance the game by one logic tick with the given key state."""
+        self.clock.tick()
+        current_time = self.clock.now
+        player = self.player
         player.update(keys)
-        signal.update()
+        self.signal.update()
 
         # Spawn new cars periodically
-        if current_time - spawn_timer > 1500:
-            cars.append(Car())
-            spawn_timer = current_time
+        if current_time - self.spawn_timer > self.spawn_interval:
+            self.cars.spawn()
+            self.spawn_timer = current_time
 
-        for car in cars:
-            car.update()
-        # Remove cars that have left the screen
-        cars = [car for car in cars if car.rect.x < WIDTH]
+        # Move cars and remove those that have left the screen
+        self.cars.update()
 
         # Check collision between player and cars
-        for car in cars:
-            if player.rect.colliderect(car.rect):
-                player.score -= 15
-                # Play collision sound, trigger particle effects, etc.
-                player.rect.x = WIDTH // 2 - PLAYER_SIZE // 2
-                player.rect.y = ROAD_BOTTOM + SIDEWALK_HEIGHT + 10
+        if self.cars.overlapping(player.rect).any():
+            player.score -= HIT_PENALTY
+            # Play collision sound, trigger particle effects, etc.
+            player.rect.topleft = PLAYER_START
+
+        # NPC pedestrians queue, cross on green and give way to cars
+        self.crowd.update(self.signal.green, self.cars.boxes())
 
         # Define crossing zone and manage safe/unsafe crossing scoring:
-        crossing_zone = pygame.Rect(WIDTH // 2 - 100, ROAD_TOP, 200, ROAD_BOTTOM - ROAD_TOP)
+        crossing_zone = pygame.Rect(CROSSING[0], ROAD_TOP, CROSSING[1] - CROSSING[0], ROAD_BOTTOM - ROAD_TOP)
         if player.rect.colliderect(crossing_zone):
-            if signal.green:
-                if current_time - last_score_update > 500:
-                    player.score += 2
-                    last_score_update = current_time
+            if self.signal.green:
+                if current_time - self.last_score_update > SCORE_INTERVAL:
+                    player.score += SAFE_CROSSING_POINTS
+                    self.last_score_update = current_time
             else:
-                if current_time - last_score_update > 500:
-                    player.score -= 3
-                    last_score_update = current_time
+                if current_time - self.last_score_update > SCORE_INTERVAL:
+                    player.score -= JAYWALK_PENALTY
+                    self.last_score_update = current_time
 
         # Check if player reached the destination (score bonus)
-        if player.rect.y < ROAD_TOP - SIDEWALK_HEIGHT + 10:
-            player.score += 20
-            player.rect.x = WIDTH // 2 - PLAYER_SIZE // 2
-            player.rect.y = ROAD_BOTTOM + SIDEWALK_HEIGHT + 10
-
-        # Render all elements
-        draw_environment(screen)
-        signal.draw(screen)
-        for car in cars:
-            car.draw(screen)
-        player.draw(screen)
-        font = pygame.font.SysFont("arial", 28)
-        score_text = font.render(f"Score: {player.score}", True, WHITE)
-        screen.blit(score_text, (WIDTH - 180, 20))
-        pygame.display.flip()
+        if player.rect.y < GOAL_Y:
+            player.score += ARRIVAL_BONUS
+            player.rect.topleft = PLAYER_START
+
+    def draw(self, surface):
+        """Draw the moving elements over the background; returns the rectangles drawn."""
+        rects = [self.signal.draw(surface)]
+        rects.extend(self.cars.draw(surface))
+        rects.extend(self.draw_crowd(surface))
+        rects.append(self.player.draw(surface))
+        self.hud.set('signal', "Safe" if self.signal.green else "Wait")
+        self.hud.set('score', f"Score: {self.player.score}")
+        rects.extend(self.hud.draw(surface))
+        return rects
+
+    def draw_crowd(self, surface):
+        if self._npc_sprite is None:
+            size = 2 * NPC_RADIUS
+            self._npc_sprite = pygame.Surface((size, size)).convert()
+            self._npc_sprite.fill(SPRITE_KEY)
+            pygame.draw.circle(self._npc_sprite, NPC_COLOR, (NPC_RADIUS, NPC_RADIUS), NPC_RADIUS)
+            self._npc_sprite.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+        sprite = self._npc_sprite
+        x, y = self.crowd.positions()
+        return surface.blits([(sprite, pos) for pos in zip((x - NPC_RADIUS).astype(int).tolist(),
+                                                           (y - NPC_RADIUS).astype(int).tolist())])
+
+def draw_profile_overlay(surface, lines):
+    return [surface.blit(glyphs.render(("monospace", 16), line, WHITE, (0, 0, 0)), (90, 20 + i * 18))
+            for i, line in enumerate(lines)]
+
+# Scripted key states, indexed by key constant like pygame.key.get_pressed().
+NO_KEYS = (0,) * 512
+WALK_KEYS = tuple(int(k == pygame.K_w) for k in range(512))
+
+def walk_on_green(game):
+    """Controller for run_headless: walk forward while the signal shows Safe."""
+    return WALK_KEYS if game.signal.green else NO_KEYS
+
+def run_headless(game, ticks, controller=None, render_every=0, surface=None):
+    """
+    Run ticks logic ticks back to back, as fast as the CPU allows.
+    controller(game) returns each tick's key state (default: no keys).
+    With render_every > 0, every render_every-th tick is drawn to surface
+    (a full-screen SceneRenderer frame), e.g. to capture screenshots.
+    """
+    renderer = SceneRenderer(surface, False) if render_every and surface is not None else None
+    for tick in range(ticks):
+        game.update(controller(game) if controller else NO_KEYS)
+        if renderer and (tick + 1) % render_every == 0:
+            renderer.begin()
+            game.draw(surface)
+    return game
+
+def main():
+    parser = argparse.ArgumentParser(description="Pedestrian crossing game.")
+    parser.add_argument('--headless', action='store_true', default=HEADLESS,
+                        help="run the logic uncapped without drawing (default with SDL_VIDEODRIVER=dummy)")
+    parser.add_argument('--ticks', type=int, default=LOGIC_HZ * 600,
+                        help="logic ticks to run headless (default: ten minutes of game time)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.headless:
+        game = PedestrianGame()
+        start = time.perf_counter()
+        run_headless(game, args.ticks, walk_on_green)
+        elapsed = time.perf_counter() - start
+        print(f"{args.ticks} ticks ({game.clock.now / 1000:.0f} s game time) in {elapsed:.2f} s wall, "
+              f"{args.ticks / elapsed:.0f} ticks/s; score {game.player.score}")
+        return
+
+    game = PedestrianGame()
+    renderer = SceneRenderer(screen, DIRTY_RECTS)
+    logic = FixedTimestep(LOGIC_HZ, MAX_LOGIC_STEPS)
+    overlay_lines = []
+
+    running = True
+    while running:
+        dt = clock.tick(FPS)
+        profiler.begin_frame(gap='wait')
+        with profiler.scope('input'):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                    renderer.dirty_rects = not renderer.dirty_rects
+                    renderer.invalidate()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.toggle()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    os.makedirs(TRACE_DIR, exist_ok=True)
+                    path = os.path.join(TRACE_DIR, time.strftime('trace-%Y%m%d-%H%M%S.json'))
+                    print(f"Wrote frame trace to {profiler.write_chrome_trace(path)}")
+            keys = pygame.key.get_pressed()
+
+        # Whole logic ticks owed for the frame time: several when drawing falls
+        # behind (frame-skip), none on a fast frame; see fixed_step.py.
+        with profiler.scope('update'):
+            logic.advance(dt / 1000.0, lambda step_dt: game.update(keys))
+        with profiler.scope('draw'):
+            renderer.begin()
+            rects = game.draw(screen)
+            if profiler.enabled:
+                if profiler.frame_index % 30 == 0:
+                    overlay_lines = profiler.overlay_lines()
+                rects.extend(draw_profile_overlay(screen, overlay_lines))
+        with profiler.scope('present'):
+            renderer.present(rects)
+        profiler.end_frame()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,319 @@
+# replay.py - Deterministic session recording, playback and seeking
+
+"""
+A DrivingSimulation only changes through step(controls, dt), so a session
+is fully described by its starting state and the per-tick inputs.
+
+ReplayRecorder wraps sim.step: it stores each tick's Controls as one byte
+and dt as run-length encoded runs (a fixed-timestep session has a single
+run), and a full sim.snapshot() when recording starts and every
+keyframe_interval ticks after that. A 30-minute session at 60 Hz is
+~108 KB of inputs plus the keyframes.
+
+Keyframes are compressed .npz archives: the snapshot's arrays as .npy
+members, and everything else (numbers, strings, the nesting of dicts,
+lists and tuples) as a JSON tree in one more member. Nothing is pickled,
+so loading a recording someone sends in for a dispute audit cannot run
+code.
+
+File layout (little-endian):
+
+    b'TSREPLAY' u32 version
+    u32 header length, header JSON (layout size, simulation settings,
+        tick count, keyframe interval)
+    u8[ticks] control bits
+    u32 runs, u32[runs] first tick of each dt run, f64[runs] dt
+    u32 keyframes, then per keyframe: u32 tick, u32 size, snapshot .npz
+
+ReplayPlayer rebuilds the simulation from the header, restores keyframe 0
+and re-simulates the recorded inputs. seek(tick) restores the nearest
+keyframe at or before tick and steps forward from there, so any point of a
+long session is at most keyframe_interval ticks away.
+
+    python replay.py session.replay [--seek TICK] [--verify]
+
+fast-forwards a recording and prints the score; --verify also checks that
+re-simulating reproduces every keyframe (e.g. to audit a disputed score).
+"""
+
+import argparse
+import io
+import json
+import struct
+import time
+
+import numpy as np
+
+from simulation import CityLayout, DrivingSimulation, Controls
+from traffic_signals import PhasePlan
+
+MAGIC = b'TSREPLAY'
+VERSION = 2                 # 1 stored pickled keyframes, which are no longer loaded.
+KEYFRAME_INTERVAL = 600     # Ticks between full-state keyframes (10 s at 60 Hz).
+_TREE = 'tree'              # npz member holding the JSON part of a keyframe.
+
+
+def _encode(value, arrays):
+    """JSON-ready copy of a snapshot, moving its arrays into arrays (name -> ndarray)."""
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("Object arrays cannot be stored in a keyframe")
+        name = f'a{len(arrays)}'
+        arrays[name] = value
+        return {'__array__': name}
+    if isinstance(value, np.generic):
+        return {'__scalar__': value.dtype.str, 'value': value.item()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(v, arrays) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith('__') for k in value):
+            return {k: _encode(v, arrays) for k, v in value.items()}
+        return {'__items__': [[_encode(k, arrays), _encode(v, arrays)] for k, v in value.items()]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(f"{type(value).__name__} cannot be stored in a keyframe")
+
+
+def _decode(value, arrays):
+    if isinstance(value, list):
+        return [_decode(v, arrays) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if '__array__' in value:
+        return arrays[value['__array__']]
+    if '__scalar__' in value:
+        return np.dtype(value['__scalar__']).type(value['value'])
+    if '__tuple__' in value:
+        return tuple(_decode(v, arrays) for v in value['__tuple__'])
+    if '__items__' in value:
+        return {_decode(k, arrays): _decode(v, arrays) for k, v in value['__items__']}
+    return {k: _decode(v, arrays) for k, v in value.items()}
+
+
+def _pack(state):
+    arrays = {}
+    tree = json.dumps(_encode(state, arrays)).encode('utf-8')
+    arrays[_TREE] = np.frombuffer(tree, dtype=np.uint8)
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **arrays)
+    return buf.getvalue()
+
+
+def _unpack(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    tree = json.loads(arrays.pop(_TREE).tobytes().decode('utf-8'))
+    return _decode(tree, arrays)
+
+
+def _same(a, b):
+    """Exact equality of two snapshots (nested dicts / lists / tuples / arrays)."""
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+class ReplayRecorder:
+    """
+    Records a session; call step(controls, dt) instead of sim.step.
+    Only CityLayout sessions can be recorded (a StreamedCity's chunks load
+    on a background thread, which is not reproducible).
+    """
+    def __init__(self, sim, keyframe_interval=KEYFRAME_INTERVAL):
+        layout = sim.layout
+        if not isinstance(layout, CityLayout):
+            raise ValueError("Only CityLayout sessions can be recorded")
+        settings = dict(sim.settings)
+        if settings['signal_plan'] is not None:
+            settings['signal_plan'] = settings['signal_plan'].phases
+        self.header = {
+            'layout': {'grid_size': layout.grid_size, 'block_size': layout.block_size,
+                       'road_width': layout.road_width},
+            'settings': settings,
+            'keyframe_interval': keyframe_interval,
+        }
+        self.sim = sim
+        self.keyframe_interval = keyframe_interval
+        self._controls = bytearray()
+        self._dt_starts, self._dt_values = [], []
+        self._keyframes = [(0, _pack(sim.snapshot()))]     # (tick, packed snapshot)
+
+    @property
+    def ticks(self):
+        return len(self._controls)
+
+    def step(self, controls, dt):
+        tick = len(self._controls)
+        if tick and tick % self.keyframe_interval == 0:
+            self._keyframes.append((tick, _pack(self.sim.snapshot())))
+        self._controls.append(controls.bits)
+        if not self._dt_values or self._dt_values[-1] != dt:
+            self._dt_starts.append(tick)
+            self._dt_values.append(dt)
+        self.sim.step(controls, dt)
+
+    def save(self, path):
+        header = dict(self.header, ticks=self.ticks)
+        header = json.dumps(header).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', VERSION))
+            f.write(struct.pack('<I', len(header)) + header)
+            f.write(bytes(self._controls))
+            f.write(struct.pack('<I', len(self._dt_starts)))
+            f.write(np.asarray(self._dt_starts, dtype='<u4').tobytes())
+            f.write(np.asarray(self._dt_values, dtype='<f8').tobytes())
+            f.write(struct.pack('<I', len(self._keyframes)))
+            for tick, blob in self._keyframes:
+                f.write(struct.pack('<II', tick, len(blob)) + blob)
+
+
+class Replay:
+    """A loaded recording: header, per-tick inputs and compressed keyframes."""
+    def __init__(self, header, controls, dt_starts, dt_values, keyframes):
+        self.header = header
+        self.controls = controls
+        self.dt_starts = dt_starts
+        self.dt_values = dt_values
+        self.keyframes = keyframes
+        self.keyframe_ticks = np.array([tick for tick, _ in keyframes], dtype=np.int64)
+        self._control_objects = [Controls.from_bits(bits) for bits in range(32)]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a replay file")
+        pos = len(MAGIC)
+        version, size = struct.unpack_from('<II', data, pos)
+        if version != VERSION:
+            raise ValueError(f"Unsupported replay version {version} (this build reads {VERSION})")
+        pos += 8
+        header = json.loads(data[pos:pos + size].decode('utf-8'))
+        pos += size
+        ticks = header['ticks']
+        controls = np.frombuffer(data, dtype=np.uint8, count=ticks, offset=pos)
+        pos += ticks
+        (runs,) = struct.unpack_from('<I', data, pos)
+        pos += 4
+        dt_starts = np.frombuffer(data, dtype='<u4', count=runs, offset=pos).astype(np.int64)
+        pos += 4 * runs
+        dt_values = np.frombuffer(data, dtype='<f8', count=runs, offset=pos)
+        pos += 8 * runs
+        (count,) = struct.unpack_from('<I', data, pos)
+        pos += 4
+        keyframes = []
+        for _ in range(count):
+            tick, size = struct.unpack_from('<II', data, pos)
+            pos += 8
+            keyframes.append((tick, data[pos:pos + size]))
+            pos += size
+        if not keyframes or keyframes[0][0] != 0:
+            raise ValueError(f"{path} has no starting keyframe")
+        return cls(header, controls, dt_starts, dt_values, keyframes)
+
+    @property
+    def ticks(self):
+        return len(self.controls)
+
+    def control(self, tick):
+        return self._control_objects[self.controls[tick]]
+
+    def dt(self, tick):
+        return float(self.dt_values[np.searchsorted(self.dt_starts, tick, 'right') - 1])
+
+    def keyframe(self, index):
+        """(tick, snapshot) of the index-th keyframe."""
+        tick, blob = self.keyframes[index]
+        return tick, _unpack(blob)
+
+    def build_simulation(self):
+        settings = dict(self.header['settings'])
+        if settings['signal_plan'] is not None:
+            settings['signal_plan'] = PhasePlan(settings['signal_plan'])
+        return DrivingSimulation(CityLayout(**self.header['layout']), **settings)
+
+
+class ReplayPlayer:
+    """Re-simulates a Replay; tick counts from the start of the recording."""
+    def __init__(self, replay):
+        self.replay = replay
+        self.sim = replay.build_simulation()
+        self.tick = 0
+        self._restore(0)
+
+    def _restore(self, index):
+        tick, state = self.replay.keyframe(index)
+        self.sim.restore(state)
+        self.tick = tick
+
+    def step(self):
+        """Advance one recorded tick; returns False at the end of the recording."""
+        if self.tick >= self.replay.ticks:
+            return False
+        self.sim.step(self.replay.control(self.tick), self.replay.dt(self.tick))
+        self.tick += 1
+        return True
+
+    def run(self, until=None):
+        """Step to tick `until` (default: the end) without restoring keyframes."""
+        until = self.replay.ticks if until is None else min(until, self.replay.ticks)
+        replay, sim = self.replay, self.sim
+        runs = np.searchsorted(replay.dt_starts, np.arange(self.tick, until), 'right') - 1
+        for tick, run in zip(range(self.tick, until), runs.tolist()):
+            sim.step(replay.control(tick), float(replay.dt_values[run]))
+        self.tick = max(self.tick, until)
+
+    def seek(self, tick):
+        """Jump to any tick: restore the nearest earlier keyframe, then re-simulate."""
+        tick = max(0, min(tick, self.replay.ticks))
+        index = int(np.searchsorted(self.replay.keyframe_ticks, tick, 'right') - 1)
+        if not self.replay.keyframe_ticks[index] <= self.tick <= tick:
+            self._restore(index)
+        self.run(tick)
+
+    def verify(self):
+        """
+        Re-simulate from the first keyframe and compare every later one.
+        Returns the tick of the first keyframe that does not match, or None.
+        """
+        self._restore(0)
+        for index in range(1, len(self.replay.keyframes)):
+            tick, state = self.replay.keyframe(index)
+            self.run(tick)
+            if not _same(self.sim.snapshot(), state):
+                return tick
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast-forward or audit a recorded driving session.")
+    parser.add_argument('path')
+    parser.add_argument('--seek', type=int, default=None, help="stop at this tick instead of the end")
+    parser.add_argument('--verify', action='store_true', help="check every keyframe re-simulates exactly")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    player = ReplayPlayer(replay)
+    start = time.perf_counter()
+    if args.verify:
+        mismatch = player.verify()
+        if mismatch is not None:
+            print(f"Replay diverges from its recording at tick {mismatch}")
+            raise SystemExit(1)
+        print(f"All {len(replay.keyframes)} keyframes reproduce exactly")
+    player.seek(replay.ticks if args.seek is None else args.seek)
+    elapsed = time.perf_counter() - start
+    sim = player.sim
+    print(f"tick {player.tick}/{replay.ticks}  sim time {sim.time:.1f} s  score {sim.score}  "
+          f"car ({sim.car.x:.2f}, {sim.car.z:.2f})  [{elapsed:.2f} s wall]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+# road_index.py - Precomputed drivable-area lookup for the road network
+
+"""
+DrivableAreaIndex answers "is this point on a road?" and "how far is it
+from the road edge?" in constant time, instead of testing every road on
+every move.
+
+Two structures are built once, when the city is created:
+
+  - a coarse uniform grid whose cells are classified as fully on-road,
+    fully off-road, or mixed. Only mixed cells (the ones a road edge runs
+    through) fall back to exact per-road tests, and only against the few
+    roads overlapping that cell, so contains() matches the linear scan
+    exactly.
+  - a fine occupancy bitmap with a signed distance field (positive on the
+    road, negative off it), clamped to max_distance.
+
+Both have batched NumPy variants for querying many points at once.
+"""
+
+from math import atan2, degrees, ceil
+
+import numpy as np
+
+OUT, IN, MIXED = 0, 1, 2
+
+
+def _road_shape(road):
+    """
+    Normalize a road into ('rect', cx, cz, hx, hz) or
+    ('arc', cx, cz, inner_r, outer_r, start_angle, end_angle).
+    Accepts simulation.RoadRect and the RoadSegment / RoadArc Entities.
+    """
+    if hasattr(road, 'half_x'):
+        return ('rect', road.center[0], road.center[1], road.half_x, road.half_z)
+    if hasattr(road, 'half_size'):
+        return ('rect', road.center2d.x, road.center2d.y, road.half_size.x, road.half_size.y)
+    if hasattr(road, 'inner_radius'):
+        return ('arc', road.center2d.x, road.center2d.y, road.inner_radius, road.outer_radius,
+                road.start_angle, road.end_angle)
+    raise TypeError(f"Cannot index road of type {type(road).__name__}")
+
+
+def _shape_bounds(shape):
+    if shape[0] == 'rect':
+        _, cx, cz, hx, hz = shape
+        return cx - hx, cz - hz, cx + hx, cz + hz
+    _, cx, cz, _, r, _, _ = shape
+    return cx - r, cz - r, cx + r, cz + r
+
+
+def _shape_test(shape):
+    """Exact scalar point test with the same inclusive bounds as contains_point."""
+    if shape[0] == 'rect':
+        _, cx, cz, hx, hz = shape
+        return lambda x, z: abs(x - cx) <= hx and abs(z - cz) <= hz
+
+    _, cx, cz, inner_r, outer_r, start, end = shape
+    s, e = start % 360, end % 360
+
+    def test(x, z):
+        dx, dz = x - cx, z - cz
+        dist = (dx * dx + dz * dz) ** 0.5
+        if dist < inner_r or dist > outer_r:
+            return False
+        ang = degrees(atan2(dz, dx)) % 360
+        return s <= ang <= e if s < e else (ang >= s or ang <= e)
+    return test
+
+
+def _shape_mask(shape, xs, zs):
+    """Vectorized version of _shape_test."""
+    if shape[0] == 'rect':
+        _, cx, cz, hx, hz = shape
+        return (np.abs(xs - cx) <= hx) & (np.abs(zs - cz) <= hz)
+
+    _, cx, cz, inner_r, outer_r, start, end = shape
+    s, e = start % 360, end % 360
+    dx, dz = xs - cx, zs - cz
+    dist = np.hypot(dx, dz)
+    ang = np.degrees(np.arctan2(dz, dx)) % 360
+    in_angle = (s <= ang) & (ang <= e) if s < e else (ang >= s) | (ang <= e)
+    return (dist >= inner_r) & (dist <= outer_r) & in_angle
+
+
+def _clamped_edt(features, max_steps):
+    """
+    Euclidean distance (in pixels) from every pixel to the nearest True
+    pixel of `features`, computed separably and clamped to max_steps.
+    Cost is O(pixels * max_steps) with whole-array NumPy operations.
+    """
+    rows, cols = features.shape
+    inf = np.float32(np.inf)
+
+    # Pass 1: distance to the nearest feature in the same column.
+    base = np.where(features, np.float32(0), inf)
+    col = base.copy()
+    for k in range(1, min(max_steps, rows - 1) + 1):
+        kf = np.float32(k)
+        np.minimum(col[:-k], base[k:] + kf, out=col[:-k])
+        np.minimum(col[k:], base[:-k] + kf, out=col[k:])
+
+    # Pass 2: combine columns within the clamp window along each row.
+    col2 = col * col
+    best = col2.copy()
+    for k in range(1, min(max_steps, cols - 1) + 1):
+        k2 = np.float32(k * k)
+        np.minimum(best[:, :-k], col2[:, k:] + k2, out=best[:, :-k])
+        np.minimum(best[:, k:], col2[:, :-k] + k2, out=best[:, k:])
+    return np.minimum(np.sqrt(best), np.float32(max_steps))
+
+
+class DrivableAreaIndex:
+    """
+    Constant-time drivable-area queries over a fixed set of roads.
+
+    roads: RoadRect / RoadSegment / RoadArc objects
+    cell_size: edge of the coarse classification grid
+    resolution: pixel size of the distance field
+    max_distance: distances beyond this are clamped
+    """
+    def __init__(self, roads, cell_size=5.0, resolution=0.5, max_distance=10.0):
+        self.roads = list(roads)
+        self.cell_size = cell_size
+        self.resolution = resolution
+        self.max_distance = max_distance
+        self._shapes = [_road_shape(r) for r in self.roads]
+        self._tests = [_shape_test(s) for s in self._shapes]
+
+        if self._shapes:
+            bounds = np.array([_shape_bounds(s) for s in self._shapes])
+            x0, z0 = bounds[:, 0].min(), bounds[:, 1].min()
+            x1, z1 = bounds[:, 2].max(), bounds[:, 3].max()
+        else:
+            bounds = np.zeros((0, 4))
+            x0 = z0 = x1 = z1 = 0.0
+        self._build_cells(bounds, x0, z0, x1, z1)
+        self._build_distance_field(x0, z0, x1, z1)
+
+    def __iter__(self):
+        return iter(self.roads)
+
+    def __len__(self):
+        return len(self.roads)
+
+    # -- construction --------------------------------------------------
+
+    def _build_cells(self, bounds, x0, z0, x1, z1):
+        cs = self.cell_size
+        self.cell_x0, self.cell_z0 = x0, z0
+        self.cells_x = max(1, int(ceil((x1 - x0) / cs)) + 1)
+        self.cells_z = max(1, int(ceil((z1 - z0) / cs)) + 1)
+
+        ix = np.arange(self.cells_x)
+        iz = np.arange(self.cells_z)
+        lo_x = (x0 + ix * cs)[None, :]
+        lo_z = (z0 + iz * cs)[:, None]
+        hi_x, hi_z = lo_x + cs, lo_z + cs
+
+        state = np.full((self.cells_z, self.cells_x), OUT, dtype=np.uint8)
+        candidates = {}
+        for n, shape in enumerate(self._shapes):
+            bx0, bz0, bx1, bz1 = bounds[n]
+            # Closed overlap so that points lying exactly on an edge are tested.
+            touches = (lo_x <= bx1) & (hi_x >= bx0) & (lo_z <= bz1) & (hi_z >= bz0)
+            if shape[0] == 'rect':
+                inside = (lo_x >= bx0) & (hi_x <= bx1) & (lo_z >= bz0) & (hi_z <= bz1)
+                state[inside] = IN
+                touches &= ~inside
+            for j, i in zip(*np.nonzero(touches)):
+                candidates.setdefault(int(j) * self.cells_x + int(i), []).append(n)
+
+        flat = state.ravel()
+        for k in list(candidates):
+            if flat[k] == IN:
+                del candidates[k]
+            else:
+                flat[k] = MIXED
+        self._state = bytes(flat)
+        self._state_grid = state
+        self._candidates = {k: tuple(self._tests[n] for n in v) for k, v in candidates.items()}
+        self._candidate_ids = {k: tuple(v) for k, v in candidates.items()}
+
+    def _build_distance_field(self, x0, z0, x1, z1):
+        res, pad = self.resolution, self.max_distance
+        self.field_x0, self.field_z0 = x0 - pad, z0 - pad
+        nx = int(ceil((x1 - x0 + 2 * pad) / res)) + 1
+        nz = int(ceil((z1 - z0 + 2 * pad) / res)) + 1
+        self.field_nx, self.field_nz = nx, nz
+
+        xs = self.field_x0 + (np.arange(nx) + 0.5) * res
+        zs = self.field_z0 + (np.arange(nz) + 0.5) * res
+        gx, gz = np.meshgrid(xs, zs)
+        self.occupancy = self.contains_many(gx, gz)
+
+        steps = int(ceil(pad / res))
+        to_off = _clamped_edt(~self.occupancy, steps)
+        to_on = _clamped_edt(self.occupancy, steps)
+        half = np.float32(0.5)
+        sdf = np.where(self.occupancy, to_off - half, -(to_on - half)) * np.float32(res)
+        self.distance_field = np.clip(sdf, -pad, pad).astype(np.float32)
+
+    # -- scalar queries ------------------------------------------------
+
+    def contains(self, x, z):
+        """Exact "on road?" test for one point, O(1)."""
+        i = int((x - self.cell_x0) // self.cell_size)
+        j = int((z - self.cell_z0) // self.cell_size)
+        if i < 0 or j < 0 or i >= self.cells_x or j >= self.cells_z:
+            return False
+        k = j * self.cells_x + i
+        state = self._state[k]
+        if state == IN:
+            return True
+        if state == OUT:
+            return False
+        for test in self._candidates[k]:
+            if test(x, z):
+                return True
+        return False
+
+    def contains_point(self, pos):
+        """Same as contains(pos.x, pos.z); drop-in for a road's contains_point."""
+        return self.contains(pos.x, pos.z)
+
+    def distance_to_edge(self, x, z):
+        """
+        Signed distance to the nearest road edge: positive on the road,
+        negative off it, accurate to about one resolution step.
+        """
+        i = int((x - self.field_x0) // self.resolution)
+        j = int((z - self.field_z0) // self.resolution)
+        if i < 0 or j < 0 or i >= self.field_nx or j >= self.field_nz:
+            return -self.max_distance
+        return float(self.distance_field[j, i])
+
+    # -- batched queries -----------------------------------------------
+
+    def contains_many(self, xs, zs):
+        """Vectorized contains() over arrays of coordinates; returns a bool array."""
+        xs = np.asarray(xs, dtype=np.float64)
+        zs = np.asarray(zs, dtype=np.float64)
+        i = np.floor((xs - self.cell_x0) / self.cell_size).astype(np.int64)
+        j = np.floor((zs - self.cell_z0) / self.cell_size).astype(np.int64)
+        valid = (i >= 0) & (j >= 0) & (i < self.cells_x) & (j < self.cells_z)
+        state = np.full(xs.shape, OUT, dtype=np.uint8)
+        state[valid] = self._state_grid[j[valid], i[valid]]
+
+        result = state == IN
+        mixed = state == MIXED
+        if mixed.any():
+            mx, mz = xs[mixed], zs[mixed]
+            hit = np.zeros(mx.shape, dtype=bool)
+            keys = j[mixed] * self.cells_x + i[mixed]
+            for n in {n for k in np.unique(keys) for n in self._candidate_ids[int(k)]}:
+                hit |= _shape_mask(self._shapes[n], mx, mz)
+            result[mixed] = hit
+        return result
+
+    def distance_to_edge_many(self, xs, zs):
+        """Vectorized distance_to_edge() over arrays of coordinates."""
+        xs = np.asarray(xs, dtype=np.float64)
+        zs = np.asarray(zs, dtype=np.float64)
+        i = np.floor((xs - self.field_x0) / self.resolution).astype(np.int64)
+        j = np.floor((zs - self.field_z0) / self.resolution).astype(np.int64)
+        valid = (i >= 0) & (j >= 0) & (i < self.field_nx) & (j < self.field_nz)
+        out = np.full(xs.shape, -self.max_distance, dtype=np.float32)
+        out[valid] = self.distance_field[j[valid], i[valid]]
+        return out
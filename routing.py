@@ -0,0 +1,317 @@
+# routing.py - Lane graph and next-hop routing over the city road grid
+
+"""
+LaneGraph turns a CityLayout's road grid into a directed graph:
+
+  nodes  the (grid_size + 1)^2 intersections, id = i * (grid_size + 1) + j
+         where i indexes x and j indexes z
+  edges  one lane per direction per road segment between two adjacent
+         intersections, id = lane * grid_size + seg with
+         lane = (axis * (grid_size + 1) + line) * 2 + (dir > 0)
+  turns  from the end of each edge: STRAIGHT, LEFT or RIGHT onto a
+         successor edge (the same choices TrafficFleet makes), stored as
+         an (edges, 3) successor table; turn_arc() gives RoadArc geometry
+         for a turn so a route can be drawn.
+
+RoutingService answers route queries on that graph:
+
+  astar(edge, dest)          one-off A* search (Manhattan heuristic)
+  next_turn(dests, edges)    vectorized next-hop lookup for many agents
+  route(edge, dest)          a full route by following next hops,
+                             O(path length), no search
+
+Next-hop tables hold, per destination node, the cheapest cost-to-go from
+the end of every edge and the turn that achieves it. They are filled
+lazily, many destinations at a time, by a vectorized Bellman-Ford
+relaxation, and dropped whenever an edge is closed or reopened (e.g. by
+road works), so agents never run a search per tick. Only destinations
+that have been asked for get a row (float32 cost, int8 turn), so memory
+follows the destinations in use rather than nodes x edges.
+"""
+
+import heapq
+from math import atan2, degrees, radians, sin, cos
+
+import numpy as np
+
+STRAIGHT, LEFT, RIGHT = 0, 1, 2
+TURN_PENALTY = 5.0      # Extra cost (world units) of a left or right turn.
+
+
+class LaneGraph:
+    """Directed lane graph of a grid city; see the module docstring for ids."""
+    def __init__(self, grid_size, offset, spacing, road_width, lane_fraction=0.3):
+        self.grid = g = grid_size
+        self.offset = offset
+        self.spacing = spacing
+        self.road_width = road_width
+        self.lane_offset = road_width * lane_fraction
+        self.n_nodes = (g + 1) ** 2
+        self.n_edges = 2 * (g + 1) * 2 * g
+
+        e = np.arange(self.n_edges)
+        lane, self.edge_seg = e // g, e % g
+        self.edge_positive = (lane % 2).astype(bool)
+        self.edge_dir = np.where(self.edge_positive, 1, -1)
+        self.edge_line = (lane // 2) % (g + 1)
+        self.edge_axis = lane // 2 // (g + 1)
+        k_from = np.where(self.edge_positive, self.edge_seg, self.edge_seg + 1)
+        k_to = np.where(self.edge_positive, self.edge_seg + 1, self.edge_seg)
+        self.edge_from = self._node_ids(self.edge_axis, self.edge_line, k_from)
+        self.edge_to = self._node_ids(self.edge_axis, self.edge_line, k_to)
+        self.edge_length = np.full(self.n_edges, float(spacing))
+        self.closed = np.zeros(self.n_edges, dtype=bool)
+        self._build_turns(k_to)
+
+    @classmethod
+    def from_layout(cls, layout, lane_fraction=0.3):
+        return cls(layout.grid_size, layout.offset, layout.cell_spacing, layout.road_width, lane_fraction)
+
+    def _node_ids(self, axis, line, k):
+        return np.where(axis == 0, k * (self.grid + 1) + line, line * (self.grid + 1) + k)
+
+    def edge_id(self, axis, direction, line, seg):
+        """Edge id(s) for a lane segment; works on scalars and arrays."""
+        return ((axis * (self.grid + 1) + line) * 2 + (np.asarray(direction) > 0)) * self.grid + seg
+
+    def edge_ending_at(self, axis, direction, line, k):
+        """The edge whose lane reaches grid index k (along its axis); -1 if off the grid."""
+        direction = np.asarray(direction)
+        seg = np.where(direction > 0, k - 1, k)
+        valid = (seg >= 0) & (seg < self.grid)
+        return np.where(valid, self.edge_id(axis, direction, line, np.clip(seg, 0, self.grid - 1)), -1)
+
+    def _build_turns(self, k_to):
+        """succ[e, turn] = successor edge (or -1) and the matching turn cost."""
+        g = self.grid
+        a, d, line = self.edge_axis, self.edge_dir, self.edge_line
+        self.succ = np.full((self.n_edges, 3), -1, dtype=np.int64)
+
+        ahead = k_to + d
+        ok = (ahead >= 0) & (ahead <= g)
+        self.succ[ok, STRAIGHT] = self.edge_id(a[ok], d[ok], line[ok], np.where(d[ok] > 0, k_to[ok], k_to[ok] - 1))
+
+        left = np.where(a == 0, d, -d)
+        for turn, d2 in ((LEFT, left), (RIGHT, -left)):
+            nxt = line + d2
+            ok = (nxt >= 0) & (nxt <= g)
+            seg = np.where(d2 > 0, line, line - 1)
+            self.succ[ok, turn] = self.edge_id(1 - a[ok], d2[ok], k_to[ok], seg[ok])
+
+        self.turn_cost = np.zeros((self.n_edges, 3))
+        self.turn_cost[:, LEFT] = self.turn_cost[:, RIGHT] = TURN_PENALTY
+
+    # -- geometry ------------------------------------------------------
+
+    def node_xz(self, node):
+        i, j = divmod(int(node), self.grid + 1)
+        return (self.offset + i * self.spacing, self.offset + j * self.spacing)
+
+    def heading(self, edge):
+        """Unit (x, z) travel direction of an edge."""
+        d = int(self.edge_dir[edge])
+        return (d, 0) if self.edge_axis[edge] == 0 else (0, d)
+
+    def lane_point(self, edge, along):
+        """World (x, z) on the lane centre of an edge at coordinate `along` on its axis."""
+        d, line = int(self.edge_dir[edge]), int(self.edge_line[edge])
+        road = self.offset + line * self.spacing
+        if self.edge_axis[edge] == 0:
+            return (along, road + d * self.lane_offset)
+        return (road - d * self.lane_offset, along)
+
+    def turn_arc(self, edge_from, edge_to, radius=None):
+        """
+        (center, radius, start_angle, end_angle) of a RoadArc joining two
+        perpendicular lanes, tangent to both; None for straight on.
+        """
+        if self.edge_axis[edge_from] == self.edge_axis[edge_to]:
+            return None
+        radius = radius or self.road_width * 0.5
+        h1, h2 = self.heading(edge_from), self.heading(edge_to)
+        # The lanes cross where edge_from's lateral line meets edge_to's.
+        p_to = self.lane_point(edge_to, 0.0)
+        p_from = self.lane_point(edge_from, 0.0)
+        px = p_to[0] if self.edge_axis[edge_to] == 1 else p_from[0]
+        pz = p_from[1] if self.edge_axis[edge_from] == 0 else p_to[1]
+        cx = px - h1[0] * radius + h2[0] * radius
+        cz = pz - h1[1] * radius + h2[1] * radius
+        start = degrees(atan2(-h2[1], -h2[0]))
+        end = degrees(atan2(h1[1], h1[0]))
+        end = start + ((end - start + 180) % 360 - 180)
+        return ((cx, cz), radius, start, end)
+
+    def locate(self, x, z, rotation_y):
+        """The edge a car at (x, z) with Entity heading rotation_y is driving along."""
+        r = radians(rotation_y)
+        fx, fz = sin(r), cos(r)
+        axis = 0 if abs(fx) >= abs(fz) else 1
+        d = 1 if (fx if axis == 0 else fz) > 0 else -1
+        along, across = (x, z) if axis == 0 else (z, x)
+        line = int(np.clip(round((across - self.offset) / self.spacing), 0, self.grid))
+        seg = int(np.clip((along - self.offset) // self.spacing, 0, self.grid - 1))
+        return int(self.edge_id(axis, d, line, seg))
+
+    def segment_edges_near(self, x, z, facing=None):
+        """
+        Both lane edges of the road segment nearest to (x, z). Ties (a point
+        on an intersection) go to the segment lying in the facing (x, z)
+        direction, as for a sign facing the closed stretch.
+        """
+        best, best_key = None, None
+        for edge in range(self.n_edges):
+            if not self.edge_positive[edge]:
+                continue
+            ax, az = self.node_xz(self.edge_from[edge])
+            bx, bz = self.node_xz(self.edge_to[edge])
+            t = ((x - ax) * (bx - ax) + (z - az) * (bz - az)) / self.spacing ** 2
+            t = min(max(t, 0.0), 1.0)
+            dist = ((ax + (bx - ax) * t - x) ** 2 + (az + (bz - az) * t - z) ** 2) ** 0.5
+            toward = 0.0
+            if facing is not None:
+                toward = (ax + bx) * 0.5 - x, (az + bz) * 0.5 - z
+                toward = toward[0] * facing[0] + toward[1] * facing[1]
+            key = (round(dist, 6), -toward)
+            if best_key is None or key < best_key:
+                best, best_key = edge, key
+        twin = self.edge_id(self.edge_axis[best], -1, self.edge_line[best], self.edge_seg[best])
+        return [int(best), int(twin)]
+
+
+class RoutingService:
+    """Route queries over a LaneGraph, with lazily filled next-hop tables."""
+    def __init__(self, graph, batch=64):
+        self.graph = graph
+        self.batch = batch
+        self.version = 0
+        self._invalidate()
+
+    @classmethod
+    def from_layout(cls, layout):
+        """Routing for a CityLayout, with its road works already closed."""
+        service = cls(LaneGraph.from_layout(layout))
+        for sign in layout.stop_signs:
+            if sign.kind == 'work':
+                service.close_works(sign)
+        return service
+
+    # -- closures ------------------------------------------------------
+
+    def _invalidate(self):
+        self._row = np.full(self.graph.n_nodes, -1, dtype=np.int32)    # destination -> table row
+        self._cost = np.empty((0, self.graph.n_edges), dtype=np.float32)
+        self._turn = np.empty((0, self.graph.n_edges), dtype=np.int8)
+        self._rows = 0
+
+    def set_closed(self, edges, closed=True):
+        """Close (or reopen) edges; drops every next-hop table."""
+        self.graph.closed[np.asarray(edges, dtype=np.int64)] = closed
+        self.version += 1
+        self._invalidate()
+
+    def close_works(self, placement):
+        """Close the road segment a WorkInProgress placement stands on (both directions)."""
+        r = radians(placement.rotation_y)
+        edges = self.graph.segment_edges_near(placement.position[0], placement.position[2],
+                                              facing=(sin(r), cos(r)))
+        self.set_closed(edges)
+        return edges
+
+    # -- next-hop tables -----------------------------------------------
+
+    def _fill(self, dests):
+        """Cost-to-go and best turn from every edge to each destination node (Bellman-Ford)."""
+        g = self.graph
+        succ_ok = (g.succ >= 0)
+        succ = np.where(succ_ok, g.succ, 0)
+        succ_ok &= ~g.closed[succ]
+        step = np.where(succ_ok, g.edge_length[succ] + g.turn_cost, np.inf)
+
+        base = np.where(g.edge_to[None, :] == np.asarray(dests)[:, None], 0.0, np.inf)
+        cost = base.copy()
+        for _ in range(g.n_edges):
+            options = step[None, :, :] + cost[:, succ]
+            relaxed = np.minimum(base, options.min(axis=2))
+            if np.array_equal(relaxed, cost):
+                break
+            cost = relaxed
+        options = step[None, :, :] + cost[:, succ]
+        turn = np.where(np.isfinite(options.min(axis=2)), options.argmin(axis=2), -1)
+        turn[base == 0] = -1        # arrived
+        first, last = self._rows, self._rows + len(dests)
+        if last > len(self._cost):
+            size = max(last, 2 * len(self._cost))
+            self._cost = np.resize(self._cost, (size, g.n_edges))
+            self._turn = np.resize(self._turn, (size, g.n_edges))
+        self._cost[first:last] = cost
+        self._turn[first:last] = turn
+        self._row[dests] = np.arange(first, last)
+        self._rows = last
+
+    def _ensure(self, dests):
+        """Table rows of dests, filling the missing ones."""
+        dests = np.asarray(dests, dtype=np.int64)
+        rows = self._row[dests]
+        if (rows < 0).any():
+            missing = np.unique(dests[rows < 0])
+            for i in range(0, len(missing), self.batch):
+                self._fill(missing[i:i + self.batch])
+            rows = self._row[dests]
+        return rows
+
+    def next_turn(self, dests, edges):
+        """
+        Turn (STRAIGHT / LEFT / RIGHT) to take at the end of each edge towards
+        its destination node; -1 where the edge ends at the destination or
+        the destination cannot be reached.
+        """
+        rows = self._ensure(dests)
+        return self._turn[rows, np.asarray(edges, dtype=np.int64)]
+
+    def cost(self, edge, dest):
+        row = self._ensure([dest])[0]
+        return float(self._cost[row, edge])
+
+    def route(self, edge, dest):
+        """Edges from `edge` to the first edge ending at dest, by next hops; [] if unreachable."""
+        row = self._ensure([dest])[0]
+        if not np.isfinite(self._cost[row, edge]):
+            return []
+        path = [int(edge)]
+        while self.graph.edge_to[path[-1]] != dest:
+            path.append(int(self.graph.succ[path[-1], self._turn[row, path[-1]]]))
+        return path
+
+    # -- one-off search ------------------------------------------------
+
+    def astar(self, edge, dest):
+        """A* from the end of `edge` to node dest; the edge list, or [] if unreachable."""
+        g = self.graph
+        gx, gz = g.node_xz(dest)
+
+        def h(e):
+            x, z = g.node_xz(g.edge_to[e])
+            return abs(x - gx) + abs(z - gz)
+
+        best = {edge: 0.0}
+        came = {}
+        frontier = [(h(edge), 0.0, edge)]
+        while frontier:
+            _, cost, e = heapq.heappop(frontier)
+            if g.edge_to[e] == dest:
+                path = [e]
+                while path[-1] in came:
+                    path.append(came[path[-1]])
+                return [int(p) for p in reversed(path)]
+            if cost > best[e]:
+                continue
+            for turn in (STRAIGHT, LEFT, RIGHT):
+                nxt = g.succ[e, turn]
+                if nxt < 0 or g.closed[nxt]:
+                    continue
+                new_cost = cost + g.edge_length[nxt] + g.turn_cost[e, turn]
+                if new_cost < best.get(nxt, np.inf):
+                    best[nxt] = new_cost
+                    came[nxt] = e
+                    heapq.heappush(frontier, (new_cost + h(nxt), new_cost, nxt))
+        return []
@@ -0,0 +1,157 @@
+# score_store.py - Write-behind persistence for the car game score
+
+"""
+Score changes are handed to a background thread instead of rewriting
+score.json on the render thread.
+
+The writer appends every scoring event to a journal (score.json.journal,
+one JSON object per line) and, at most every checkpoint_interval seconds,
+coalesces them into an atomic checkpoint: the new score is written to a
+temp file which then replaces score.json, after which the journal is
+truncated. On startup load() reads the checkpoint and replays any journal
+lines left behind by a crash, so at most the events still queued in memory
+are lost. close() (also registered with atexit) drains the queue and
+writes a final checkpoint.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+DEFAULT_SCORE = 100
+
+
+class ScoreStore:
+    def __init__(self, path='score.json', checkpoint_interval=5.0, default=DEFAULT_SCORE):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.checkpoint_interval = checkpoint_interval
+        self.default = default
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.last_score = None
+
+    # -- startup -------------------------------------------------------
+
+    def load(self):
+        """Return the persisted score, replaying the journal over the checkpoint."""
+        score = self.default
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    score = json.load(f).get('score', self.default)
+            except Exception as e:
+                print(f"Error loading score, defaulting to {self.default}: {e}")
+
+        replayed = False
+        if os.path.exists(self.journal_path):
+            try:
+                with open(self.journal_path, 'r') as f:
+                    for line in f:
+                        try:
+                            score = json.loads(line)['score']
+                            replayed = True
+                        except (ValueError, KeyError):
+                            break  # torn final write
+            except Exception as e:
+                print(f"Error reading score journal: {e}")
+
+        self.last_score = score
+        if replayed:
+            self._checkpoint(score)
+        return score
+
+    # -- render thread -------------------------------------------------
+
+    def record(self, score, delta=None):
+        """Queue a score change; never touches the disk on the caller's thread."""
+        if self._closed:
+            return
+        self.last_score = score
+        self._ensure_writer()
+        self._queue.put({'t': time.time(), 'delta': delta, 'score': score})
+
+    def flush(self):
+        """Block until every queued event is journalled and checkpointed."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Drain the queue, write a final checkpoint and stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # -- writer thread -------------------------------------------------
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        pending = None      # newest score not yet checkpointed
+        last_checkpoint = time.monotonic()
+        stop = False
+        while not stop:
+            timeout = max(0.0, self.checkpoint_interval - (time.monotonic() - last_checkpoint))
+            try:
+                items = [self._queue.get(timeout=timeout if pending is not None else None)]
+            except queue.Empty:
+                items = []
+            # Coalesce everything else that is already waiting.
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = [i for i in items if isinstance(i, dict)]
+            waiters = [i for i in items if isinstance(i, threading.Event)]
+            stop = None in items
+
+            if events:
+                self._append_journal(events)
+                pending = events[-1]['score']
+
+            due = time.monotonic() - last_checkpoint >= self.checkpoint_interval
+            if pending is not None and (due or waiters or stop):
+                self._checkpoint(pending)
+                pending = None
+                last_checkpoint = time.monotonic()
+            for w in waiters:
+                w.set()
+
+    def _append_journal(self, events):
+        try:
+            with open(self.journal_path, 'a') as f:
+                f.write(''.join(json.dumps(e) + '\n' for e in events))
+        except Exception as e:
+            print(f"Error writing score journal: {e}")
+
+    def _checkpoint(self, score):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'score': score}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            # Everything in the journal is now covered by the checkpoint.
+            open(self.journal_path, 'w').close()
+        except Exception as e:
+            print(f"Error saving score: {e}")
@@ -0,0 +1,525 @@
+# simulation.py - Headless simulation kernel for the car game
+
+"""
+A render-free model of the car game: car kinematics, road containment,
+the speed-limit / stop-sign / traffic-light rules and scoring.
+
+Nothing in here imports Ursina. The game in main.py builds its Entities
+from a CityLayout and mirrors the state of a DrivingSimulation every frame,
+while offline tools can step the same simulation thousands of times per
+second without opening a window.
+"""
+
+from math import sin, cos, radians
+
+from constants import BLOCK_SIZE, ROAD_WIDTH
+from road_index import DrivableAreaIndex
+from trigger_zones import TriggerZone, ZoneIndex, ZoneTracker
+from traffic_signals import SignalController, PhasePlan, RED, AMBER
+from traffic import TrafficFleet
+from routing import RoutingService
+from collision import CollisionWorld
+from frame_profiler import NULL_PROFILER
+
+# ---------------------------------------------------------------------
+# RULE CONSTANTS
+# ---------------------------------------------------------------------
+
+RULE_RADIUS = 15        # Distance at which a sign or light applies to the car.
+ANGLE_THRESHOLD = 15    # Cone half-angle (degrees) for a light to count as "in front".
+SPEED_LIMIT_KMH = 30
+KMH_PER_UNIT = 12       # max speed (5) * 12 = 60 km/h
+LIGHT_CYCLE = 20        # Seconds each signal group stays green in the default plan.
+CAR_HEIGHT = 0.3        # Car centre height above the ground.
+CAR_LENGTH = 3          # Entity.forward carries the car's z-scale, so it moves 3 units per speed unit.
+CAR_HALF_SIZE = (0.75, 1.5)     # Collision half extents (x, z) of the player car (Car scale / 2).
+NPC_HALF_SIZE = (0.75, 1.75)    # Same for NPC vehicles (their box in main.py).
+BUILDING_SIZE = 15      # Building footprint (main.py Building walls).
+PROP_HALF_SIZE = 0.5    # Collision half extent of sign and light posts.
+COLLISION_PENALTY = 5   # Points lost when the car hits a vehicle, building or prop.
+COLLISION_NOTICE = 2.0  # Seconds the collision warning stays up.
+RULES = ('speed_limit', 'stop', 'light', 'collision')   # Keys of DrivingSimulation.violations.
+
+# ---------------------------------------------------------------------
+# CITY LAYOUT
+# ---------------------------------------------------------------------
+
+class RoadRect:
+    """
+    Axis-aligned road rectangle in the xz-plane.
+    center: (x, z)
+    size: (length_in_x, length_in_z)
+    """
+    __slots__ = ('center', 'size', 'half_x', 'half_z')
+
+    def __init__(self, center, size):
+        self.center = (center[0], center[1])
+        self.size = (size[0], size[1])
+        self.half_x = size[0] * 0.5
+        self.half_z = size[1] * 0.5
+
+    def contains_xz(self, x, z):
+        return (abs(x - self.center[0]) <= self.half_x and
+                abs(z - self.center[1]) <= self.half_z)
+
+
+class Placement:
+    """
+    Position (x, y, z) and heading of a static prop such as a sign or light.
+    Lights also name their intersection and signal group (group 0 starts green).
+    """
+    __slots__ = ('kind', 'position', 'rotation_y', 'intersection', 'group')
+
+    def __init__(self, kind, position, rotation_y=0, intersection=0, group=0):
+        self.kind = kind
+        self.position = (position[0], position[1], position[2])
+        self.rotation_y = rotation_y
+        self.intersection = intersection
+        self.group = group
+
+
+class CityLayout:
+    """
+    Plain-data description of a generated city: roads, building plots,
+    crosswalks, signs, lights and the car spawn point. main.py turns each
+    entry into an Entity; the simulation only needs the numbers.
+    """
+    def __init__(self, grid_size, block_size=BLOCK_SIZE, road_width=ROAD_WIDTH):
+        self.grid_size = grid_size
+        self.block_size = block_size
+        self.road_width = road_width
+        self.cell_spacing = block_size + road_width
+        self.offset = -(grid_size // 2) * self.cell_spacing
+
+        self.roads = []
+        self.buildings = []         # (x, z) block centres
+        self.crosswalks = []        # (x, z, orientation)
+        self.intersections = []     # (x, z) of signalled intersections
+        self.speed_limit_signs = []
+        self.stop_signs = []        # StopSign and WorkInProgress placements
+        self.traffic_lights = []
+
+        self._build()
+
+    def _build(self):
+        offset, spacing, grid = self.offset, self.cell_spacing, self.grid_size
+        width = self.road_width
+        length = grid * spacing
+
+        for j in range(grid + 1):
+            self.roads.append(RoadRect(center=(0, offset + j * spacing), size=(length, width)))
+        for i in range(grid + 1):
+            self.roads.append(RoadRect(center=(offset + i * spacing, 0), size=(width, length)))
+
+        for i in range(grid):
+            for j in range(grid):
+                self.buildings.append((offset + i * spacing + spacing * 0.5,
+                                       offset + j * spacing + spacing * 0.5))
+
+        # Crosswalks and lights sit on the first interior intersection.
+        cx = cz = offset + spacing
+        off = width - 1.5
+        self.crosswalks += [(cx, cz + off, 'vertical'), (cx, cz - off, 'vertical'),
+                            (cx + off, cz, 'horizontal'), (cx - off, cz, 'horizontal')]
+
+        self.intersections.append((cx, cz))
+        self.traffic_lights += [
+            Placement('light', (cx + width / 2, -3, cz), rotation_y=90, group=0),
+            Placement('light', (cx, -3, cz + width / 2), rotation_y=0, group=1),
+            Placement('light', (cx - width / 2, -3, cz), rotation_y=-90, group=1),
+            Placement('light', (cx, -3, cz - width / 2), rotation_y=180, group=0),
+        ]
+
+        self.speed_limit_signs.append(
+            Placement('speed_limit', (offset - width * 0.4, 0, offset + spacing)))
+
+        self.stop_signs += [
+            Placement('stop', (offset - 2 + 2 * spacing, 0, offset + 2 * spacing), rotation_y=90),
+            Placement('stop', (offset + 2 * spacing, 0, offset - 2), rotation_y=90),
+            Placement('work', (offset + 2 * spacing, 0, offset + spacing), rotation_y=90),
+        ]
+
+        self.road_index = DrivableAreaIndex(self.roads)
+
+    @property
+    def car_start(self):
+        """(x, y, z, rotation_y) of the player spawn: bottom row, facing east."""
+        return (self.offset + self.cell_spacing, CAR_HEIGHT,
+                self.offset + self.road_width * 0.35, 90)
+
+
+def is_on_road(x, z, roads):
+    """Return True if (x, z) lies on any road. Linear scan; see CityLayout.road_index."""
+    for r in roads:
+        if r.contains_xz(x, z):
+            return True
+    return False
+
+def build_signals(layout, plan=None, offsets=None):
+    """
+    Create a SignalController with one plan per layout intersection and one
+    light per traffic light placement (light ids follow layout order).
+    offsets: optional per-intersection start offsets in seconds (green waves).
+    """
+    plan = plan or PhasePlan.two_phase(LIGHT_CYCLE)
+    signals = SignalController()
+    for i in range(len(layout.intersections)):
+        signals.add_intersection(plan, offsets[i] if offsets else 0.0)
+    for light in layout.traffic_lights:
+        signals.add_light(light.intersection, light.group)
+    return signals
+
+
+def build_rule_zones(layout):
+    """
+    Index the layout's signs and lights as trigger zones by road cell.
+    Light zones target the light's id in the SignalController (its position
+    in layout.traffic_lights) and
+    require the light to sit inside the car's ANGLE_THRESHOLD view cone.
+    """
+    index = ZoneIndex(layout.cell_spacing)
+    for sign in layout.speed_limit_signs:
+        index.add(TriggerZone('speed_limit', sign.position, RULE_RADIUS))
+    for sign in layout.stop_signs:
+        index.add(TriggerZone('stop', sign.position, RULE_RADIUS))
+    for i, light in enumerate(layout.traffic_lights):
+        index.add(TriggerZone('light', light.position, RULE_RADIUS,
+                              view_cone=ANGLE_THRESHOLD, target=i))
+    return index
+
+
+def add_static_colliders(world, buildings=(), props=()):
+    """
+    Register buildings ((x, z) or (x, z, width, height) tuples) and sign / light
+    Placements as static boxes; returns their static ids.
+    """
+    ids = []
+    for building in buildings:
+        half = (building[2] if len(building) > 2 else BUILDING_SIZE) * 0.5
+        ids.append(world.add_static('building', building[:2], half, half))
+    for prop in props:
+        ids.append(world.add_static('prop', (prop.position[0], prop.position[2]),
+                                    PROP_HALF_SIZE, PROP_HALF_SIZE))
+    return ids
+
+# ---------------------------------------------------------------------
+# DYNAMIC STATE
+# ---------------------------------------------------------------------
+
+class Controls:
+    """One tick of driver input. Mirrors the W/A/S/D + space key bindings."""
+    __slots__ = ('forward', 'back', 'left', 'right', 'brake')
+
+    def __init__(self, forward=False, back=False, left=False, right=False, brake=False):
+        self.forward = forward
+        self.back = back
+        self.left = left
+        self.right = right
+        self.brake = brake
+
+    @classmethod
+    def from_keys(cls, keys):
+        """Build controls from Ursina's held_keys or any mapping of key -> pressed."""
+        return cls(bool(keys['w']), bool(keys['s']), bool(keys['a']),
+                   bool(keys['d']), bool(keys['space']))
+
+    @property
+    def bits(self):
+        """The five keys packed into one byte (forward = bit 0 ... brake = bit 4)."""
+        return (self.forward | self.back << 1 | self.left << 2
+                | self.right << 3 | self.brake << 4)
+
+    @classmethod
+    def from_bits(cls, bits):
+        return cls(bool(bits & 1), bool(bits & 2), bool(bits & 4), bool(bits & 8), bool(bits & 16))
+
+
+class CarState:
+    """Kinematic state of the player car."""
+    def __init__(self, x, y, z, rotation_y):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.rotation_y = rotation_y
+        self.speed = 0
+        self.acceleration = 1
+        self.max_speed = 5
+        self.turn_speed = 100
+
+    @property
+    def position(self):
+        return (self.x, self.y, self.z)
+
+    @property
+    def forward(self):
+        """Unit heading in the xz-plane, matching Entity.forward for rotation_y."""
+        r = radians(self.rotation_y)
+        return (sin(r), cos(r))
+
+    @property
+    def speed_kmh(self):
+        return abs(round(self.speed * KMH_PER_UNIT))
+
+    @property
+    def pose(self):
+        return (self.x, self.y, self.z, self.rotation_y)
+
+
+class Notice:
+    """A HUD message produced by a rule check: text plus 'red' or 'green'."""
+    __slots__ = ('text', 'color')
+
+    def __init__(self, text='', color='red'):
+        self.text = text
+        self.color = color
+
+    def set(self, text, color=None):
+        self.text = text
+        if color is not None:
+            self.color = color
+
+# ---------------------------------------------------------------------
+# SIMULATION
+# ---------------------------------------------------------------------
+
+class DrivingSimulation:
+    """
+    One driving session. Call step(controls, dt) once per tick.
+
+    on_score_change, if given, is called with the new score and the change
+    every time a rule awards or deducts points (main.py uses it to persist
+    the score).
+    signal_plan / signal_offsets configure the traffic lights (see build_signals).
+    npc_count adds a TrafficFleet of NPC vehicles (grid layouts only).
+    Grid layouts also get a RoutingService (routes) with their road works closed.
+    collisions is a CollisionWorld holding the car, the NPCs and the city's
+    buildings and props; hitting any of them costs COLLISION_PENALTY.
+    violations counts the point deductions made under each rule in RULES.
+    profiler, if given, is a FrameProfiler timing each phase of step().
+    """
+    def __init__(self, layout, initial_score=100, on_score_change=None,
+                 signal_plan=None, signal_offsets=None, npc_count=0, npc_seed=0, profiler=None):
+        self.layout = layout
+        self.profiler = profiler or NULL_PROFILER
+        self.settings = dict(initial_score=initial_score, npc_count=npc_count, npc_seed=npc_seed,
+                             signal_plan=signal_plan, signal_offsets=signal_offsets)
+        self.road_index = layout.road_index
+        self.car = CarState(*layout.car_start)
+        self.previous_pose = self.car.pose     # car pose before the last step, for interpolation
+        self.signals = build_signals(layout, signal_plan, signal_offsets)
+        self.zones = build_rule_zones(layout)
+        self.zone_tracker = ZoneTracker(self.zones)
+        self.routes = RoutingService.from_layout(layout) if hasattr(layout, 'grid_size') else None
+        self.traffic = None
+        if npc_count:
+            self.traffic = TrafficFleet(layout, self.signals, npc_count, npc_seed, router=self.routes,
+                                        player_half_size=CAR_HALF_SIZE, player_speed_scale=CAR_LENGTH)
+        self.collisions = self._build_collisions(layout)
+        self.zone_events = []
+        self.score = initial_score
+        self.violations = dict.fromkeys(RULES, 0)
+        self.on_score_change = on_score_change
+        self.tick = 0
+        self.time = 0.0
+
+        self.penalty_timer = 0
+        self.work_penalty_timer = 0
+        self.traffic_penalty_timer = 0
+        self.collision_timer = 0
+
+        self.speed_warning = Notice()
+        self.work_warning = Notice()
+        self.traffic_warning = Notice()
+        self.collision_warning = Notice()
+
+    # -- snapshots -----------------------------------------------------
+
+    _TIMERS = ('penalty_timer', 'work_penalty_timer', 'traffic_penalty_timer', 'collision_timer')
+    _NOTICES = ('speed_warning', 'work_warning', 'traffic_warning', 'collision_warning')
+
+    def snapshot(self):
+        """
+        All state that changes while driving, as plain data. The layout, the
+        routing tables and the rule zones are rebuilt from the layout instead.
+        """
+        car = self.car
+        return {
+            'car': (car.x, car.y, car.z, car.rotation_y, car.speed),
+            'previous_pose': self.previous_pose,
+            'score': self.score, 'tick': self.tick, 'time': self.time,
+            'violations': dict(self.violations),
+            'timers': [getattr(self, name) for name in self._TIMERS],
+            'notices': [(getattr(self, name).text, getattr(self, name).color) for name in self._NOTICES],
+            'zones': self.zone_tracker.snapshot(),
+            'zone_events': [(event, zone.zone_id) for event, zone in self.zone_events],
+            'signals': self.signals.snapshot(),
+            'traffic': self.traffic.snapshot() if self.traffic is not None else None,
+            'collisions': self.collisions.snapshot(),
+        }
+
+    def restore(self, state):
+        """Return to a snapshot() taken from a simulation of the same layout and settings."""
+        car = self.car
+        car.x, car.y, car.z, car.rotation_y, car.speed = state['car']
+        self.previous_pose = state['previous_pose']
+        self.score, self.tick, self.time = state['score'], state['tick'], state['time']
+        self.violations = dict(state['violations'])
+        for name, value in zip(self._TIMERS, state['timers']):
+            setattr(self, name, value)
+        for name, (text, color) in zip(self._NOTICES, state['notices']):
+            getattr(self, name).set(text, color)
+        self.zone_tracker.restore(state['zones'])
+        self.zone_events = [(event, self.zones.zones[i]) for event, i in state['zone_events']]
+        self.signals.restore(state['signals'])
+        if self.traffic is not None:
+            self.traffic.restore(state['traffic'])
+        self.collisions.restore(state['collisions'])
+
+    def _build_collisions(self, layout):
+        world = CollisionWorld(static_cell=layout.cell_spacing)
+        car = self.car
+        self.car_body = world.add_dynamic('car', car.x, car.z, *CAR_HALF_SIZE, car.rotation_y)
+        self.npc_bodies = None
+        if self.traffic is not None:
+            t = self.traffic
+            self.npc_bodies = world.add_dynamic('npc', t.x, t.z, *NPC_HALF_SIZE, t.rotation_y)
+        add_static_colliders(world, getattr(layout, 'buildings', ()),
+                             layout.speed_limit_signs + layout.stop_signs + layout.traffic_lights)
+        for kind in ('npc', 'building', 'prop'):
+            world.on('car', kind, self.on_car_collision)
+        return world
+
+    def change_score(self, delta, rule=None):
+        """Apply a score change; a deduction under a rule counts as a violation of it."""
+        self.score += delta
+        if rule is not None and delta < 0:
+            self.violations[rule] += 1
+        if self.on_score_change:
+            self.on_score_change(self.score, delta)
+
+    def step(self, controls, dt):
+        profiler = self.profiler
+        self.previous_pose = self.car.pose
+        with profiler.scope('physics'):
+            self.move_car(controls, dt)
+        car = self.car
+        with profiler.scope('rules'):
+            fx, fz = car.forward
+            self.zone_events = self.zone_tracker.update(car.x, car.y, car.z, fx, fz, car.rotation_y)
+            speed_kmh = self.car.speed_kmh
+            self.check_speed_limit(speed_kmh, dt)
+            self.check_stop_signs(dt)
+            self.check_traffic_lights(speed_kmh, dt)
+        if self.traffic is not None:
+            with profiler.scope('traffic'):
+                self.traffic.step(dt, car)
+        with profiler.scope('collisions'):
+            self.check_collisions(dt)
+        with profiler.scope('signals'):
+            self.signals.step(dt)
+        self.tick += 1
+        self.time += dt
+
+    # -- kinematics ----------------------------------------------------
+
+    def move_car(self, controls, dt):
+        car = self.car
+        # Acceleration / braking
+        if controls.forward:
+            car.speed += car.acceleration * dt
+        elif controls.back:
+            car.speed -= car.acceleration * dt
+        else:
+            car.speed += (0 - car.speed) * (1 * dt)
+        if controls.brake:
+            car.speed += (0 - car.speed) * (10 * dt)
+        car.speed = max(min(car.speed, car.max_speed), -car.max_speed / 2)
+
+        # Steering
+        direction = -1 if controls.left else (1 if controls.right else 0)
+        car.rotation_y += direction * car.turn_speed * dt * (abs(car.speed) / car.max_speed)
+
+        # Movement
+        fx, fz = car.forward
+        stride = CAR_LENGTH * car.speed * dt
+        new_x = car.x + fx * stride
+        new_z = car.z + fz * stride
+        if self.road_index.contains(new_x, new_z):
+            car.x, car.z = new_x, new_z
+        else:
+            car.speed = 0
+
+    # -- rules ---------------------------------------------------------
+
+    def _accrue(self, timer, dt, delta, rule):
+        """Advance a rule timer; every full second award delta points."""
+        timer += dt
+        if timer >= 1:
+            self.change_score(delta, rule)
+            timer = 0
+        return timer
+
+    def check_speed_limit(self, speed_kmh, dt):
+        if self.zone_tracker.first('speed_limit'):
+            if speed_kmh > SPEED_LIMIT_KMH:
+                self.speed_warning.set("Speed limit 30, do not exceed!", 'red')
+                self.penalty_timer = self._accrue(self.penalty_timer, dt, -1, 'speed_limit')
+            else:
+                self.speed_warning.set("Good job! Following speed limit!", 'green')
+                self.penalty_timer = self._accrue(self.penalty_timer, dt, +1, 'speed_limit')
+        else:
+            self.speed_warning.set("")
+            self.penalty_timer = 0
+
+    def check_stop_signs(self, dt):
+        if self.zone_tracker.first('stop'):
+            self.work_warning.set("STOP: Work In Progress")
+            self.work_penalty_timer = self._accrue(self.work_penalty_timer, dt, -1, 'stop')
+        else:
+            self.work_warning.set("")
+            self.work_penalty_timer = 0
+
+    def check_collisions(self, dt):
+        world, car = self.collisions, self.car
+        world.move(self.car_body, car.x, car.z, car.rotation_y)
+        if self.traffic is not None:
+            t = self.traffic
+            world.move(self.npc_bodies, t.x, t.z, t.rotation_y)
+        self.collision_timer = max(self.collision_timer - dt, 0)
+        world.step()
+        if not self.collision_timer:
+            self.collision_warning.set("")
+
+    def on_car_collision(self, car_body, other):
+        self.collision_warning.set("Collision! Watch the road!", 'red')
+        self.collision_timer = COLLISION_NOTICE
+        self.change_score(-COLLISION_PENALTY, 'collision')
+
+    def check_traffic_lights(self, speed_kmh, dt):
+        zone = self.zone_tracker.first('light')
+        if zone is None:
+            self.traffic_warning.set("")
+            self.traffic_penalty_timer = 0
+            return
+
+        moving = speed_kmh > 1
+        light = self.signals.color(zone.target)
+        if light == AMBER:
+            self.traffic_warning.set("Amber light! Prepare to stop.", 'red')
+            self.traffic_penalty_timer = 0
+            return
+        if light == RED:
+            if moving:
+                self.traffic_warning.set("Red Light! Stop the car!", 'red')
+                delta = -1
+            else:
+                self.traffic_warning.set("Stopped at red light, good job!", 'green')
+                delta = +1
+        else:
+            if moving:
+                self.traffic_warning.set("Green Light! Keep going!", 'green')
+                delta = +1
+            else:
+                self.traffic_warning.set("Green Light! You should move!", 'red')
+                delta = -1
+        self.traffic_penalty_timer = self._accrue(self.traffic_penalty_timer, dt, delta, 'light')
@@ -0,0 +1,138 @@
+# static_batch.py - Merge non-moving city geometry into a few combined meshes
+
+"""
+Roads, building walls and roofs and crosswalk stripes never move, yet each
+one is a separate Entity (and draw call). StaticBatcher collects those
+Entities, groups them by material (texture) and optionally by map tile,
+and merges each group into a single Mesh once the city is built.
+
+Vertices are transformed into world space with NumPy using each Entity's
+transform matrix, so building the batch does not walk scene.entities the
+way Entity.combine() does. Source Entities are destroyed afterwards; their
+world-space bounding boxes are kept in `colliders` so collision queries do
+not depend on the render geometry. Entities whose model is not a Mesh (a
+loaded NodePath has no .vertices) cannot be merged; like Entity.combine()
+they are skipped, and are kept as they are, listed in `unbatched`.
+"""
+
+import numpy as np
+from ursina import Entity, Mesh, destroy, scene
+
+
+class StaticBatcher:
+    """
+    tile_size: if given, batches are split into square tiles of this many
+    world units so distant tiles can later be culled independently.
+    """
+    def __init__(self, tile_size=None):
+        self.tile_size = tile_size
+        self._groups = {}       # (material key, tile) -> [(entity, tag)]
+        self._textures = {}     # material key -> texture
+        self.colliders = []     # (tag, (min_x, min_y, min_z), (max_x, max_y, max_z))
+        self.batches = {}       # (material key, tile) -> combined Entity
+        self.bounds = {}        # (material key, tile) -> (min_xyz, max_xyz) of the batch
+        self.unbatched = []     # queued Entities left as they were (model has no vertices)
+        self._empty_roots = []
+
+    def add(self, entity, tag=None):
+        """Queue a static Entity (and none of its children) for batching."""
+        texture = entity.texture
+        key = getattr(texture, 'name', None) if texture else None
+        self._textures[key] = texture
+        tile = None
+        if self.tile_size:
+            p = entity.world_position
+            tile = (int(p.x // self.tile_size), int(p.z // self.tile_size))
+        self._groups.setdefault((key, tile), []).append((entity, tag))
+
+    def add_tree(self, root, tag=None):
+        """Queue every model-bearing Entity under root, then drop the empty root."""
+        for e in [root] + list(root.children):
+            if e.model is not None:
+                self.add(e, tag)
+        self._empty_roots.append(root)
+
+    def build(self):
+        """Combine every queued group; returns the combined Entities."""
+        for (key, tile), members in self._groups.items():
+            first = len(self.colliders)
+            model = self._combine(members)
+            if model is None:
+                continue
+            batch = Entity(model=model, name=f'static_batch_{key}_{tile}')
+            boxes = self.colliders[first:]
+            if boxes:
+                self.bounds[(key, tile)] = (tuple(min(b[1][i] for b in boxes) for i in range(3)),
+                                            tuple(max(b[2][i] for b in boxes) for i in range(3)))
+            if self._textures.get(key):
+                batch.texture = self._textures[key]
+            self.batches[(key, tile)] = batch
+        kept = set(map(id, self.unbatched))
+        for members in self._groups.values():
+            for entity, _ in members:
+                if id(entity) in kept:
+                    entity.world_parent = scene     # outlive a destroyed add_tree() root
+                else:
+                    destroy(entity)
+        for root in self._empty_roots:
+            if id(root) not in kept:
+                destroy(root)
+        self._groups = {}
+        self._empty_roots = []
+        return list(self.batches.values())
+
+    def _combine(self, members):
+        verts, tris, uvs, cols = [], [], [], []
+        offset = 0
+        for entity, tag in members:
+            model = entity.model
+            if not hasattr(model, 'vertices'):
+                self.unbatched.append(entity)
+                continue
+            if not model.vertices:
+                continue
+            local = np.array([tuple(v) for v in model.vertices], dtype=np.float64)
+            m = entity.getMat(scene)
+            mat = np.array([[m.getCell(r, c) for c in range(4)] for r in range(4)])
+            # Panda3D uses row vectors: p' = p * M
+            world = local @ mat[:3, :3] + mat[3, :3]
+            verts.append(world)
+            self.colliders.append((tag, tuple(world.min(axis=0).tolist()),
+                                   tuple(world.max(axis=0).tolist())))
+
+            tris.append(np.asarray(_flat_triangles(model), dtype=np.int64) + offset)
+            offset += len(local)
+
+            if model.uvs and len(model.uvs) == len(local):
+                uvs.append(np.array([tuple(uv) for uv in model.uvs], dtype=np.float64))
+            else:
+                uvs.append(np.zeros((len(local), 2)))
+            if model.colors and len(model.colors) == len(local):
+                cols.append(np.array([tuple(c) for c in model.colors], dtype=np.float64))
+            else:
+                cols.append(np.tile(tuple(entity.color), (len(local), 1)))
+
+        if not verts:
+            return None
+        return Mesh(
+            vertices=[tuple(v) for v in np.concatenate(verts)],
+            triangles=np.concatenate(tris).tolist(),
+            uvs=[tuple(uv) for uv in np.concatenate(uvs)],
+            colors=[tuple(c) for c in np.concatenate(cols)],
+            mode='triangle',
+        )
+
+
+def _flat_triangles(model):
+    """Model triangles as a flat index list, splitting quads like Entity.combine()."""
+    if not model.triangles:
+        return list(range(len(model.vertices)))
+    flat = []
+    for t in model.triangles:
+        if isinstance(t, int):
+            flat.append(t)
+        elif len(t) == 3:
+            flat.extend(t)
+        elif len(t) == 4:
+            flat.extend([t[0], t[1], t[2], t[2], t[3], t[0]])
+    return flat
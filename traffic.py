@@ -0,0 +1,580 @@
+# traffic.py - Vectorized NPC traffic fleet on the city road grid
+
+"""
+Every NPC vehicle is one row in a set of NumPy arrays, and the whole fleet
+advances in a single vectorized step; there is no per-vehicle Entity
+update().
+
+Vehicles drive in lanes on the CityLayout grid. A lane is one direction
+of one road line; it sits road_width * LANE_FRACTION to the left of the
+road centre (the same side the player starts on). Per vehicle we keep:
+
+    axis    0 = travelling along x, 1 = along z
+    dir     +1 / -1 along that axis
+    line    index of the road line the lane belongs to
+    lat     lateral coordinate of the lane (z for axis 0, x for axis 1)
+    s       position along the axis
+    v       speed (world units / s)
+    turn    choice at the next intersection: STRAIGHT, LEFT or RIGHT
+    next_k  grid index (along the axis) of the next intersection ahead
+
+Speeds follow the Intelligent Driver Model: each vehicle accelerates
+towards its desired speed and brakes for the nearest obstacle ahead, which
+is either the vehicle in front in the same lane (found with one lexsort of
+the fleet by lane and position), a stop line, or the player car wherever
+its footprint reaches into the lane (parked across a junction, say).
+
+Stop lines come from the layout: a signalled approach is blocked while the
+light a player would see there is red (or amber and the vehicle can still
+stop comfortably), read straight from the SignalController arrays. Stop
+and work signs make their nearest intersection an all-way stop: vehicles
+halt at the line for STOP_DWELL seconds before going on.
+
+With a RoutingService, each vehicle heads for a destination intersection
+and takes the turn its next-hop table gives (see routing.py); otherwise
+turns are random.
+
+Turns happen where the current lane crosses the target lane, so the
+vehicle never jumps sideways; a turning vehicle waits at the line until
+the lane it joins has a gap, the player included; after COURTESY seconds
+the vehicle coming up behind the merge point holds back to leave one.
+Vehicles only pick turns that stay on the grid.
+
+Gridlock: a vehicle going straight does not enter a junction while the
+traffic it follows is stopped just past it (don't block the box), and a
+vehicle that has stood at the head of its queue for PATIENCE seconds with
+no light or sign holding it (its way is blocked by a full lane or by the
+player) picks another exit it can still reach; routing takes it on to its
+destination from there. As a last resort (a packed city can still lock
+up in rings of full blocks, and a parked player blocks its lane for
+good), a vehicle that has not moved for JAM_TIMEOUT seconds is taken off
+the road and put back in a free spawn slot elsewhere.
+
+Cross traffic going straight over an unsignalled junction is not
+resolved, and at the city's four outer corners the outer lanes cut across
+the corner square the edge roads leave open.
+"""
+
+from math import cos, radians, sin
+
+import numpy as np
+
+from traffic_signals import RED, AMBER
+
+STRAIGHT, LEFT, RIGHT = 0, 1, 2
+
+LANE_FRACTION = 0.3     # Lane centre offset from the road centre, as a fraction of road width.
+VEHICLE_LENGTH = 4.0    # Bumper-to-bumper length used for gaps (and spawn spacing).
+VEHICLE_WIDTH = 1.5     # Side-to-side width, for the player's footprint test.
+STOP_DWELL = 1.0        # Seconds a vehicle waits at a stop sign.
+PATIENCE = 5.0          # Seconds stuck at the head of a queue before taking another exit.
+COURTESY = 1.0          # Seconds a turning vehicle waits before traffic behind its merge point yields.
+JAM_TIMEOUT = 60.0      # Seconds standing still before a vehicle is moved to a free spawn slot.
+
+# Intelligent Driver Model parameters (world units, seconds).
+IDM_SPEED = 4.0         # Desired speed (world units/s; the player tops out at 5 * CAR_LENGTH = 15).
+IDM_ACCEL = 1.5         # Maximum acceleration.
+IDM_BRAKE = 2.0         # Comfortable deceleration.
+IDM_GAP = 2.0           # Minimum standstill gap.
+IDM_HEADWAY = 1.2       # Desired time headway.
+
+TURN_WEIGHTS = (0.6, 0.2, 0.2)  # Straight / left / right preference at intersections.
+
+
+class TrafficFleet:
+    """
+    NPC vehicles on a CityLayout grid.
+
+    layout: a CityLayout (needs grid_size, offset, cell_spacing, road_width)
+    signals: the simulation's SignalController
+    count: number of vehicles; capped by the spawn slots on open (router) lanes
+    router: optional RoutingService; vehicles then drive to random destination
+            nodes along next-hop routes instead of turning at random
+    player_half_size: (x, z) half extents of the player car passed to step()
+    player_speed_scale: world units per unit of the player's speed
+    """
+    def __init__(self, layout, signals, count, seed=0, desired_speed=IDM_SPEED, router=None,
+                 player_half_size=(0.75, 1.5), player_speed_scale=1.0):
+        self.layout = layout
+        self.signals = signals
+        self.router = router
+        self.grid = layout.grid_size
+        self.offset = layout.offset
+        self.spacing = layout.cell_spacing
+        self.lane_offset = layout.road_width * LANE_FRACTION
+        self.stop_back = layout.road_width * 0.5 + 1.0   # stop line distance before the node centre
+        self.rng = np.random.default_rng(seed)
+        self.desired_speed = desired_speed
+        self.player_half_size = player_half_size
+        self.player_speed_scale = player_speed_scale
+        self.time = 0.0
+
+        self._build_controls(layout)
+        self._spawn(count)
+
+    # -- setup ---------------------------------------------------------
+
+    def _node(self, x, z):
+        """Grid index (i, j) of the intersection nearest to (x, z), or None if off-grid."""
+        i = int(round((x - self.offset) / self.spacing))
+        j = int(round((z - self.offset) / self.spacing))
+        if 0 <= i <= self.grid and 0 <= j <= self.grid:
+            return i, j
+        return None
+
+    def _build_controls(self, layout):
+        """Per-node, per-approach light ids and all-way stop flags."""
+        n = self.grid + 1
+        half = layout.road_width * 0.5
+        # approach = axis * 2 + (dir > 0); -1 = unsignalled
+        self.node_light = np.full((n, n, 4), -1, dtype=np.int64)
+        for ix, (cx, cz) in enumerate(layout.intersections):
+            node = self._node(cx, cz)
+            if node is None:
+                continue
+            for axis in (0, 1):
+                for d in (-1, 1):
+                    ax = cx + (d * half if axis == 0 else 0)
+                    az = cz + (d * half if axis == 1 else 0)
+                    best, best_dist = -1, half
+                    for light_id, light in enumerate(layout.traffic_lights):
+                        if light.intersection != ix:
+                            continue
+                        dist = ((light.position[0] - ax) ** 2 + (light.position[2] - az) ** 2) ** 0.5
+                        if dist < best_dist:
+                            best, best_dist = light_id, dist
+                    self.node_light[node[0], node[1], axis * 2 + (d > 0)] = best
+
+        self.node_stop = np.zeros((n, n), dtype=bool)
+        for sign in layout.stop_signs:
+            node = self._node(sign.position[0], sign.position[2])
+            if node is not None:
+                self.node_stop[node] = True
+
+    def _spawn(self, count):
+        """Place vehicles in free slots between intersections, spread over all lanes."""
+        g, spacing = self.grid, self.spacing
+        per_block = max(int((spacing - 2 * self.stop_back) // (VEHICLE_LENGTH + IDM_GAP)), 1)
+        slots = []
+        for axis in (0, 1):
+            for d in (-1, 1):
+                for line in range(g + 1):
+                    for k in range(g):
+                        start = self.offset + k * spacing + self.stop_back
+                        for m in range(per_block):
+                            slots.append((axis, d, line, start + (m + 0.5) * (VEHICLE_LENGTH + IDM_GAP)))
+        self._slots = np.array(slots, dtype=np.float64).reshape(-1, 4)
+        usable = np.nonzero(self._open_slots())[0]
+        if count > len(usable):
+            print(f"Only {len(usable)} NPC spawn slots in this city; spawning {len(usable)} of {count}")
+            count = len(usable)
+        chosen = self._slots[self.rng.choice(usable, count, replace=False)]
+
+        self.axis = np.zeros(count, dtype=np.int8)
+        self.dir = np.zeros(count)
+        self.line = np.zeros(count, dtype=np.int64)
+        self.lat = np.zeros(count)
+        self.s = np.zeros(count)
+        self.next_k = np.zeros(count, dtype=np.int64)
+        self.turn = np.zeros(count, dtype=np.int8)
+        self.stop_timer = np.zeros(count)
+        self.cleared = np.full(count, -1, dtype=np.int64)   # flat id of the stop node already obeyed
+        self.wait = np.zeros(count)                         # seconds standing still
+        self.destination = np.full(count, -1, dtype=np.int64)
+        self._place(np.arange(count), chosen)
+        self.v = self.rng.uniform(0, self.desired_speed, count)
+        if self.router is not None:
+            self.destination = self.rng.integers(self.router.graph.n_nodes, size=count)
+        self._choose_turns(np.ones(count, dtype=bool))
+        self.previous_x, self.previous_z = self.x.copy(), self.z.copy()
+
+    def _open_slots(self):
+        """Mask of the spawn slots not on a lane the router has closed (e.g. road works)."""
+        slots = self._slots
+        if self.router is None:
+            return np.ones(len(slots), dtype=bool)
+        seg = np.clip((slots[:, 3] - self.offset) // self.spacing, 0, self.grid - 1).astype(np.int64)
+        graph = self.router.graph
+        edges = graph.edge_id(slots[:, 0].astype(np.int64), slots[:, 1], slots[:, 2].astype(np.int64), seg)
+        return ~graph.closed[edges]
+
+    def _place(self, idx, slots):
+        """Put vehicles idx at spawn slots (rows of axis, dir, line, s), standing still."""
+        self.axis[idx] = slots[:, 0]
+        self.dir[idx] = slots[:, 1]
+        self.line[idx] = slots[:, 2]
+        self.s[idx] = slots[:, 3]
+        road = self.offset + self.line[idx] * self.spacing
+        d = self.dir[idx]
+        self.lat[idx] = np.where(self.axis[idx] == 0, road + d * self.lane_offset, road - d * self.lane_offset)
+        k = (self.s[idx] - self.offset) / self.spacing
+        self.next_k[idx] = np.where(d > 0, np.floor(k) + 1, np.ceil(k) - 1)
+        self.stop_timer[idx] = 0.0
+        self.cleared[idx] = -1
+        self.wait[idx] = 0.0
+
+    def __len__(self):
+        return len(self.s)
+
+    _STATE = ('axis', 'dir', 'line', 'lat', 's', 'v', 'next_k', 'turn', 'stop_timer',
+              'cleared', 'wait', 'destination', 'previous_x', 'previous_z')
+
+    def snapshot(self):
+        """Copies of the per-vehicle arrays, the clock and the RNG state."""
+        state = {name: getattr(self, name).copy() for name in self._STATE}
+        state['time'] = self.time
+        state['rng'] = self.rng.bit_generator.state
+        return state
+
+    def restore(self, state):
+        for name in self._STATE:
+            setattr(self, name, state[name].copy())
+        self.time = state['time']
+        self.rng.bit_generator.state = state['rng']
+
+    # -- derived state -------------------------------------------------
+
+    @property
+    def x(self):
+        return np.where(self.axis == 0, self.s, self.lat)
+
+    @property
+    def z(self):
+        return np.where(self.axis == 0, self.lat, self.s)
+
+    @property
+    def rotation_y(self):
+        """Entity-style headings: +x = 90, -x = 270, +z = 0, -z = 180."""
+        return np.where(self.axis == 0, np.where(self.dir > 0, 90.0, 270.0),
+                        np.where(self.dir > 0, 0.0, 180.0))
+
+    def _turn_dir(self, turn):
+        """Direction along the new axis after a LEFT / RIGHT turn (see module doc)."""
+        left = np.where(self.axis == 0, self.dir, -self.dir)
+        return np.where(turn == LEFT, left, -left)
+
+    def _turn_point(self, turn, node_s):
+        """Position along the axis where each turn leaves the lane: the node centre, or the lane crossing."""
+        new_dir = self._turn_dir(turn)
+        crossing = np.where(self.axis == 0, node_s - new_dir * self.lane_offset,
+                            node_s + new_dir * self.lane_offset)
+        return np.where(turn == STRAIGHT, node_s, crossing)
+
+    def _valid_turns(self, idx):
+        """(can_straight, can_left, can_right) at next_k: the exits that stay on the grid."""
+        g = self.grid
+        ahead = self.next_k[idx] + self.dir[idx].astype(np.int64)
+        can_straight = (ahead >= 0) & (ahead <= g)
+        left_line = self.line[idx] + np.where(self.axis[idx] == 0, self.dir[idx], -self.dir[idx]).astype(np.int64)
+        right_line = 2 * self.line[idx] - left_line
+        can_left = (left_line >= 0) & (left_line <= g)
+        can_right = (right_line >= 0) & (right_line <= g)
+        return can_straight, can_left, can_right
+
+    def _open_exits(self, idx):
+        """(len(idx), 3) mask of the exits at next_k not onto a lane the router has closed."""
+        if self.router is None:
+            return np.ones((len(idx), 3), dtype=bool)
+        graph = self.router.graph
+        edge = graph.edge_ending_at(self.axis[idx], self.dir[idx], self.line[idx], self.next_k[idx])
+        succ = graph.succ[np.maximum(edge, 0)]
+        return (edge[:, None] < 0) | (succ < 0) | ~graph.closed[np.maximum(succ, 0)]
+
+    def _choose_turns(self, mask):
+        """Draw a valid turn at next_k for the vehicles in mask."""
+        idx = np.nonzero(mask)[0]
+        if not len(idx):
+            return
+        r = self.rng.random(len(idx))
+        wanted = np.where(r < TURN_WEIGHTS[0], STRAIGHT,
+                          np.where(r < TURN_WEIGHTS[0] + TURN_WEIGHTS[1], LEFT, RIGHT)).astype(np.int8)
+        valid = np.column_stack(self._valid_turns(idx))
+        usable = valid & self._open_exits(idx)
+        # Avoid closed exits unless (at a dead end) there is nothing else.
+        can_straight, can_left, can_right = np.where(usable.any(axis=1)[:, None], usable, valid).T
+        ok = np.where(wanted == STRAIGHT, can_straight, np.where(wanted == LEFT, can_left, can_right))
+        fallback = np.where(can_straight, STRAIGHT, np.where(can_right, RIGHT, LEFT)).astype(np.int8)
+        self.turn[idx] = np.where(ok, wanted, fallback)
+
+        if self.router is not None:
+            # Follow the next-hop table; pick a new destination on arrival.
+            graph = self.router.graph
+            edge = graph.edge_ending_at(self.axis[idx], self.dir[idx], self.line[idx], self.next_k[idx])
+            on_graph = edge >= 0
+            node = graph.edge_to[np.maximum(edge, 0)]
+            arrived = on_graph & (node == self.destination[idx])
+            self.destination[idx[arrived]] = (node[arrived] + 1 + self.rng.integers(
+                graph.n_nodes - 1, size=int(arrived.sum()))) % graph.n_nodes
+            routed = self.router.next_turn(self.destination[idx], np.maximum(edge, 0))
+            use = on_graph & (routed >= 0)
+            self.turn[idx[use]] = routed[use]
+
+    def _reroute(self, mask, node_s):
+        """
+        Give the vehicles in mask a different valid exit at next_k, one whose
+        turning point is still ahead of them and that is not closed; vehicles
+        without one keep theirs.
+        """
+        idx = np.nonzero(mask)[0]
+        if not len(idx):
+            return
+        ahead = [(self._turn_point(np.full(len(self.s), turn, dtype=np.int8), node_s)[idx]
+                  - self.s[idx]) * self.dir[idx] > 0 for turn in (STRAIGHT, LEFT, RIGHT)]
+        ok = np.column_stack(self._valid_turns(idx)) & np.column_stack(ahead) & self._open_exits(idx)
+        ok[np.arange(len(idx)), self.turn[idx]] = False
+        pick = np.argmax(ok * self.rng.random(ok.shape), axis=1)
+        found = ok.any(axis=1)
+        self.turn[idx[found]] = pick[found]
+        self.wait[idx] = 0.0
+
+    def _unjam(self, mask):
+        """Move the vehicles in mask to random spawn slots with no vehicle close by."""
+        idx = np.nonzero(mask)[0]
+        n, slots = len(self.s), self._slots
+        span = 4.0 * (self.grid + 1) * self.spacing + 1000.0
+        lane = (self.axis.astype(np.int64) * (self.grid + 1) + self.line) * 2 + (self.dir > 0)
+        keys = np.sort(lane * span + self.s * self.dir)
+        slot_lane = ((slots[:, 0].astype(np.int64) * (self.grid + 1) + slots[:, 2].astype(np.int64)) * 2
+                     + (slots[:, 1] > 0))
+        slot_keys = slot_lane * span + slots[:, 3] * slots[:, 1]
+        pos = np.searchsorted(keys, slot_keys)
+        room = VEHICLE_LENGTH + IDM_GAP
+        free = (((pos >= n) | (keys[np.minimum(pos, n - 1)] - slot_keys > room))
+                & ((pos == 0) | (slot_keys - keys[np.maximum(pos - 1, 0)] > room)))
+        free = np.nonzero(free & self._open_slots())[0]
+        m = min(len(idx), len(free))
+        if not m:
+            return
+        idx = idx[:m]
+        self._place(idx, slots[self.rng.choice(free, m, replace=False)])
+        self.v[idx] = 0.0
+        chosen = np.zeros(n, dtype=bool)
+        chosen[idx] = True
+        self._choose_turns(chosen)
+
+    def _player_box(self, player):
+        """Player centre (x, z) and the half extents of its bounds along x and z."""
+        hx, hz = self.player_half_size
+        rot = radians(player.rotation_y)
+        along_x = hz * abs(sin(rot)) + hx * abs(cos(rot))
+        along_z = hz * abs(cos(rot)) + hx * abs(sin(rot))
+        return player.x, player.z, along_x, along_z
+
+    # -- stepping ------------------------------------------------------
+
+    def step(self, dt, player=None):
+        """
+        Advance the fleet by dt seconds.
+        player: optional CarState the NPCs must not drive into.
+        """
+        n = len(self.s)
+        if not n:
+            return
+        jammed = self.wait > JAM_TIMEOUT
+        if jammed.any():
+            self._unjam(jammed)
+        self.previous_x, self.previous_z = self.x, self.z
+        s, d, v = self.s, self.dir, self.v
+
+        # Leader in the same lane: sort by lane, then by distance travelled.
+        lane = (self.axis.astype(np.int64) * (self.grid + 1) + self.line) * 2 + (d > 0)
+        order = np.lexsort((s * d, lane))
+        gap = np.full(n, np.inf)
+        lead_v = np.zeros(n)
+        same = lane[order[1:]] == lane[order[:-1]]
+        follower, leader = order[:-1][same], order[1:][same]
+        gap[follower] = (s[leader] - s[follower]) * d[follower] - VEHICLE_LENGTH
+        lead_v[follower] = v[leader]
+
+        # The player car, wherever its footprint reaches into the lane ahead.
+        if player is not None:
+            px, pz, ex, ez = self._player_box(player)
+            player_v = abs(player.speed) * self.player_speed_scale
+            along = np.where(self.axis == 0, px, pz)
+            reach = np.where(self.axis == 0, ex, ez)
+            side = np.abs(np.where(self.axis == 0, pz, px) - self.lat)
+            side_reach = np.where(self.axis == 0, ez, ex)
+            ahead = (along - s) * d
+            in_lane = (side < side_reach + VEHICLE_WIDTH * 0.5) & (ahead > 0)
+            player_gap = ahead - reach - VEHICLE_LENGTH * 0.5
+            use_player = in_lane & (player_gap < gap)
+            gap = np.where(use_player, player_gap, gap)
+            lead_v = np.where(use_player, player_v, lead_v)
+
+        # Stop line at the next intersection: red / amber lights and all-way stops.
+        k = self.next_k
+        node_s = self.offset + k * self.spacing
+        line_gap = (node_s - d * self.stop_back - s) * d
+        on_grid = (k >= 0) & (k <= self.grid)
+        kc = np.clip(k, 0, self.grid)
+        ni = np.where(self.axis == 0, kc, self.line)
+        nj = np.where(self.axis == 0, self.line, kc)
+        node_id = ni * (self.grid + 1) + nj
+        approach = self.axis.astype(np.int64) * 2 + (d > 0)
+        light = self.node_light[ni, nj, approach]
+        held = np.zeros(n, dtype=bool)
+        has_light = on_grid & (light >= 0)
+        if has_light.any():
+            color = np.full(n, -1, dtype=np.int64)
+            color[has_light] = self.signals.colors(light[has_light])
+            can_stop = line_gap > v * v / (2 * IDM_BRAKE)
+            held |= (color == RED) | ((color == AMBER) & can_stop)
+        stop_here = on_grid & self.node_stop[ni, nj] & (self.cleared != node_id)
+        waiting = stop_here & (line_gap < 2.0) & (v < 0.2)
+        self.stop_timer = np.where(waiting, self.stop_timer + dt, 0.0)
+        done = waiting & (self.stop_timer >= STOP_DWELL)
+        self.cleared = np.where(done, node_id, self.cleared)
+        held |= stop_here & ~done
+
+        # Stuck at the head of the queue with no light or sign to wait for:
+        # the way on is blocked, so take another exit.
+        stuck = (self.wait > PATIENCE) & on_grid & (line_gap < 3.0) & ~held
+        if stuck.any():
+            self._reroute(stuck, node_s)
+
+        # Don't block the box: going straight, wait at the line while what
+        # we follow is stopped less than a car's length past the junction.
+        turning = self.turn != STRAIGHT
+        exit_room = line_gap + 2 * self.stop_back + VEHICLE_LENGTH + IDM_GAP
+        box_full = ~turning & (gap > line_gap) & (gap < exit_room) & (lead_v < 0.5)
+        blocked = (held | box_full) & (line_gap > -0.5)     # already over the line: keep going
+        use_line = blocked & (line_gap < gap)
+        gap = np.where(use_line, line_gap, gap)
+        lead_v = np.where(use_line, 0.0, lead_v)
+
+        # Turning vehicles wait short of the point where they join the new
+        # lane until it has room: nothing occupying the merge point and no
+        # vehicle behind it that could not stop comfortably (vehicles that
+        # turn off at this junction themselves do not count). Only the
+        # nearest free vehicle may join a given lane at a junction per step.
+        new_dir = self._turn_dir(self.turn)
+        turn_lat = self._turn_point(self.turn, node_s)
+        near = turning & on_grid & (line_gap < 3.0)
+        if near.any():
+            span = 4.0 * (self.grid + 1) * self.spacing + 1000.0
+            keys = (lane * span + s * d)[order]
+            mi = np.nonzero(near)[0]
+            new_axis = 1 - self.axis[mi].astype(np.int64)
+            target_lane = (new_axis * (self.grid + 1) + k[mi]) * 2 + (new_dir[mi] > 0)
+            merge = target_lane * span + self.lat[mi] * new_dir[mi]
+            pos = np.searchsorted(keys, merge)
+            behind = order[np.maximum(pos - 1, 0)]
+            behind_gap = merge - keys[np.maximum(pos - 1, 0)]
+            clearance = VEHICLE_LENGTH + v[behind] * v[behind] / (2 * IDM_BRAKE)
+            leaving = turning[behind] & (self.next_k[behind] == self.line[mi])   # turns off before us
+            behind_ok = (pos == 0) | (behind_gap > span * 0.5) | (behind_gap > clearance) | leaving
+            ahead_gap = keys[np.minimum(pos, n - 1)] - merge
+            ahead_ok = (pos >= n) | (ahead_gap > VEHICLE_LENGTH) | (ahead_gap < 0)
+            to_merge = (turn_lat[mi] - s[mi]) * d[mi]
+            path_clear = gap[mi] >= to_merge - VEHICLE_LENGTH * 0.5     # no leader or stop line first
+            player_ok = True
+            if player is not None:
+                # The player in the target lane, near the merge point or closing on it.
+                p_along = np.where(new_axis == 0, px, pz)
+                p_reach = np.where(new_axis == 0, ex, ez)
+                p_side = np.abs(np.where(new_axis == 0, pz, px) - turn_lat[mi])
+                p_side_reach = np.where(new_axis == 0, ez, ex)
+                rel = (p_along - self.lat[mi]) * new_dir[mi]
+                room = p_reach + VEHICLE_LENGTH
+                player_ok = ((p_side >= p_side_reach + VEHICLE_WIDTH * 0.5) | (rel > room)
+                             | (rel < -(room + player_v * player_v / (2 * IDM_BRAKE))))
+            ok = np.nonzero(behind_ok & ahead_ok & path_clear & player_ok)[0]
+            slot = target_lane[ok] * (self.grid + 1) + self.line[mi][ok]   # target lane at this junction
+            by_slot = np.lexsort((to_merge[ok], slot))      # nearest vehicle first per slot
+            go = np.zeros(len(mi), dtype=bool)
+            go[ok[by_slot[np.unique(slot[by_slot], return_index=True)[1]]]] = True
+            wait = mi[~go]
+            merge_gap = (turn_lat[wait] - s[wait]) * d[wait] - VEHICLE_LENGTH * 0.5
+            closer = merge_gap < gap[wait]
+            gap[wait[closer]] = merge_gap[closer]
+            lead_v[wait[closer]] = 0.0
+
+            # Courtesy: once a turning vehicle has stood at its merge point for
+            # COURTESY seconds, the vehicle coming up behind that point holds
+            # back a car's length short of it (if it can stop comfortably), so
+            # a gap opens even in a slow, dense queue.
+            ask = (~go & path_clear & (self.wait[mi] > COURTESY) & (pos > 0)
+                   & (behind_gap < span * 0.5) & ~leaving)
+            if ask.any():
+                yielder = behind[ask]
+                yield_gap = behind_gap[ask] - VEHICLE_LENGTH
+                can = yield_gap > v[yielder] * v[yielder] / (2 * IDM_BRAKE)
+                yielder, yield_gap = yielder[can], yield_gap[can]
+                np.minimum.at(gap, yielder, yield_gap)
+                lead_v[yielder] = np.where(gap[yielder] == yield_gap, 0.0, lead_v[yielder])
+
+        # Intelligent Driver Model.
+        gap = np.maximum(gap, 0.1)
+        desired = IDM_GAP + v * IDM_HEADWAY + v * (v - lead_v) / (2 * np.sqrt(IDM_ACCEL * IDM_BRAKE))
+        accel = IDM_ACCEL * (1 - (v / self.desired_speed) ** 4 - (np.maximum(desired, 0) / gap) ** 2)
+        v = np.maximum(v + accel * dt, 0.0)
+        self.v = v
+        self.wait = np.where(v < 0.1, self.wait + dt, 0.0)
+        self.s = s = s + d * v * dt
+
+        # Intersections: straight on passes the node centre, turns switch
+        # lanes where the two lane centres cross.
+        target = np.where(turning, turn_lat, node_s)
+        passed = ((s - target) * d >= 0) & on_grid
+        if not passed.any():
+            self.time += dt
+            return
+
+        straight = passed & ~turning
+        self.next_k = np.where(straight, k + d.astype(np.int64), k)
+
+        turned = passed & turning
+        if turned.any():
+            overshoot = (s - target) * d
+            old_line, old_lat = self.line, self.lat
+            self.s = np.where(turned, old_lat + new_dir * overshoot, self.s)
+            self.lat = np.where(turned, target, self.lat)
+            self.line = np.where(turned, k, old_line)
+            self.next_k = np.where(turned, old_line + new_dir.astype(np.int64), self.next_k)
+            self.axis = np.where(turned, 1 - self.axis, self.axis).astype(np.int8)
+            self.dir = np.where(turned, new_dir, d)
+        self.cleared = np.where(passed, -1, self.cleared)
+        self._choose_turns(passed)
+        self.time += dt
+
+    # -- queries -------------------------------------------------------
+
+    def nearest(self, x, z, count):
+        """Indices of up to count vehicles closest to (x, z), e.g. the ones worth drawing."""
+        d2 = (self.x - x) ** 2 + (self.z - z) ** 2
+        if count >= len(d2):
+            return np.arange(len(d2))
+        return np.argpartition(d2, count)[:count]
+
+
+class TrafficRenderer:
+    """
+    Draws the vehicles nearest to the camera with Entities from an
+    EntityPool (see city_streaming); the pool never grows past max_drawn.
+    A vehicle keeps its Entity (and so its colour) for as long as it stays
+    in the drawn set; Entities are only acquired or released as vehicles
+    enter or leave it.
+    """
+    def __init__(self, fleet, pool, max_drawn=300):
+        self.fleet = fleet
+        self.pool = pool
+        self.max_drawn = max_drawn
+        self._drawn = {}    # vehicle index -> Entity
+
+    def sync(self, camera_x, camera_z, alpha=1.0):
+        fleet, drawn = self.fleet, self._drawn
+        nearest = set(fleet.nearest(camera_x, camera_z, self.max_drawn).tolist())
+        for i in [i for i in drawn if i not in nearest]:
+            self.pool.release(drawn.pop(i))
+        for i in sorted(nearest.difference(drawn)):
+            drawn[i] = self.pool.acquire()
+        if not drawn:
+            return
+
+        idx = np.fromiter(drawn, dtype=np.int64, count=len(drawn))
+        x = fleet.previous_x[idx] + (fleet.x[idx] - fleet.previous_x[idx]) * alpha
+        z = fleet.previous_z[idx] + (fleet.z[idx] - fleet.previous_z[idx]) * alpha
+        rot = fleet.rotation_y[idx]
+        for e, px, pz, ry in zip(drawn.values(), x.tolist(), z.tolist(), rot.tolist()):
+            e.position = (px, e.y, pz)
+            e.rotation_y = ry
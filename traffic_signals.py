@@ -0,0 +1,201 @@
+# traffic_signals.py - Centralized phase scheduler for every traffic light
+
+"""
+SignalController owns the timing of all intersections in flat NumPy arrays
+instead of one timer per TrafficLight Entity.
+
+Each intersection runs a PhasePlan: a cycle of (duration, colours) phases
+where colours gives the state of every signal group at that intersection
+(e.g. group 0 = east/west, group 1 = north/south). Plans may include amber
+and all-red clearance phases, and each intersection has a start offset so
+consecutive junctions can form a green wave.
+
+Phase changes are rare compared to frames, so step() only accumulates dt
+until the next scheduled change and then advances every intersection with
+one vectorized update. is_red()/color() are plain array reads, and lights
+whose colour actually changed are queued for the view in pop_changes().
+"""
+
+import numpy as np
+
+RED, AMBER, GREEN = 0, 1, 2
+COLOR_NAMES = ('red', 'amber', 'green')
+
+
+class PhasePlan:
+    """
+    A signal cycle: a list of (duration_seconds, colours) phases where
+    colours is a tuple with one entry per signal group.
+    """
+    def __init__(self, phases):
+        if not phases:
+            raise ValueError("A phase plan needs at least one phase")
+        groups = {len(colors) for _, colors in phases}
+        if len(groups) != 1:
+            raise ValueError("Every phase must give a colour for each signal group")
+        if any(duration <= 0 for duration, _ in phases):
+            raise ValueError("Phase durations must be positive")
+        self.phases = [(float(d), tuple(c)) for d, c in phases]
+        self.groups = groups.pop()
+
+    @property
+    def cycle(self):
+        return sum(d for d, _ in self.phases)
+
+    @classmethod
+    def two_phase(cls, green):
+        """Classic toggle: group 0 green then group 1 green, no clearance."""
+        return cls([(green, (GREEN, RED)), (green, (RED, GREEN))])
+
+    @classmethod
+    def standard(cls, green, amber=3, all_red=1):
+        """Two groups with amber and all-red clearance between greens."""
+        return cls([
+            (green, (GREEN, RED)), (amber, (AMBER, RED)), (all_red, (RED, RED)),
+            (green, (RED, GREEN)), (amber, (RED, AMBER)), (all_red, (RED, RED)),
+        ])
+
+
+class SignalController:
+    """
+    Phase state for all intersections and lights.
+
+    add_intersection(plan, offset) -> intersection id
+    add_light(intersection, group) -> light id
+    """
+    def __init__(self):
+        self._plans = []
+        self._offsets = []
+        self._light_intersection = []
+        self._light_group = []
+        self._built = False
+        self._changed = set()
+
+    def add_intersection(self, plan, offset=0.0):
+        self._plans.append(plan)
+        self._offsets.append(float(offset))
+        self._built = False
+        return len(self._plans) - 1
+
+    def add_light(self, intersection, group):
+        plan = self._plans[intersection]
+        if not 0 <= group < plan.groups:
+            raise ValueError(f"Intersection {intersection} has no signal group {group}")
+        self._light_intersection.append(intersection)
+        self._light_group.append(group)
+        self._built = False
+        return len(self._light_group) - 1
+
+    def __len__(self):
+        return len(self._light_group)
+
+    # -- array construction --------------------------------------------
+
+    def _build(self):
+        n = len(self._plans)
+        max_phases = max((len(p.phases) for p in self._plans), default=1)
+        max_groups = max((p.groups for p in self._plans), default=1)
+
+        self.phase_ends = np.full((n, max_phases), np.inf)
+        self.phase_colors = np.full((n, max_phases, max_groups), RED, dtype=np.int8)
+        self.cycle = np.zeros(n)
+        for i, plan in enumerate(self._plans):
+            self.phase_ends[i, :len(plan.phases)] = np.cumsum([d for d, _ in plan.phases])
+            for k, (_, colors) in enumerate(plan.phases):
+                self.phase_colors[i, k, :len(colors)] = colors
+            self.cycle[i] = plan.cycle
+
+        self.clock = np.mod(np.array(self._offsets, dtype=np.float64), np.maximum(self.cycle, 1e-9))
+        self.phase = self._phase_at(self.clock)
+        self.light_intersection = np.array(self._light_intersection, dtype=np.int64)
+        self.light_group = np.array(self._light_group, dtype=np.int64)
+        self.light_color = self._light_colors()
+        self._light_color_list = self.light_color.tolist()
+        self._pending = 0.0
+        self._until_change = self._next_change()
+        self._changed = set(range(len(self._light_group)))
+        self._built = True
+
+    def _phase_at(self, clock):
+        return (clock[:, None] >= self.phase_ends).sum(axis=1)
+
+    def _light_colors(self):
+        li = self.light_intersection
+        return self.phase_colors[li, self.phase[li], self.light_group]
+
+    def _next_change(self):
+        if not len(self.clock):
+            return np.inf
+        ends = self.phase_ends[np.arange(len(self.clock)), self.phase]
+        return float((ends - self.clock).min())
+
+    # -- stepping ------------------------------------------------------
+
+    def step(self, dt):
+        """Advance every intersection by dt seconds; return True if any light changed."""
+        if not self._built:
+            self._build()
+        self._pending += dt
+        if self._pending < self._until_change:
+            return False
+        return self._advance()
+
+    def _advance(self):
+        self.clock = np.mod(self.clock + self._pending, self.cycle)
+        self._pending = 0.0
+        self.phase = self._phase_at(self.clock)
+        colors = self._light_colors()
+        changed = np.nonzero(colors != self.light_color)[0]
+        self.light_color = colors
+        self._light_color_list = colors.tolist()
+        self._changed.update(changed.tolist())
+        self._until_change = self._next_change()
+        return len(changed) > 0
+
+    # -- snapshots -----------------------------------------------------
+
+    def snapshot(self):
+        """Phase state as plain data (for replay keyframes)."""
+        if not self._built:
+            self._build()
+        return {'clock': self.clock.copy(), 'pending': self._pending, 'changed': sorted(self._changed)}
+
+    def restore(self, state):
+        if not self._built:
+            self._build()
+        self.clock = state['clock'].copy()
+        self.phase = self._phase_at(self.clock)
+        self.light_color = self._light_colors()
+        self._light_color_list = self.light_color.tolist()
+        self._pending = state['pending']
+        self._until_change = self._next_change()
+        self._changed = set(state['changed'])
+
+    def pop_changes(self):
+        """Light ids whose colour changed since the last call (all lights initially)."""
+        if not self._built:
+            self._build()
+        changed, self._changed = self._changed, set()
+        return sorted(changed)
+
+    # -- queries -------------------------------------------------------
+
+    def color(self, light):
+        if not self._built:
+            self._build()
+        return self._light_color_list[light]
+
+    def is_red(self, light):
+        return self.color(light) == RED
+
+    def colors(self, lights):
+        """Colours of an array of light ids at once (for vectorized callers)."""
+        if not self._built:
+            self._build()
+        return self.light_color[lights]
+
+    def phase_time(self, intersection):
+        """Seconds elapsed in the intersection's cycle."""
+        if not self._built:
+            self._build()
+        return float((self.clock[intersection] + self._pending) % self.cycle[intersection])
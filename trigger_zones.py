@@ -0,0 +1,141 @@
+# trigger_zones.py - Spatially indexed rule zones with enter/stay/exit events
+
+"""
+Rule zones (speed-limit signs, stop signs, traffic lights) are registered
+in a uniform grid keyed by road cell. Each tick a ZoneTracker only tests
+the zones registered in the car's cell, so the cost depends on how many
+zones are nearby, not on how many exist in the city.
+
+A zone is a sphere around its sign plus optional direction constraints:
+
+  view_cone        the zone must lie in front of the car, within this
+                   half-angle (degrees) of its heading (traffic lights)
+  approach_heading the car's own heading must be within approach_tolerance
+                   degrees of this value (one-way or lane-specific rules)
+"""
+
+from math import atan2, degrees, sqrt, floor
+
+ENTER, STAY, EXIT = 'enter', 'stay', 'exit'
+
+
+class TriggerZone:
+    """One rule zone. target is whatever the rule needs (e.g. a light index)."""
+    __slots__ = ('zone_id', 'kind', 'position', 'radius', 'view_cone',
+                 'approach_heading', 'approach_tolerance', 'target')
+
+    def __init__(self, kind, position, radius, view_cone=None,
+                 approach_heading=None, approach_tolerance=45, target=None):
+        self.zone_id = -1
+        self.kind = kind
+        self.position = (position[0], position[1], position[2])
+        self.radius = radius
+        self.view_cone = view_cone
+        self.approach_heading = approach_heading
+        self.approach_tolerance = approach_tolerance
+        self.target = target
+
+    def contains(self, x, y, z, fx, fz, heading):
+        """True if a car at (x, y, z) with unit heading (fx, fz) is inside the zone."""
+        dx = self.position[0] - x
+        dy = self.position[1] - y
+        dz = self.position[2] - z
+        if sqrt(dx * dx + dy * dy + dz * dz) >= self.radius:
+            return False
+
+        if self.view_cone is not None:
+            ahead = fx * dx + fz * dz
+            if ahead <= 0:
+                return False
+            if degrees(atan2(abs(fz * dx - fx * dz), ahead)) >= self.view_cone:
+                return False
+
+        if self.approach_heading is not None:
+            diff = (heading - self.approach_heading + 180) % 360 - 180
+            if abs(diff) > self.approach_tolerance:
+                return False
+        return True
+
+
+class ZoneIndex:
+    """Uniform grid of zones; each cell lists every zone whose radius reaches it."""
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.zones = {}
+        self._cells = {}
+        self._next_id = 0
+
+    def _cells_for(self, zone):
+        cs = self.cell_size
+        x, _, z = zone.position
+        r = zone.radius
+        for i in range(int(floor((x - r) / cs)), int(floor((x + r) / cs)) + 1):
+            for j in range(int(floor((z - r) / cs)), int(floor((z + r) / cs)) + 1):
+                yield (i, j)
+
+    def add(self, zone):
+        zone.zone_id = self._next_id
+        self._next_id += 1
+        self.zones[zone.zone_id] = zone
+        for key in self._cells_for(zone):
+            self._cells[key] = self._cells.get(key, ()) + (zone,)
+        return zone
+
+    def remove(self, zone):
+        """Unregister a zone (e.g. when its map chunk is unloaded)."""
+        if self.zones.pop(zone.zone_id, None) is None:
+            return
+        for key in self._cells_for(zone):
+            rest = tuple(z for z in self._cells.get(key, ()) if z is not zone)
+            if rest:
+                self._cells[key] = rest
+            else:
+                self._cells.pop(key, None)
+
+    def nearby(self, x, z):
+        """Zones registered in the cell containing (x, z), in zone_id order."""
+        cs = self.cell_size
+        return self._cells.get((int(floor(x / cs)), int(floor(z / cs))), ())
+
+    def __len__(self):
+        return len(self.zones)
+
+
+class ZoneTracker:
+    """
+    Tracks which zones one car is inside and reports transitions.
+    active holds the current zones in zone_id order.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.active = ()
+
+    def reset(self):
+        self.active = ()
+
+    def snapshot(self):
+        return [zone.zone_id for zone in self.active]
+
+    def restore(self, zone_ids):
+        self.active = tuple(self.index.zones[i] for i in zone_ids)
+
+    def update(self, x, y, z, fx, fz, heading):
+        """Re-test nearby zones; return [(event, zone)] for this tick."""
+        inside = tuple(zone for zone in self.index.nearby(x, z)
+                       if zone.contains(x, y, z, fx, fz, heading))
+        events = []
+        previous = self.active
+        for zone in inside:
+            events.append((STAY if zone in previous else ENTER, zone))
+        for zone in previous:
+            if zone not in inside:
+                events.append((EXIT, zone))
+        self.active = inside
+        return events
+
+    def first(self, kind):
+        """The lowest-id active zone of the given kind, or None."""
+        for zone in self.active:
+            if zone.kind == kind:
+                return zone
+        return None
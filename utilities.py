@@ -1,7 +1,11 @@
 # utilities.py - Utility functions for the driving simulation
 
+from road_index import DrivableAreaIndex
+
 def is_on_road(pos, roads):
     """Return True if pos lies on any road or arc."""
+    if isinstance(roads, DrivableAreaIndex):
+        return roads.contains(pos.x, pos.z)
     for r in roads:
         if r.contains_point(pos):
             return True
@@ -14,6 +18,9 @@ def create_city(roads, constants):
     Args:
         roads: List to append road segments to
         constants: Module containing city constants
+
+    Returns:
+        A DrivableAreaIndex over the roads (iterates like the road list)
     """
     from buildings import Building
     from roads import RoadSegment
@@ -53,4 +60,5 @@ def create_city(roads, constants):
             bz = OFFSET + j*CELL_SPACING + (CELL_SPACING*0.5)
             Building(position=(bx, bz))
             
-    return roads
\ No newline at end of file
+    # 4) Precompute the drivable area so is_on_road is O(1)
+    return DrivableAreaIndex(roads)
\ No newline at end of file
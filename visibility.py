@@ -0,0 +1,163 @@
+# visibility.py - Distance/behind-camera culling and impostor LOD for city props
+
+"""
+Every frame the chase camera only sees a small part of the city, yet every
+Building, sign and traffic light is drawn at full detail. VisibilityManager
+keeps each registered object in one of three states:
+
+  FULL      within lod_radius of the camera and not behind it
+  IMPOSTOR  between lod_radius and view_radius: the detailed Entities are
+            disabled and a cheap stand-in (e.g. one box per building) is shown
+  HIDDEN    beyond view_radius, or entirely behind the camera plane
+
+Objects are registered in a uniform grid, so update() only looks at the
+cells within view_radius of the camera plus the objects that were visible
+last frame; its cost follows what is near the camera, not the city size.
+Entities are only touched when their state changes, and a hysteresis band
+stops objects on a boundary from flickering between states.
+"""
+
+from math import floor, sqrt
+
+HIDDEN, IMPOSTOR, FULL = 0, 1, 2
+
+
+class Visible:
+    """One culled object: detailed Entities, optional impostors and a bounding circle."""
+    __slots__ = ('entities', 'impostors', 'x', 'z', 'radius', 'state')
+
+    def __init__(self, entities, impostors, x, z, radius):
+        self.entities = tuple(entities)
+        self.impostors = tuple(impostors)
+        self.x = x
+        self.z = z
+        self.radius = radius
+        self.state = FULL
+
+    def _set(self, state):
+        if state == self.state:
+            return
+        for e in self.entities:
+            e.enabled = state == FULL
+        for e in self.impostors:
+            e.enabled = state == IMPOSTOR
+        self.state = state
+
+
+class VisibilityManager:
+    """
+    cell_size: grid cell size of the spatial index (world units)
+    view_radius: objects further than this from the camera are hidden
+    lod_radius: objects further than this use their impostor (if any)
+    hysteresis: distance band an object must cross before switching back
+    """
+    def __init__(self, cell_size=40, view_radius=150, lod_radius=70, hysteresis=5):
+        self.cell_size = cell_size
+        self.view_radius = view_radius
+        self.lod_radius = lod_radius
+        self.hysteresis = hysteresis
+        self.items = []
+        self._cells = {}
+        self._shown = set()     # items not HIDDEN after the last update
+        self._last = None       # (x, z, fx, fz) of the last full update
+
+    # -- registration --------------------------------------------------
+
+    def add(self, entities, impostors=(), center=None, radius=1.0):
+        """
+        Register an Entity (or list of Entities sharing one bounding circle).
+        center defaults to the first Entity's world position.
+        """
+        if not isinstance(entities, (list, tuple)):
+            entities = (entities,)
+        if not isinstance(impostors, (list, tuple)):
+            impostors = (impostors,)
+        if center is None:
+            p = entities[0].world_position
+            center = (p.x, p.z)
+        item = Visible(entities, impostors, center[0], center[1], radius)
+        for e in item.impostors:
+            e.enabled = False
+
+        cs = self.cell_size
+        for i in range(int(floor((item.x - radius) / cs)), int(floor((item.x + radius) / cs)) + 1):
+            for j in range(int(floor((item.z - radius) / cs)), int(floor((item.z + radius) / cs)) + 1):
+                self._cells.setdefault((i, j), []).append(item)
+        self.items.append(item)
+        self._shown.add(item)
+        self._last = None
+        return item
+
+    def add_batches(self, batcher, impostors=None):
+        """
+        Register the tiled batches of a built StaticBatcher, one object per
+        tile. impostors is an optional second StaticBatcher with the same
+        tile_size whose batches stand in for the first one's when far away.
+        """
+        tiles = {}
+        for (key, tile), batch in batcher.batches.items():
+            lo, hi = batcher.bounds[(key, tile)]
+            entry = tiles.setdefault(tile, [[], [], list(lo), list(hi)])
+            entry[0].append(batch)
+            entry[2] = [min(a, b) for a, b in zip(entry[2], lo)]
+            entry[3] = [max(a, b) for a, b in zip(entry[3], hi)]
+        if impostors is not None:
+            for (key, tile), batch in impostors.batches.items():
+                if tile in tiles:
+                    tiles[tile][1].append(batch)
+
+        for tile, (full, stand_ins, lo, hi) in tiles.items():
+            center = ((lo[0] + hi[0]) * 0.5, (lo[2] + hi[2]) * 0.5)
+            radius = 0.5 * sqrt((hi[0] - lo[0]) ** 2 + (hi[2] - lo[2]) ** 2)
+            self.add(full, stand_ins, center, radius)
+
+    # -- per-frame -----------------------------------------------------
+
+    def nearby(self, x, z, radius):
+        """Registered objects whose grid cells overlap a circle around (x, z)."""
+        cs = self.cell_size
+        found = set()
+        for i in range(int(floor((x - radius) / cs)), int(floor((x + radius) / cs)) + 1):
+            for j in range(int(floor((z - radius) / cs)), int(floor((z + radius) / cs)) + 1):
+                found.update(self._cells.get((i, j), ()))
+        return found
+
+    def update(self, x, z, fx, fz, min_move=0.5, min_turn=0.9995):
+        """
+        Re-classify objects for a camera at (x, z) looking along (fx, fz).
+        Skipped while the camera has moved less than min_move and turned
+        less than acos(min_turn) since the last full update.
+        """
+        norm = sqrt(fx * fx + fz * fz) or 1.0
+        fx, fz = fx / norm, fz / norm
+        if self._last is not None:
+            lx, lz, lfx, lfz = self._last
+            if (x - lx) ** 2 + (z - lz) ** 2 < min_move * min_move and fx * lfx + fz * lfz > min_turn:
+                return
+        self._last = (x, z, fx, fz)
+
+        view, lod, band = self.view_radius, self.lod_radius, self.hysteresis
+        shown = set()
+        for item in self.nearby(x, z, view + band) | self._shown:
+            dx, dz = item.x - x, item.z - z
+            dist = sqrt(dx * dx + dz * dz) - item.radius
+            lod_edge = lod + band if item.state == FULL else lod - band if item.state == IMPOSTOR else lod
+            if dx * fx + dz * fz < -item.radius:
+                state = HIDDEN
+            elif dist > view + (band if item.state != HIDDEN else 0):
+                state = HIDDEN
+            elif dist > lod_edge and item.impostors:
+                state = IMPOSTOR
+            else:
+                state = FULL
+            item._set(state)
+            if state != HIDDEN:
+                shown.add(item)
+        self._shown = shown
+
+    def counts(self):
+        """Number of objects in each state, for the debug overlay or benchmarks."""
+        result = {HIDDEN: 0, IMPOSTOR: 0, FULL: 0}
+        for item in self.items:
+            result[item.state] += 1
+        return result